@@ -0,0 +1,245 @@
+import os
+import sys
+import csv
+import json
+import time
+import queue
+import signal
+import multiprocessing as mp
+import clustering
+import ollama_client
+import results_store
+import tuner
+
+# Classifies the whole raw archive instead of the newest N. Emails are split into shards
+# by seq_id and each shard runs in its own worker process with the tuner's usual
+# rules -> kNN -> LLM pipeline. Every result row is appended to the shard's CSV as it
+# arrives (fsync'd once per chunk), so after a crash or Ctrl-C a rerun skips whatever is
+# already settled. When all shards finish, the rows are merged into one tuning_*.csv
+# in TUNING_RESULTS_DIR, ready for processor.
+JOB_DIR = os.environ.get('ARCHIVE_JOB_DIR', './archive_jobs')
+SHARDS = int(os.environ.get('ARCHIVE_SHARDS', '4'))
+# Emails per checkpoint within a shard (also the window the clustering stage sees)
+CHUNK_SIZE = int(os.environ.get('ARCHIVE_CHUNK_SIZE', '200'))
+PROGRESS_SEC = 1.0
+SETTLED = ('[DELETE]', '[ KEEP ]')
+
+
+def job_dir(name: str) -> str:
+    return os.path.join(JOB_DIR, name)
+
+
+def _shard_paths(directory: str) -> list:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory)
+                  if f.startswith('shard_') and f.endswith('.csv'))
+
+
+def _read_meta(directory: str) -> dict:
+    path = os.path.join(directory, 'job.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_meta(directory: str, meta: dict):
+    path = os.path.join(directory, 'job.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def _recover(path: str) -> set:
+    """Seq_ids already settled in a shard CSV. A row cut short by a crash is dropped first."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if data and not data.endswith(b'\n'):
+        with open(path, 'r+b') as f:
+            f.truncate(data.rfind(b'\n') + 1)
+    done = set()
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            seq_id = (row.get('seq_id') or '').strip()
+            # [ERROR ] rows are not done: they are retried on the next run
+            if row.get('status') in SETTLED and seq_id.isdigit():
+                done.add(int(seq_id))
+    return done
+
+
+def _run_shard(shard: int, storage_dir: str, directory: str, files: list, workers: int, batch_size: int,
+               progress):
+    """Worker process: classifies `files` chunk by chunk, appending rows to this shard's CSV."""
+    # Ctrl-C is handled by the parent, which stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    path = os.path.join(directory, f"shard_{shard:02d}.csv")
+    fresh = not os.path.exists(path) or os.path.getsize(path) == 0
+    reviews = tuner._clustered_reviews if clustering.CLUSTER_ENABLED else tuner._iter_reviews
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if fresh:
+            writer.writerow(tuner.CSV_FIELDS)
+        for i in range(0, len(files), CHUNK_SIZE):
+            chunk = files[i:i + CHUNK_SIZE]
+            for row in reviews(storage_dir, chunk, workers, batch_size, tuner._prepare(storage_dir, chunk)):
+                writer.writerow(tuner._csv_row(row))
+                f.flush()
+                progress.put((shard, row['status']))
+            os.fsync(f.fileno())
+
+
+def _eta(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def _print_progress(counts: dict, total: int, started: float):
+    elapsed = time.time() - started
+    rate = counts['done'] / elapsed if elapsed > 0 else 0.0
+    eta = _eta((total - counts['done']) / rate) if rate > 0 else '--:--:--'
+    pct = 100 * counts['done'] / total if total else 100.0
+    print(f"\r[Archive] {counts['done']}/{total} ({pct:.1f}%) | {rate:.1f} emails/s | ETA {eta} | "
+          f"delete {counts['delete']} keep {counts['keep']} errors {counts['errors']}   ", end='', flush=True)
+
+
+def merge(name: str = 'archive', results_dir: str = None) -> str:
+    """Merges the job's shard CSVs into one tuning CSV (newest first) and returns its path.
+
+    A settled row beats an [ERROR ] row for the same email from an earlier attempt. The
+    previous merge of this job is replaced, since the new one is a superset of it, and
+    keeps its original timestamp.
+    """
+    directory = job_dir(name)
+    results_dir = results_dir or tuner.RESULTS_DIR
+    rows = {}
+    for path in _shard_paths(directory):
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                seq_id = (row.get('seq_id') or '').strip()
+                if not seq_id.isdigit():
+                    continue
+                if int(seq_id) not in rows or rows[int(seq_id)]['status'] not in SETTLED:
+                    rows[int(seq_id)] = row
+
+    os.makedirs(results_dir, exist_ok=True)
+    meta = _read_meta(directory)
+    # Every merge of the job reuses the first one's run id; a fresh timestamp would make a
+    # re-merge outrank manual tuning runs made in between (the newest run's label wins)
+    stamp = meta.setdefault('run_stamp', time.strftime('%Y%m%d-%H%M%S'))
+    out = os.path.join(results_dir, f"tuning_{stamp}.csv")
+    counts = {status: 0 for status in SETTLED}
+    with open(out, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(tuner.CSV_FIELDS)
+        for seq_id in sorted(rows, reverse=True):
+            writer.writerow([rows[seq_id].get(k, '') for k in tuner.CSV_FIELDS])
+            if rows[seq_id]['status'] in counts:
+                counts[rows[seq_id]['status']] += 1
+        errors = len(rows) - sum(counts.values())
+        writer.writerow(['', '', 'SUMMARY', '', '', '',
+                         f"archive job '{name}': {len(rows)} emails, delete {counts['[DELETE]']}, "
+                         f"keep {counts['[ KEEP ]']}, errors {errors}"])
+
+    store = results_store.store_path(results_dir)
+    previous = meta.get('merged')
+    if previous and previous != out:
+        if os.path.exists(previous):
+            os.remove(previous)
+        results_store.delete_run(results_store.run_id_for(previous), path=store)
+    results_store.import_csv(out, force=True, source='archive', path=store, storage=meta.get('storage_dir'))
+    meta['merged'] = out
+    _write_meta(directory, meta)
+    return out
+
+
+def run_job(name: str = 'archive', storage_dir: str = None, shards: int = None, workers: int = None,
+            batch_size: int = None) -> dict:
+    """Classifies every email in `storage_dir` not yet settled by job `name`, then merges the results.
+
+    Returns counts for this run, plus the merged CSV path under 'merged' (None if interrupted)
+    and the number of shard workers that crashed under 'failed_shards'.
+    """
+    storage_dir = storage_dir or tuner.STORAGE_DIR
+    shards = max(1, shards or SHARDS)
+    workers = max(1, workers or tuner.TUNING_WORKERS)
+    batch_size = max(1, batch_size or tuner.TUNING_BATCH_SIZE)
+    directory = job_dir(name)
+    os.makedirs(directory, exist_ok=True)
+
+    meta = _read_meta(directory)
+    if meta.get('storage_dir') and os.path.abspath(meta['storage_dir']) != os.path.abspath(storage_dir):
+        raise ValueError(f"Job '{name}' belongs to {meta['storage_dir']}; use another job name for {storage_dir}")
+    meta.setdefault('storage_dir', storage_dir)
+    meta.setdefault('created', time.strftime('%Y-%m-%dT%H:%M:%S'))
+    _write_meta(directory, meta)
+
+    files = tuner.get_latest_emails(storage_dir, count=sys.maxsize)
+    done = set()
+    for path in _shard_paths(directory):
+        done |= _recover(path)
+    pending = [f for f in files if tuner._seq_id_from_filename(f) not in done]
+    counts = {'done': 0, 'delete': 0, 'keep': 0, 'errors': 0, 'failed_shards': 0, 'merged': None}
+    print(f"\n--- Archive Job '{name}': {len(files)} emails, {len(files) - len(pending)} already done, "
+          f"{len(pending)} to classify ({shards} shards x {workers} in flight, batch {batch_size}) ---")
+
+    if pending:
+        ollama_client.warm_up(tuner.OLLAMA_MODEL)
+        by_shard = [[] for _ in range(shards)]
+        for filename in pending:
+            by_shard[tuner._seq_id_from_filename(filename) % shards].append(filename)
+
+        # spawn, not fork: workers must not inherit the parent's pooled HTTP/sqlite connections
+        ctx = mp.get_context('spawn')
+        progress = ctx.Queue()
+        procs = [
+            ctx.Process(target=_run_shard, args=(i, storage_dir, directory, chunk, workers, batch_size, progress),
+                        daemon=True)
+            for i, chunk in enumerate(by_shard) if chunk
+        ]
+        started = time.time()
+        for p in procs:
+            p.start()
+        try:
+            last_print = 0.0
+            while True:
+                try:
+                    _, status = progress.get(timeout=PROGRESS_SEC)
+                except queue.Empty:
+                    if not any(p.is_alive() for p in procs):
+                        break
+                else:
+                    counts['done'] += 1
+                    key = {'[DELETE]': 'delete', '[ KEEP ]': 'keep'}.get(status, 'errors')
+                    counts[key] += 1
+                if time.time() - last_print >= PROGRESS_SEC:
+                    _print_progress(counts, len(pending), started)
+                    last_print = time.time()
+        except KeyboardInterrupt:
+            # A second Ctrl-C must not abandon the workers half-stopped
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            for p in procs:
+                p.terminate()
+            for p in procs:
+                p.join()
+            _print_progress(counts, len(pending), started)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            print(f"\nStopped. {counts['done']} email(s) checkpointed in {directory}; run the job again to resume.")
+            return counts
+        _print_progress(counts, len(pending), started)
+        print()
+        failed = [p for p in procs if p.exitcode]
+        counts['failed_shards'] = len(failed)
+        if failed:
+            print(f"{len(failed)} shard worker(s) exited with errors; their finished rows are kept. "
+                  f"Run the job again to retry the rest.")
+
+    counts['merged'] = merge(name)
+    print(f"Merged results: {counts['merged']}")
+    print("Use 'Process Tuning Results' to move them to staging.")
+    return counts
+
+
+if __name__ == '__main__':
+    # Usage: python archive_job.py [JOB_NAME] [RAW_DIR]
+    run_job(sys.argv[1] if len(sys.argv) > 1 else 'archive', sys.argv[2] if len(sys.argv) > 2 else None)
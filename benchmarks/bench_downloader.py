@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import random
+import imaplib
+import mailbox
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import imap_client  # noqa: E402
+import downloader  # noqa: E402
+from benchmarks import corpus  # noqa: E402
+from benchmarks.fake_imap import FakeImapServer, Mailbox  # noqa: E402
+
+
+def legacy_download(port: int, path: str):
+    """The original downloader loop: one SEARCH, then one FETCH round trip per message."""
+    M = imaplib.IMAP4('127.0.0.1', port)
+    M.login('bench', 'bench')
+    M.select('INBOX')
+    _, data = M.search(None, '(BEFORE "01-Jan-2030")')
+    mbox = mailbox.mbox(path)
+    mbox.lock()
+    try:
+        for num in data[0].split():
+            _, data = M.fetch(num, '(RFC822)')
+            mbox.add(data[0][1])
+        mbox.flush()
+    finally:
+        mbox.unlock()
+        mbox.close()
+    M.logout()
+
+
+def _point_at(server):
+    imap_client.IMAP_SERVER = '127.0.0.1'
+    imap_client.IMAP_PORT = server.port
+    imap_client.IMAP_SSL = False
+
+
+def run(count: int = 400, latency: float = 0.01, connections: int = 4, batch_size: int = 100) -> dict:
+    rng = random.Random(7)
+    server = FakeImapServer(Mailbox([corpus.make_message(i, rng) for i in range(1, count + 1)]), latency).start()
+    _point_at(server)
+    results = {"emails": count, "latency_ms": latency * 1000}
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        legacy_download(server.port, os.path.join(tmp, 'legacy.mbox'))
+        results["legacy_sec"] = round(time.perf_counter() - start, 3)
+        results["legacy_commands"] = sum(server.commands.values())
+
+        server.reset_stats()
+        target = os.path.join(tmp, 'batched.mbox')
+        start = time.perf_counter()
+        downloader.fetch_all_older_than_90_days('bench', 'bench', target, connections=connections, batch_size=batch_size)
+        results["batched_sec"] = round(time.perf_counter() - start, 3)
+        results["batched_commands"] = sum(server.commands.values())
+        results["batched_saved"] = len(mailbox.mbox(target))
+
+        # Resume: add a few new messages and re-run; only those should be fetched
+        for i in range(count + 1, count + 11):
+            server.mailbox.append(corpus.make_message(i, rng))
+        server.reset_stats()
+        downloader.fetch_all_older_than_90_days('bench', 'bench', target, connections=connections, batch_size=batch_size)
+        results["resume_fetch_commands"] = server.commands.get('UID FETCH', 0)
+        results["resume_saved_total"] = len(mailbox.mbox(target))
+
+        # Incremental sync: nothing changed -> one STATUS and no SEARCH/FETCH at all
+        server.reset_stats()
+        start = time.perf_counter()
+        downloader.fetch_all_older_than_90_days('bench', 'bench', target, connections=connections, batch_size=batch_size)
+        results["noop_sync_sec"] = round(time.perf_counter() - start, 3)
+        results["noop_sync_commands"] = dict(server.commands)
+    server.shutdown()
+
+    print("\n" + "=" * 60)
+    print(f"{count} emails, {results['latency_ms']:.0f}ms per command")
+    print(f" - legacy per-message fetch: {results['legacy_sec']}s, {results['legacy_commands']} commands")
+    print(f" - batched UID fetch:        {results['batched_sec']}s, {results['batched_commands']} commands "
+          f"({connections} connections, batches of {batch_size})")
+    print(f" - resume after +10 emails:  {results['resume_fetch_commands']} UID FETCH, "
+          f"{results['resume_saved_total']} in mbox")
+    print(f" - unchanged mailbox sync:   {results['noop_sync_sec']}s, commands {results['noop_sync_commands']}")
+    return results
+
+
+if __name__ == '__main__':
+    run()
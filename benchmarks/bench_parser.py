@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import email
+import tempfile
+from email import policy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import fast_parser  # noqa: E402
+import snippet  # noqa: E402
+from benchmarks import corpus  # noqa: E402
+
+
+def parse_full(path: str) -> str:
+    """The original tuner.parse_eml approach: build the whole message tree, then walk it."""
+    with open(path, 'rb') as f:
+        msg = email.message_from_binary_file(f, policy=policy.default)
+    body = ""
+    if msg.is_multipart():
+        for part in msg.walk():
+            if part.get_content_type() == "text/plain":
+                payload = part.get_payload(decode=True)
+                if payload:
+                    body = payload.decode(errors='ignore')
+                break
+    else:
+        payload = msg.get_payload(decode=True)
+        if payload:
+            body = payload.decode(errors='ignore')
+    return body.strip().replace('\n', ' ')[:500]
+
+
+def parse_lazy(path: str) -> str:
+    return fast_parser.parse_path(path)['snippet']
+
+
+def _agrees(full: str, lazy: str) -> bool:
+    """The old parser ignored the declared charset and dropped non-UTF-8 bytes, and passed
+    HTML and whitespace through as-is; compare the cleaned ASCII text only."""
+    if '<' in full:
+        full = snippet.html_to_text(full)
+    full = ' '.join(''.join(c for c in full if c.isascii()).split())
+    lazy = ' '.join(''.join(c for c in lazy if c.isascii()).split())
+    n = min(len(full), len(lazy))
+    return full[:n] == lazy[:n]
+
+
+def _time(fn, paths, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for p in paths:
+            fn(p)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(directory: str = None, count: int = 300, repeat: int = 3) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        if directory is None:
+            directory = tmp
+            corpus.generate(directory, count, attachment_ratio=0.25, attachment_kb=2048)
+        paths = sorted(
+            (os.path.join(directory, f) for f in os.listdir(directory) if f.endswith('.eml')),
+            key=lambda p: int(os.path.basename(p).split('.')[0]),
+        )
+        total_bytes = sum(os.path.getsize(p) for p in paths)
+        full = _time(parse_full, paths, repeat)
+        lazy = _time(parse_lazy, paths, repeat)
+        mismatches = sum(1 for p in paths if not _agrees(parse_full(p), parse_lazy(p)))
+
+    result = {
+        "emails": len(paths),
+        "corpus_mb": round(total_bytes / 1e6, 1),
+        "full_sec": round(full, 3),
+        "lazy_sec": round(lazy, 3),
+        "speedup": round(full / lazy, 1) if lazy else None,
+        "mismatches": mismatches,
+    }
+    print(f"Parsed {result['emails']} emails ({result['corpus_mb']} MB)")
+    print(f" - full tree parser: {full:.3f}s ({len(paths) / full:.0f} emails/s)")
+    print(f" - lazy parser:      {lazy:.3f}s ({len(paths) / lazy:.0f} emails/s)")
+    print(f" - speedup:          {result['speedup']}x, snippet mismatches: {mismatches}")
+    return result
+
+
+if __name__ == '__main__':
+    # Usage: python -m benchmarks.bench_parser [EML_DIR]
+    run(sys.argv[1] if len(sys.argv) > 1 else None)
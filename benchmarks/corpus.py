@@ -0,0 +1,98 @@
+import os
+import sys
+import random
+from email import policy
+from email.message import EmailMessage
+from email.utils import formatdate, make_msgid
+
+# Synthetic .eml corpus for benchmarks: a reproducible mix of plain, HTML-only,
+# multipart/alternative and attachment-heavy messages in several charsets.
+SENDERS = [
+    'Deals Daily <offers@shop.example>',
+    'Courier <tracking@parcels.example>',
+    'News Briefing <briefing@news.example>',
+    'Keith <okeefo@gmail.com>',
+    'Bank <statements@bank.example>',
+    'Recruiter <jobs@hire.example>',
+]
+SUBJECTS = [
+    'Weekend SALE: {n}% off everything',
+    'Your order #{n} has shipped',
+    'Morning briefing {n}',
+    'Re: dinner on the {n}th?',
+    'Your statement is ready ({n})',
+    '{n} new jobs match your profile',
+]
+CHARSETS = ['utf-8', 'iso-8859-15', 'windows-1252']
+WORDS = (
+    'lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor '
+    'incididunt ut labore et dolore magna aliqua café naïve order delivery'
+).split()
+# Only transactional senders (courier, bank) mention money, so the rule prefilter
+# doesn't decide every message on its own
+AMOUNTS = ['£20', '€15', '$9.99']
+
+
+def _text(rng: random.Random, n_words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(n_words))
+
+
+# Bulk senders reuse a template, so their bodies open with the same text; personal mail doesn't
+TEMPLATES = [_text(random.Random(i), 60) if '@gmail.com' not in s else '' for i, s in enumerate(SENDERS)]
+
+
+def make_message(seq: int, rng: random.Random, attachment_kb: int = 0) -> bytes:
+    """Builds one message. Shape and charset vary with the rng; attachment_kb > 0 adds a binary attachment."""
+    msg = EmailMessage()
+    idx = rng.randrange(len(SENDERS))
+    msg['From'] = SENDERS[idx]
+    msg['To'] = 'me@example.com'
+    msg['Subject'] = SUBJECTS[idx].format(n=rng.randint(2, 99))
+    msg['Date'] = formatdate(1600000000 + seq * 3600)
+    msg['Message-ID'] = make_msgid(idstring=str(seq), domain='bench.example')
+    if idx in (0, 2, 5):
+        msg['List-Unsubscribe'] = '<mailto:unsubscribe@example.com>'
+    if idx == 0:
+        msg['Precedence'] = 'bulk'
+
+    charset = rng.choice(CHARSETS)
+    body = (TEMPLATES[idx] + ' ' + _text(rng, rng.randint(40, 400))).strip()
+    if idx in (1, 4):
+        body += f" total {rng.choice(AMOUNTS)}"
+    shape = rng.choice(['plain', 'html', 'alternative'])
+    if shape == 'plain':
+        msg.set_content(body, charset=charset)
+    elif shape == 'html':
+        msg.set_content(f"<html><body><p>{body}</p></body></html>", subtype='html', charset=charset)
+    else:
+        msg.set_content(body, charset=charset)
+        msg.add_alternative(f"<html><body><p>{body}</p></body></html>", subtype='html', charset=charset)
+
+    if attachment_kb:
+        payload = rng.randbytes(attachment_kb * 1024)
+        msg.add_attachment(payload, maintype='application', subtype='pdf', filename=f'doc{seq}.pdf')
+    # CRLF line endings, as messages arrive from IMAP
+    return msg.as_bytes(policy=policy.SMTP)
+
+
+def generate(directory: str, count: int = 500, attachment_ratio: float = 0.2,
+             attachment_kb: int = 2048, seed: int = 42) -> list:
+    """Writes `count` messages as <seq>.eml into `directory` and returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for seq in range(1, count + 1):
+        kb = attachment_kb if rng.random() < attachment_ratio else 0
+        path = os.path.join(directory, f"{seq}.eml")
+        with open(path, 'wb') as f:
+            f.write(make_message(seq, rng, kb))
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    # Usage: python -m benchmarks.corpus OUT_DIR [COUNT]
+    out = sys.argv[1] if len(sys.argv) > 1 else './bench_corpus'
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    generate(out, n)
+    print(f"Wrote {n} emails to {out}")
@@ -0,0 +1,464 @@
+import re
+import sys
+import time
+import socketserver
+import threading
+import email
+import email.utils
+from datetime import datetime, timezone
+from email.parser import BytesHeaderParser
+
+# A scripted, in-process IMAP4rev1 stand-in for benchmarks: one mailbox, plain TCP,
+# configurable per-command latency, and just enough of the protocol for imaplib
+# (LOGIN, SELECT/EXAMINE, STATUS, SEARCH/UID SEARCH, FETCH/UID FETCH including
+# BODYSTRUCTURE and partial BODY[section]<offset.count>, UID STORE of FLAGS and Gmail's
+# X-GM-LABELS, UID MOVE/COPY, (UID) EXPUNGE, NOOP, LOGOUT), with UIDVALIDITY/UIDNEXT and
+# a CONDSTORE-style HIGHESTMODSEQ that moves on every change. Messages moved or copied
+# elsewhere land in Mailbox.folders so a benchmark can check what was applied.
+# Every command is counted so a benchmark can report round trips.
+
+_TAG_RE = re.compile(rb'^(\S+) (\S+)(?: (.*))?$', re.DOTALL)
+
+
+class Mailbox:
+    def __init__(self, messages=None, uidvalidity: int = 1):
+        """`messages` is a list of raw message bytes; UIDs are assigned 1..N in order."""
+        self.lock = threading.Lock()
+        self.uidvalidity = uidvalidity
+        self.messages = []  # list of dicts: uid, raw, date, flags, labels
+        self.folders = {}  # other mailbox name -> list of message dicts moved/copied there
+        self.next_uid = 1
+        self.highestmodseq = 1
+        for raw in messages or []:
+            self.append(raw)
+
+    def append(self, raw: bytes) -> int:
+        with self.lock:
+            hdr = BytesHeaderParser().parsebytes(raw)
+            try:
+                date = email.utils.parsedate_to_datetime(hdr.get('Date'))
+            except Exception:
+                date = datetime.now(timezone.utc)
+            uid = self.next_uid
+            self.next_uid += 1
+            self.highestmodseq += 1
+            self.messages.append({"uid": uid, "raw": raw, "date": date, "flags": set(), "labels": set()})
+            return uid
+
+    def expunge_uids(self, uids) -> list:
+        """Removes the given UIDs; returns their former sequence numbers, highest first (EXPUNGE order)."""
+        with self.lock:
+            gone = [n for n, m in enumerate(self.messages, start=1) if m["uid"] in uids]
+            self.messages = [m for m in self.messages if m["uid"] not in uids]
+            self.highestmodseq += 1
+            return gone[::-1]
+
+    def copy_uids(self, uids, folder: str) -> int:
+        with self.lock:
+            picked = [dict(m, flags=set(m["flags"]), labels=set(m["labels"])) for m in self.messages if m["uid"] in uids]
+            self.folders.setdefault(folder, []).extend(picked)
+            return len(picked)
+
+    def store(self, uids, field: str, op: str, values) -> list:
+        """Adds (+), removes (-) or replaces FLAGS / X-GM-LABELS; returns the (seq, message) pairs touched."""
+        touched = []
+        with self.lock:
+            for n, m in enumerate(self.messages, start=1):
+                if m["uid"] not in uids:
+                    continue
+                if op == '+':
+                    m[field] |= set(values)
+                elif op == '-':
+                    m[field] -= set(values)
+                else:
+                    m[field] = set(values)
+                touched.append((n, m))
+            self.highestmodseq += 1
+        return touched
+
+
+def _parse_set(spec: str, max_value: int) -> set:
+    out = set()
+    for part in spec.split(','):
+        if ':' in part:
+            a, b = part.split(':', 1)
+            a = max_value if a == '*' else int(a)
+            b = max_value if b == '*' else int(b)
+            lo, hi = min(a, b), max(a, b)
+            out.update(range(lo, hi + 1))
+        elif part == '*':
+            out.add(max_value)
+        else:
+            out.add(int(part))
+    return out
+
+
+def _imap_date(s: str):
+    return datetime.strptime(s.strip('"'), '%d-%b-%Y').date()
+
+
+def _split_args(s: str) -> list:
+    """Splits command arguments on spaces, keeping quoted strings and (lists) together."""
+    out = []
+    i = 0
+    while i < len(s):
+        c = s[i]
+        if c == ' ':
+            i += 1
+        elif c == '"':
+            j = s.index('"', i + 1)
+            out.append(s[i:j + 1])
+            i = j + 1
+        elif c == '(':
+            depth, j = 0, i
+            while j < len(s):
+                if s[j] == '(':
+                    depth += 1
+                elif s[j] == ')':
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j += 1
+            out.append(s[i:j + 1])
+            i = j + 1
+        else:
+            j = i
+            depth = 0
+            while j < len(s) and (s[j] != ' ' or depth):
+                if s[j] == '[':
+                    depth += 1
+                elif s[j] == ']':
+                    depth -= 1
+                j += 1
+            out.append(s[i:j])
+            i = j
+    return out
+
+
+def _header_fields(raw: bytes, names) -> bytes:
+    head = raw.split(b'\r\n\r\n', 1)[0] if b'\r\n\r\n' in raw else raw.split(b'\n\n', 1)[0]
+    wanted = {n.upper() for n in names}
+    out = []
+    keep = False
+    for line in head.splitlines(keepends=True):
+        if line[:1] in (b' ', b'\t'):
+            if keep:
+                out.append(line)
+            continue
+        keep = line.split(b':', 1)[0].decode('ascii', errors='ignore').strip().upper() in wanted
+        if keep:
+            out.append(line)
+    return b''.join(out) + b'\r\n'
+
+
+def _quote(value) -> str:
+    if value is None:
+        return 'NIL'
+    return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _params(part) -> str:
+    params = part.get_params()[1:] if part.get_params() else []
+    if not params:
+        return 'NIL'
+    return '(' + ' '.join(f'{_quote(k)} {_quote(v)}' for k, v in params) + ')'
+
+
+def _part_bytes(part) -> bytes:
+    # compat32 keeps undecoded bytes as surrogate escapes, so this recovers them exactly
+    payload = part.get_payload()
+    return payload.encode('ascii', 'surrogateescape') if isinstance(payload, str) else b''
+
+
+def _bodystructure(part) -> str:
+    if part.is_multipart():
+        children = ''.join(_bodystructure(p) for p in part.get_payload())
+        return f'({children} {_quote(part.get_content_subtype())} ("boundary" {_quote(part.get_boundary())}))'
+    body = _part_bytes(part)
+    maintype, subtype = part.get_content_maintype(), part.get_content_subtype()
+    cte = (part.get('Content-Transfer-Encoding') or '7bit').strip()
+    dispo = part.get_content_disposition()
+    dispo = f'({_quote(dispo)} NIL)' if dispo else 'NIL'
+    fields = f'{_quote(maintype)} {_quote(subtype)} {_params(part)} NIL NIL {_quote(cte)} {len(body)}'
+    if maintype == 'text':
+        lines = body.count(b'\n')
+        return f'({fields} {lines} NIL {dispo} NIL NIL)'
+    return f'({fields} NIL {dispo} NIL NIL)'
+
+
+def _section(msg, spec: str) -> bytes:
+    part = msg
+    for n in spec.split('.'):
+        if part.is_multipart():
+            part = part.get_payload()[int(n) - 1]
+        elif n != '1':
+            raise ValueError(f"no section {spec}")
+    return _part_bytes(part)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    server: 'FakeImapServer'
+    # Buffer each response and flush once per command, like a real server would
+    wbufsize = 65536
+    disable_nagle_algorithm = True
+
+    def send(self, data: bytes):
+        self.wfile.write(data)
+
+    def handle(self):
+        self.selected = False
+        self.send(b'* OK fake IMAP4rev1 ready\r\n')
+        self.wfile.flush()
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            m = _TAG_RE.match(line.rstrip(b'\r\n'))
+            if not m:
+                continue
+            tag, cmd, args = m.group(1), m.group(2).decode().upper(), (m.group(3) or b'').decode('utf-8', 'replace')
+            self.server.count(cmd if cmd != 'UID' else 'UID ' + args.split(' ', 1)[0].upper())
+            if self.server.latency:
+                time.sleep(self.server.latency)
+            try:
+                keep_going = self.dispatch(tag, cmd, args)
+            except Exception as e:
+                self.send(tag + f' BAD {e}\r\n'.encode())
+                keep_going = True
+            self.wfile.flush()
+            if not keep_going:
+                return
+
+    def dispatch(self, tag: bytes, cmd: str, args: str) -> bool:
+        mbox = self.server.mailbox
+        if cmd == 'CAPABILITY':
+            self.send(f'* CAPABILITY {" ".join(self.server.capabilities)}\r\n'.encode())
+        elif cmd == 'LOGIN':
+            pass
+        elif cmd in ('SELECT', 'EXAMINE'):
+            self.selected = True
+            self.send(f'* {len(mbox.messages)} EXISTS\r\n'.encode())
+            self.send(f'* OK [UIDVALIDITY {mbox.uidvalidity}] UIDs valid\r\n'.encode())
+            self.send(f'* OK [UIDNEXT {mbox.next_uid}] Predicted next UID\r\n'.encode())
+            if 'CONDSTORE' in self.server.capabilities:
+                self.send(f'* OK [HIGHESTMODSEQ {mbox.highestmodseq}] Highest\r\n'.encode())
+        elif cmd == 'NOOP':
+            pass
+        elif cmd == 'STATUS':
+            name = _split_args(args)[0]
+            values = f'UIDNEXT {mbox.next_uid} UIDVALIDITY {mbox.uidvalidity} MESSAGES {len(mbox.messages)}'
+            if 'CONDSTORE' in self.server.capabilities:
+                values += f' HIGHESTMODSEQ {mbox.highestmodseq}'
+            self.send(f'* STATUS {name} ({values})\r\n'.encode())
+        elif cmd == 'LOGOUT':
+            self.send(b'* BYE\r\n' + tag + b' OK LOGOUT completed\r\n')
+            return False
+        elif cmd == 'SEARCH':
+            self.search(args, by_uid=False)
+        elif cmd == 'FETCH':
+            self.fetch(args, by_uid=False)
+        elif cmd == 'EXPUNGE':
+            self.expunge({m["uid"] for m in mbox.messages if '\\Deleted' in m["flags"]})
+        elif cmd == 'UID':
+            sub, _, rest = args.partition(' ')
+            sub = sub.upper()
+            if sub == 'SEARCH':
+                self.search(rest, by_uid=True)
+            elif sub == 'FETCH':
+                self.fetch(rest, by_uid=True)
+            elif sub == 'STORE':
+                self.store(rest)
+            elif sub in ('MOVE', 'COPY'):
+                if sub == 'MOVE' and 'MOVE' not in self.server.capabilities:
+                    self.send(tag + b' BAD MOVE not supported\r\n')
+                    return True
+                self.copy(rest, move=sub == 'MOVE')
+            elif sub == 'EXPUNGE':
+                self.expunge(_parse_set(rest, mbox.next_uid - 1))
+            else:
+                self.send(tag + f' BAD unsupported UID {sub}\r\n'.encode())
+                return True
+        else:
+            self.send(tag + f' BAD unsupported {cmd}\r\n'.encode())
+            return True
+        self.send(tag + f' OK {cmd} completed\r\n'.encode())
+        return True
+
+    def search(self, args: str, by_uid: bool):
+        mbox = self.server.mailbox
+        toks = []
+        for tok in _split_args(args):
+            # Criteria lists are ANDed, so parentheses can simply be flattened
+            toks.extend(_split_args(tok[1:-1]) if tok.startswith('(') else [tok])
+        if toks and toks[0].upper() == 'CHARSET':
+            toks = toks[2:]
+        msgs = list(mbox.messages)
+        max_uid = mbox.next_uid - 1
+        i = 0
+        while i < len(toks):
+            t = toks[i].upper()
+            if t == 'BEFORE':
+                d = _imap_date(toks[i + 1])
+                msgs = [m for m in msgs if m["date"].date() < d]
+                i += 2
+            elif t == 'SINCE':
+                d = _imap_date(toks[i + 1])
+                msgs = [m for m in msgs if m["date"].date() >= d]
+                i += 2
+            elif t == 'UID':
+                wanted = _parse_set(toks[i + 1], max_uid)
+                msgs = [m for m in msgs if m["uid"] in wanted]
+                i += 2
+            elif t == 'NOT':
+                # Label/flag exclusions aren't modelled; skip the negated key and its argument
+                i += 3
+            else:
+                i += 1
+        if by_uid:
+            ids = [m["uid"] for m in msgs]
+        else:
+            index = {m["uid"]: n for n, m in enumerate(mbox.messages, start=1)}
+            ids = [index[m["uid"]] for m in msgs]
+        self.send(('* SEARCH' + ''.join(f' {x}' for x in ids) + '\r\n').encode())
+
+    def expunge(self, uids):
+        for seq in self.server.mailbox.expunge_uids(uids):
+            self.send(f'* {seq} EXPUNGE\r\n'.encode())
+
+    def copy(self, args: str, move: bool):
+        mbox = self.server.mailbox
+        spec, _, folder = args.partition(' ')
+        uids = _parse_set(spec, mbox.next_uid - 1)
+        mbox.copy_uids(uids, folder.strip().strip('"'))
+        if move:
+            self.expunge(uids)
+
+    def store(self, args: str):
+        mbox = self.server.mailbox
+        spec, item, values = (_split_args(args) + ['', ''])[:3]
+        op = item[0] if item[:1] in ('+', '-') else ''
+        name = item.lstrip('+-').upper()
+        silent = name.endswith('.SILENT')
+        name = name[:-len('.SILENT')] if silent else name
+        if name not in ('FLAGS', 'X-GM-LABELS'):
+            raise ValueError(f"unsupported store item {item}")
+        field = 'flags' if name == 'FLAGS' else 'labels'
+        inner = values[1:-1] if values.startswith('(') else values
+        touched = mbox.store(_parse_set(spec, mbox.next_uid - 1), field, op,
+                             [v.strip('"') for v in _split_args(inner)])
+        if not silent:
+            for seq, m in touched:
+                self.send(f'* {seq} FETCH (UID {m["uid"]} {self.fetch_item(name, m).decode()})\r\n'.encode())
+
+    def fetch(self, args: str, by_uid: bool):
+        mbox = self.server.mailbox
+        spec, _, items = args.partition(' ')
+        items = items.strip()
+        if items.startswith('(') and items.endswith(')'):
+            items = items[1:-1]
+        names = _split_args(items)
+        msgs = list(mbox.messages)
+        if by_uid:
+            wanted = _parse_set(spec, mbox.next_uid - 1)
+            targets = [(n, m) for n, m in enumerate(msgs, start=1) if m["uid"] in wanted]
+            if not any(x.upper() == 'UID' for x in names):
+                names = ['UID'] + names
+        else:
+            wanted = _parse_set(spec, len(msgs))
+            targets = [(n, m) for n, m in enumerate(msgs, start=1) if n in wanted]
+
+        for seq, m in targets:
+            parts = []
+            for name in names:
+                parts.append(self.fetch_item(name, m))
+            out = f'* {seq} FETCH ('.encode() + b' '.join(parts) + b')\r\n'
+            self.server.add_bytes(len(out))
+            self.send(out)
+
+    def fetch_item(self, name: str, m: dict) -> bytes:
+        upper = name.upper()
+        raw = m["raw"]
+        if upper == 'UID':
+            return f'UID {m["uid"]}'.encode()
+        if upper == 'RFC822.SIZE':
+            return f'RFC822.SIZE {len(raw)}'.encode()
+        if upper == 'INTERNALDATE':
+            return f'INTERNALDATE "{m["date"].strftime("%d-%b-%Y %H:%M:%S %z")}"'.encode()
+        if upper == 'FLAGS':
+            return f'FLAGS ({" ".join(sorted(m["flags"]))})'.encode()
+        if upper == 'X-GM-LABELS':
+            return f'X-GM-LABELS ({" ".join(_quote(v) for v in sorted(m["labels"]))})'.encode()
+        if upper in ('RFC822', 'BODY[]', 'BODY.PEEK[]'):
+            label = 'RFC822' if upper == 'RFC822' else 'BODY[]'
+            return f'{label} {{{len(raw)}}}\r\n'.encode() + raw
+        hm = re.match(r'BODY(?:\.PEEK)?\[HEADER\.FIELDS \(([^)]*)\)\]', name, re.IGNORECASE)
+        if hm:
+            data = _header_fields(raw, hm.group(1).split())
+            return f'BODY[HEADER.FIELDS ({hm.group(1).upper()})] {{{len(data)}}}\r\n'.encode() + data
+        if upper == 'BODYSTRUCTURE':
+            return f'BODYSTRUCTURE {_bodystructure(email.message_from_bytes(raw))}'.encode()
+        sm = re.match(r'BODY(?:\.PEEK)?\[([\d.]+)\](?:<(\d+)\.(\d+)>)?$', name, re.IGNORECASE)
+        if sm:
+            data = _section(email.message_from_bytes(raw), sm.group(1))
+            label = f'BODY[{sm.group(1)}]'
+            if sm.group(2) is not None:
+                start = int(sm.group(2))
+                data = data[start:start + int(sm.group(3))]
+                label += f'<{start}>'
+            return f'{label} {{{len(data)}}}\r\n'.encode() + data
+        if upper in ('BODY[HEADER]', 'BODY.PEEK[HEADER]', 'RFC822.HEADER'):
+            data = _header_fields(raw, [l.split(b':', 1)[0].decode('ascii', 'ignore')
+                                        for l in raw.split(b'\r\n\r\n', 1)[0].splitlines() if b':' in l])
+            return f'BODY[HEADER] {{{len(data)}}}\r\n'.encode() + data
+        raise ValueError(f"unsupported fetch item {name}")
+
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, mailbox: Mailbox, latency: float = 0.0, host: str = '127.0.0.1', port: int = 0,
+                 condstore: bool = True, move: bool = True, gmail: bool = True, uidplus: bool = False):
+        super().__init__((host, port), Handler)
+        self.mailbox = mailbox
+        self.latency = latency
+        self.capabilities = (['IMAP4rev1'] + (['CONDSTORE'] if condstore else []) + (['MOVE'] if move else [])
+                             + (['UIDPLUS'] if uidplus else []) + (['X-GM-EXT-1'] if gmail else []))
+        self.stats_lock = threading.Lock()
+        self.commands = {}
+        self.bytes_sent = 0
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def count(self, cmd: str):
+        with self.stats_lock:
+            self.commands[cmd] = self.commands.get(cmd, 0) + 1
+
+    def add_bytes(self, n: int):
+        with self.stats_lock:
+            self.bytes_sent += n
+
+    def reset_stats(self):
+        with self.stats_lock:
+            self.commands = {}
+            self.bytes_sent = 0
+
+    def start(self):
+        t = threading.Thread(target=self.serve_forever, daemon=True)
+        t.start()
+        return self
+
+
+if __name__ == '__main__':
+    # Usage: python -m benchmarks.fake_imap [COUNT] [LATENCY_SEC] [PORT]
+    from benchmarks import corpus
+    import random
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 1143
+    rng = random.Random(1)
+    server = FakeImapServer(Mailbox([corpus.make_message(i, rng) for i in range(1, n + 1)]), latency, port=port)
+    print(f"Fake IMAP on 127.0.0.1:{server.port} with {n} messages, {latency * 1000:.0f}ms latency")
+    server.serve_forever()
@@ -0,0 +1,194 @@
+import re
+import sys
+import json
+import time
+import zlib
+import math
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for the Ollama HTTP API: /api/generate (single and packed batch
+# prompts), /api/embed (hashed bag-of-words vectors), /api/ps and /api/tags.
+# Answers are a keyword heuristic, but timing follows a simple model of a real
+# server: a cold load after keep-alive expiry, prompt and generation token rates,
+# and at most `parallel` requests served at once (the rest queue, like
+# OLLAMA_NUM_PARALLEL). Responses carry Ollama's timing fields in ns.
+
+PROMO_RE = re.compile(r'sale|% off|briefing|jobs? match|newsletter|unsubscribe|offer', re.IGNORECASE)
+_WORD_RE = re.compile(r'[a-z0-9]+')
+EMBED_DIM = 128
+_BATCH_RE = re.compile(r'### EMAIL seq_id=(\d+)\n(.*?)(?=\n### EMAIL seq_id=|\Z)', re.DOTALL)
+
+
+def _tokens(text: str) -> int:
+    # Roughly four characters per token for English text
+    return max(1, len(text) // 4)
+
+
+def _verdict(text: str) -> dict:
+    promo = bool(PROMO_RE.search(text))
+    return {"is_promotional": promo, "reason": "Marketing keywords" if promo else "Looks transactional or personal"}
+
+
+def embedding(text: str) -> list:
+    """A deterministic unit vector: words hashed into EMBED_DIM buckets, so similar emails land close."""
+    vec = [0.0] * EMBED_DIM
+    for word in _WORD_RE.findall(text.lower()):
+        if not word.isdigit():
+            vec[zlib.crc32(word.encode()) % EMBED_DIM] += 1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def answer(prompt: str) -> str:
+    """The JSON text a well-behaved model would return for `prompt`."""
+    batch = _BATCH_RE.findall(prompt)
+    if batch:
+        return json.dumps({"results": [dict(seq_id=int(seq), **_verdict(body)) for seq, body in batch]})
+    return json.dumps(_verdict(prompt))
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: 'FakeOllamaServer'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, payload: dict, code: int = 200):
+        body = json.dumps(payload).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.count(self.path)
+        if self.path == '/api/ps':
+            self._send({"models": [{"name": m, "model": m} for m in self.server.resident()]})
+        elif self.path == '/api/tags':
+            self._send({"models": [{"name": m, "model": m, "digest": f"sha256:fake-{m}"} for m in self.server.models]})
+        else:
+            self._send({"error": "not found"}, 404)
+
+    def do_POST(self):
+        self.server.count(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            req = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send({"error": "invalid JSON"}, 400)
+            return
+        if self.path == '/api/generate':
+            self._send(self.server.generate(req))
+        elif self.path == '/api/embed':
+            self._send(self.server.embed(req))
+        else:
+            self._send({"error": "not found"}, 404)
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 prompt_tps: float = 2000.0, gen_tps: float = 200.0, load_sec: float = 0.5,
+                 parallel: int = 4, keep_alive_sec: float = 300.0, models=('email-triage',)):
+        super().__init__((host, port), Handler)
+        self.latency = latency
+        self.prompt_tps = prompt_tps
+        self.gen_tps = gen_tps
+        self.load_sec = load_sec
+        self.keep_alive_sec = keep_alive_sec
+        self.models = list(models)
+        self.slots = threading.BoundedSemaphore(parallel)
+        self.lock = threading.Lock()
+        self.last_used = {}
+        self.requests = {}
+        self.cold_loads = 0
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def count(self, path: str):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests = {}
+            self.cold_loads = 0
+
+    def resident(self) -> list:
+        now = time.monotonic()
+        with self.lock:
+            return [m for m, t in self.last_used.items() if now - t <= self.keep_alive_sec]
+
+    def _load(self, model: str) -> float:
+        """Seconds spent loading `model` for this request (0 if it is still resident)."""
+        with self.lock:
+            if model not in self.models:
+                self.models.append(model)
+            last = self.last_used.get(model)
+            cold = last is None or time.monotonic() - last > self.keep_alive_sec
+            self.last_used[model] = time.monotonic()
+            if cold:
+                self.cold_loads += 1
+        return self.load_sec if cold else 0.0
+
+    def generate(self, req: dict) -> dict:
+        model = req.get('model', '')
+        prompt = req.get('prompt', '')
+        with self.slots:
+            load = self._load(model)
+            text = answer(prompt) if prompt else ''
+            prompt_tokens = _tokens(prompt) if prompt else 0
+            eval_tokens = _tokens(text) if text else 0
+            prompt_sec = prompt_tokens / self.prompt_tps
+            eval_sec = eval_tokens / self.gen_tps
+            time.sleep(self.latency + load + prompt_sec + eval_sec)
+            with self.lock:
+                self.last_used[model] = time.monotonic()
+        total = self.latency + load + prompt_sec + eval_sec
+        return {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": text,
+            "done": True,
+            "done_reason": "stop" if prompt else "load",
+            "total_duration": int(total * 1e9),
+            "load_duration": int(load * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int(prompt_sec * 1e9),
+            "eval_count": eval_tokens,
+            "eval_duration": int(eval_sec * 1e9),
+        }
+
+    def embed(self, req: dict) -> dict:
+        inputs = req.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        with self.slots:
+            load = self._load(req.get('model', ''))
+            tokens = sum(_tokens(t) for t in inputs)
+            # Embedding is a single forward pass: prompt-rate cost only, no generation
+            time.sleep(self.latency + load + tokens / (self.prompt_tps * 4))
+        return {"model": req.get('model', ''), "embeddings": [embedding(t) for t in inputs],
+                "total_duration": int((self.latency + load) * 1e9), "load_duration": int(load * 1e9),
+                "prompt_eval_count": tokens}
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == '__main__':
+    # Usage: python -m benchmarks.fake_ollama [PORT] [GEN_TOKENS_PER_SEC] [PARALLEL]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 11435
+    gen_tps = float(sys.argv[2]) if len(sys.argv) > 2 else 200.0
+    parallel = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    server = FakeOllamaServer(port=port, gen_tps=gen_tps, parallel=parallel)
+    print(f"Fake Ollama on {server.url} ({gen_tps:.0f} tok/s, {parallel} parallel)")
+    server.serve_forever()
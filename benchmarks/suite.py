@@ -0,0 +1,437 @@
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import resource
+import platform
+import tempfile
+import subprocess
+import contextlib
+
+# End-to-end benchmark suite. The parent builds a synthetic corpus and starts a fake
+# IMAP server and a fake Ollama; every scenario then runs in its own Python process
+# (pointed at the fakes through the usual env vars) so its peak RSS is its own.
+# Each scenario reports throughput, p50/p95 per-item latency where it has one, and
+# peak RSS; the whole run is saved as JSON under benchmarks/results/.
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks import corpus  # noqa: E402
+from benchmarks.fake_imap import FakeImapServer, Mailbox  # noqa: E402
+from benchmarks.fake_ollama import FakeOllamaServer, answer  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+_MARKER = 'BENCH_RESULT '
+
+
+def _eml_paths(directory: str) -> list:
+    names = [f for f in os.listdir(directory) if f.endswith('.eml')]
+    names.sort(key=lambda f: int(f.split('.')[0]))
+    return [os.path.join(directory, f) for f in names]
+
+
+def _timed(fn, latencies: list):
+    """Wraps `fn` so every call's duration is appended to `latencies`."""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - start)
+    return wrapper
+
+
+# --- Scenarios (run inside the child process) -----------------------------------
+
+def scenario_parser(ctx: dict) -> dict:
+    import fast_parser
+    latencies = []
+    parse = _timed(fast_parser.parse_path, latencies)
+    paths = _eml_paths(ctx["corpus"])
+    start = time.perf_counter()
+    for p in paths:
+        parse(p)
+    return {"items": len(paths), "seconds": time.perf_counter() - start, "latencies": latencies}
+
+
+def scenario_index(ctx: dict) -> dict:
+    import email_index
+    start = time.perf_counter()
+    res = email_index.refresh(ctx["corpus"], force=True)
+    return {"items": res["parsed"], "seconds": time.perf_counter() - start}
+
+
+def _tuner(ctx: dict, workers: int, batch_size: int, count: int = None) -> dict:
+    import tuner
+    start = time.perf_counter()
+    tuner.run_tuning_session(ctx["corpus"], count=count or ctx["count"], workers=workers, batch_size=batch_size)
+    seconds = time.perf_counter() - start
+    latencies = []
+    results = [os.path.join(tuner.RESULTS_DIR, f) for f in os.listdir(tuner.RESULTS_DIR) if f.endswith('.csv')]
+    with open(max(results), newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            if row['status'] != 'SUMMARY':
+                latencies.append(float(row['parse_sec']) + float(row['ai_sec']))
+    with open(max(results)[:-len('.csv')] + '.metrics.json', encoding='utf-8') as f:
+        llm = json.load(f)["llm"]
+    return {"items": len(latencies), "seconds": seconds, "latencies": latencies,
+            "extra": {"llm_emails": llm["llm_emails"], "prompt_tokens_avg": llm["prompt_tokens_avg"]}}
+
+
+def _write_labels(csv_path: str, paths: list):
+    """A tuning CSV labelling `paths` the way the fake model would."""
+    import fast_parser
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['seq_id', 'message_id', 'status', 'subject', 'parse_sec', 'ai_sec', 'reason'])
+        for p in paths:
+            info = fast_parser.parse_path(p)
+            promo = json.loads(answer(f"{info['sender']} {info['subject']} {info['snippet']}"))["is_promotional"]
+            writer.writerow([os.path.basename(p)[:-4], info['message_id'], '[DELETE]' if promo else '[ KEEP ]',
+                             info['subject'], '', '', 'LLM'])
+
+
+def scenario_tuner_seq(ctx: dict) -> dict:
+    return _tuner(ctx, workers=1, batch_size=1)
+
+
+def scenario_tuner_parallel(ctx: dict) -> dict:
+    return _tuner(ctx, workers=4, batch_size=8)
+
+
+def scenario_tuner_knn(ctx: dict) -> dict:
+    # The older half is already labelled; the newer half goes through rules -> kNN -> LLM
+    import clustering
+    import knn_classifier
+    clustering.CLUSTER_ENABLED = False
+    paths = _eml_paths(ctx["corpus"])
+    half = len(paths) // 2
+    labels_dir = os.path.join(ctx["work"], 'labels')
+    os.makedirs(labels_dir)
+    _write_labels(os.path.join(labels_dir, 'tuning_labels.csv'), paths[:half])
+    start = time.perf_counter()
+    built = knn_classifier.build_index(labels_dir, ctx["corpus"])
+    build_sec = time.perf_counter() - start
+    res = _tuner(ctx, workers=4, batch_size=8, count=len(paths) - half)
+    res["extra"].update({"index_emails": built["total"], "index_build_sec": round(build_sec, 3)})
+    return res
+
+
+def scenario_processor(ctx: dict) -> dict:
+    import processor
+    import results_store
+    base = ctx["work"]
+    raw_dir = os.path.join(base, 'raw')
+    os.makedirs(raw_dir)
+    csv_path = os.path.join(base, 'tuning_bench.csv')
+    paths = _eml_paths(ctx["corpus"])
+    for p in paths:
+        os.link(p, os.path.join(raw_dir, os.path.basename(p)))
+    _write_labels(csv_path, paths)
+
+    store = os.path.join(base, 'results.sqlite')
+    run_id = results_store.import_csv(csv_path, path=store)
+
+    latencies = []
+    processor._rename = _timed(processor._rename, latencies)
+    start = time.perf_counter()
+    stats = processor._bulk_process([run_id], raw_dir, os.path.join(base, 'to_delete'), os.path.join(base, 'to_keep'),
+                                    'move', True, True, False, store)
+    return {"items": stats["moved_delete"] + stats["moved_keep"], "seconds": time.perf_counter() - start,
+            "latencies": latencies}
+
+
+def scenario_fetch(ctx: dict) -> dict:
+    import fetch_emails
+    # The real query asks for yesterday's mail; the synthetic corpus is older
+    fetch_emails._search_query = lambda: '(BEFORE "01-Jan-2100")'
+    latencies = []
+    fetch_emails.classify_with_ollama = _timed(fetch_emails.classify_with_ollama, latencies)
+    start = time.perf_counter()
+    stats = fetch_emails.run_pipeline(os.path.join(ctx["work"], 'deletions.csv'), 'bench', 'bench')
+    return {"items": stats["classified"], "seconds": time.perf_counter() - start, "latencies": latencies,
+            "extra": {k: stats[k] for k in ("bytes_fetched", "bytes_full", "errors")}}
+
+
+def scenario_downloader(ctx: dict) -> dict:
+    import mailbox
+    import downloader
+    target = os.path.join(ctx["work"], 'bench.mbox')
+    start = time.perf_counter()
+    downloader.fetch_all_older_than_90_days('bench', 'bench', target, connections=4, batch_size=100)
+    seconds = time.perf_counter() - start
+    return {"items": len(mailbox.mbox(target)), "seconds": seconds}
+
+
+def scenario_mbox(ctx: dict) -> dict:
+    """Indexes an mbox of the corpus, reopens it, then parses every message in place through the map."""
+    import mailbox
+    import email_source
+    import mbox_reader
+    target = os.path.join(ctx["work"], 'archive.mbox')
+    box = mailbox.mbox(target)
+    for p in _eml_paths(ctx["corpus"]):
+        with open(p, 'rb') as f:
+            box.add(f.read())
+    box.close()
+    start = time.perf_counter()
+    res = mbox_reader.refresh(target)
+    index_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    mbox_reader.refresh(target)
+    reopen_ms = (time.perf_counter() - start) * 1000
+    latencies = []
+    parse = _timed(email_source.parse_path, latencies)
+    start = time.perf_counter()
+    for name in email_source.latest(target, res["total"]):
+        parse(os.path.join(target, name))
+    return {"items": res["total"], "seconds": time.perf_counter() - start, "latencies": latencies,
+            "extra": {"index_sec": round(index_sec, 3), "reopen_ms": round(reopen_ms, 2),
+                      "mbox_mb": round(os.path.getsize(target) / 1e6, 1)}}
+
+
+def scenario_pack(ctx: dict) -> dict:
+    """Packs the corpus, scans it back sequentially, then stages every email as index flags."""
+    import email_source
+    import pack_store
+    import processor
+    import results_store
+    pack = os.path.join(ctx["work"], 'raw.pack')
+    start = time.perf_counter()
+    pack_store.pack_directory(ctx["corpus"], pack)
+    pack_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    scanned = sum(1 for _ in pack_store.scan(pack))
+    scan_sec = time.perf_counter() - start
+    latencies = []
+    parse = _timed(email_source.parse_path, latencies)
+    for name in email_source.latest(pack, scanned):
+        parse(os.path.join(pack, name))
+
+    csv_path = os.path.join(ctx["work"], 'tuning_bench.csv')
+    _write_labels(csv_path, _eml_paths(ctx["corpus"]))
+    store = os.path.join(ctx["work"], 'results.sqlite')
+    run_id = results_store.import_csv(csv_path, path=store)
+    start = time.perf_counter()
+    stats = processor._bulk_process([run_id], pack, *pack_store.stage_dirs(pack), 'move', True, True, False, store)
+    stage_sec = time.perf_counter() - start
+    s = pack_store.stats(pack)
+    return {"items": scanned, "seconds": pack_sec, "latencies": latencies,
+            "extra": {"codec": s["codec"], "stored_ratio": round(s["stored_bytes"] / s["raw_bytes"], 3),
+                      "scan_sec": round(scan_sec, 3), "staged": stats["moved_delete"] + stats["moved_keep"],
+                      "stage_sec": round(stage_sec, 3)}}
+
+
+def scenario_imap_apply(ctx: dict) -> dict:
+    """Labels every other corpus email on the fake server, matched by Message-ID, then re-runs (a no-op)."""
+    import shutil
+    import imap_apply
+    delete_dir = os.path.join(ctx["work"], 'to_delete')
+    os.makedirs(delete_dir)
+    paths = _eml_paths(ctx["corpus"])[::2]
+    for p in paths:
+        shutil.copy(p, delete_dir)
+    log = os.path.join(ctx["work"], 'imap_apply.jsonl')
+    # Labels rather than MOVE so the shared fake mailbox stays intact for other scenarios
+    start = time.perf_counter()
+    res = imap_apply.apply_deletions('bench', 'bench', delete_dir, ctx["corpus"], mode='label', log_path=log)
+    seconds = time.perf_counter() - start
+    again = imap_apply.apply_deletions('bench', 'bench', delete_dir, ctx["corpus"], mode='label', log_path=log)
+    return {"items": res["applied"], "seconds": seconds,
+            "extra": {"batches": res["batches"], "unmatched": res["unmatched"], "rerun_pending": again["pending"]}}
+
+
+SCENARIOS = {
+    "parser": scenario_parser,
+    "index": scenario_index,
+    "tuner_seq": scenario_tuner_seq,
+    "tuner_parallel": scenario_tuner_parallel,
+    "tuner_knn": scenario_tuner_knn,
+    "processor": scenario_processor,
+    "fetch": scenario_fetch,
+    "downloader": scenario_downloader,
+    "mbox": scenario_mbox,
+    "pack": scenario_pack,
+    "imap_apply": scenario_imap_apply,
+}
+
+
+def _percentile(values: list, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+
+def _peak_rss_mb() -> float:
+    # Linux carries ru_maxrss over from the parent across fork+exec, so prefer this
+    # process's own high-water mark
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux, bytes on macOS
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _child(name: str, ctx: dict):
+    """Runs one scenario with its chatter sent to a log file and prints the result line."""
+    os.makedirs(ctx["work"], exist_ok=True)
+    with open(os.path.join(ctx["work"], 'output.log'), 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+        res = SCENARIOS[name](ctx)
+    latencies = res.pop("latencies", None) or []
+    seconds = res["seconds"]
+    out = {
+        "items": res["items"],
+        "seconds": round(seconds, 3),
+        "throughput_per_sec": round(res["items"] / seconds, 2) if seconds else None,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2) if latencies else None,
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 2) if latencies else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    out.update(res.get("extra", {}))
+    print(_MARKER + json.dumps(out))
+
+
+# --- Parent -----------------------------------------------------------------------
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ''
+
+
+def _run_child(name: str, ctx: dict, env: dict) -> dict:
+    proc = subprocess.run([sys.executable, '-m', 'benchmarks.suite', '--child', name, '--ctx', json.dumps(ctx)],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith(_MARKER):
+            return json.loads(line[len(_MARKER):])
+    return {"error": (proc.stderr.strip().splitlines() or [f"exit code {proc.returncode}"])[-1]}
+
+
+_COLUMNS = {"items", "seconds", "throughput_per_sec", "p50_ms", "p95_ms", "peak_rss_mb"}
+
+
+def _print_table(results: dict, previous: dict = None):
+    print(f"\n{'scenario':<16} {'items':>6} {'sec':>8} {'items/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>7}")
+    for name, r in results.items():
+        if "error" in r:
+            print(f"{name:<16} ERROR: {r['error']}")
+            continue
+        fmt = lambda v: '-' if v is None else v  # noqa: E731
+        line = (f"{name:<16} {r['items']:>6} {r['seconds']:>8} {fmt(r['throughput_per_sec']):>9} "
+                f"{fmt(r['p50_ms']):>8} {fmt(r['p95_ms']):>8} {r['peak_rss_mb']:>7}")
+        old = (previous or {}).get(name) or {}
+        if old.get("throughput_per_sec") and r.get("throughput_per_sec"):
+            line += f"  ({r['throughput_per_sec'] / old['throughput_per_sec']:.2f}x vs previous)"
+        print(line)
+        extras = {k: v for k, v in r.items() if k not in _COLUMNS}
+        if extras:
+            print(f"{'':<16} " + ', '.join(f"{k}={round(v, 1) if isinstance(v, float) else v}" for k, v in extras.items()))
+
+
+def run(count: int = 200, attachment_ratio: float = 0.2, attachment_kb: int = 512, only=None,
+        imap_latency: float = 0.005, gen_tps: float = 200.0, parallel: int = 4, compare: str = None,
+        save: bool = True, replicas: int = 1) -> dict:
+    names = [n for n in SCENARIOS if not only or n in only]
+    params = {"count": count, "attachment_ratio": attachment_ratio, "attachment_kb": attachment_kb,
+              "imap_latency": imap_latency, "gen_tps": gen_tps, "parallel": parallel, "replicas": replicas}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = os.path.join(tmp, 'corpus')
+        paths = corpus.generate(corpus_dir, count, attachment_ratio=attachment_ratio, attachment_kb=attachment_kb)
+        messages = []
+        for p in paths:
+            with open(p, 'rb') as f:
+                messages.append(f.read())
+        imap = FakeImapServer(Mailbox(messages), imap_latency).start()
+        ollamas = [FakeOllamaServer(gen_tps=gen_tps, parallel=parallel).start() for _ in range(max(1, replicas))]
+        print(f"Corpus: {count} emails, {sum(map(len, messages)) / 1e6:.1f} MB; "
+              f"fake IMAP :{imap.port}, fake Ollama {', '.join(o.url for o in ollamas)}")
+
+        for name in names:
+            work = os.path.join(tmp, 'work', name)
+            env = dict(os.environ)
+            env.update({
+                "OLLAMA_HOST": ollamas[0].url,
+                "OLLAMA_HOSTS": ','.join(o.url for o in ollamas),
+                "IMAP_SERVER": '127.0.0.1',
+                "IMAP_PORT": str(imap.port),
+                "IMAP_SSL": '0',
+                "CLASSIFY_CACHE": '0',
+                "EMAIL_INDEX_PATH": os.path.join(work, 'index.sqlite'),
+                "TUNING_RESULTS_DIR": os.path.join(work, 'results'),
+                "KNN_INDEX_PATH": os.path.join(work, 'knn_index.npz'),
+                "PROCESSOR_JOURNAL_DIR": os.path.join(work, 'journals'),
+            })
+            imap.reset_stats()
+            for o in ollamas:
+                o.reset_stats()
+            print(f"Running {name}...")
+            res = _run_child(name, {"corpus": corpus_dir, "work": work, "count": count}, env)
+            if "error" not in res:
+                res["imap_commands"] = sum(imap.commands.values())
+                res["ollama_requests"] = sum(sum(o.requests.values()) for o in ollamas)
+                res["ollama_cold_loads"] = sum(o.cold_loads for o in ollamas)
+            results[name] = res
+            shutil.rmtree(work, ignore_errors=True)
+        imap.shutdown()
+        for o in ollamas:
+            o.shutdown()
+
+    previous = None
+    if compare:
+        with open(compare, encoding='utf-8') as f:
+            previous = json.load(f).get("scenarios")
+    _print_table(results, previous)
+
+    report = {
+        "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "params": params,
+        "scenarios": results,
+    }
+    if save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"suite_{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to: {path}")
+    return report
+
+
+if __name__ == '__main__':
+    # Usage: python -m benchmarks.suite [--count N] [--only parser,fetch] [--compare results/suite_X.json]
+    ap = argparse.ArgumentParser(description="End-to-end benchmarks against a fake IMAP server and a fake Ollama")
+    ap.add_argument('--count', type=int, default=200)
+    ap.add_argument('--attachment-ratio', type=float, default=0.2)
+    ap.add_argument('--attachment-kb', type=int, default=512)
+    ap.add_argument('--only', help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    ap.add_argument('--imap-latency', type=float, default=0.005, help="seconds added to every IMAP command")
+    ap.add_argument('--gen-tps', type=float, default=200.0, help="fake Ollama generation tokens/sec")
+    ap.add_argument('--parallel', type=int, default=4, help="fake Ollama concurrent requests (OLLAMA_NUM_PARALLEL)")
+    ap.add_argument('--replicas', type=int, default=1, help="fake Ollama servers, balanced via OLLAMA_HOSTS")
+    ap.add_argument('--compare', help="earlier results JSON to compare throughput against")
+    ap.add_argument('--no-save', action='store_true')
+    ap.add_argument('--child', help=argparse.SUPPRESS)
+    ap.add_argument('--ctx', help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        _child(args.child, json.loads(args.ctx))
+    else:
+        run(args.count, args.attachment_ratio, args.attachment_kb,
+            only=set(args.only.split(',')) if args.only else None,
+            imap_latency=args.imap_latency, gen_tps=args.gen_tps, parallel=args.parallel,
+            compare=args.compare, save=not args.no_save, replicas=args.replicas)
@@ -0,0 +1,127 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import ollama_client
+
+# On-disk cache of LLM classifications, keyed by everything that can change the answer:
+# the prompt (sender/subject/snippet), model name, model digest and the modelfile contents.
+CACHE_PATH = os.environ.get('CLASSIFY_CACHE_PATH', './cache/classifications.sqlite')
+CACHE_ENABLED = os.environ.get('CLASSIFY_CACHE', '1') != '0'
+MAX_ENTRIES = int(os.environ.get('CLASSIFY_CACHE_MAX_ENTRIES', '200000'))
+MAX_AGE_DAYS = float(os.environ.get('CLASSIFY_CACHE_MAX_AGE_DAYS', '90'))
+# A hit only rewrites last_used when the stored value is older than this, so that reads from
+# parallel shards sharing the cache don't each take the write lock.
+TOUCH_AFTER_SEC = float(os.environ.get('CLASSIFY_CACHE_TOUCH_SEC', '86400'))
+MODELFILE_PATH = os.environ.get(
+    'MODELFILE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modelfiles', 'email-triage.modelfile'),
+)
+
+_lock = threading.Lock()
+_conn = None
+_modelfile_hash = None
+_stats = {"hits": 0, "misses": 0}
+_puts_since_evict = 0
+
+
+def _connect():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(CACHE_PATH)), exist_ok=True)
+        _conn = sqlite3.connect(CACHE_PATH, check_same_thread=False)
+        _conn.execute('PRAGMA journal_mode=WAL')
+        _conn.execute(
+            'CREATE TABLE IF NOT EXISTS classifications ('
+            ' key TEXT PRIMARY KEY,'
+            ' model TEXT,'
+            ' is_promotional INTEGER,'
+            ' reason TEXT,'
+            ' created REAL,'
+            ' last_used REAL)'
+        )
+        _conn.execute('CREATE INDEX IF NOT EXISTS idx_last_used ON classifications(last_used)')
+        _evict()
+    return _conn
+
+
+def _evict():
+    """Drops entries older than MAX_AGE_DAYS, then the least recently used beyond MAX_ENTRIES."""
+    if MAX_AGE_DAYS > 0:
+        cutoff = time.time() - MAX_AGE_DAYS * 86400
+        _conn.execute('DELETE FROM classifications WHERE last_used < ?', (cutoff,))
+    if MAX_ENTRIES > 0:
+        _conn.execute(
+            'DELETE FROM classifications WHERE key IN ('
+            ' SELECT key FROM classifications ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+            (MAX_ENTRIES,),
+        )
+    _conn.commit()
+
+
+def modelfile_hash() -> str:
+    global _modelfile_hash
+    if _modelfile_hash is None:
+        try:
+            with open(MODELFILE_PATH, 'rb') as f:
+                _modelfile_hash = hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            _modelfile_hash = 'none'
+    return _modelfile_hash
+
+
+def make_key(model: str, prompt: str) -> str:
+    payload = json.dumps([model, ollama_client.model_digest(model), modelfile_hash(), prompt])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get(model: str, prompt: str):
+    """Returns (is_promotional, reason) for a cached prompt, or None on a miss."""
+    if not CACHE_ENABLED:
+        return None
+    key = make_key(model, prompt)
+    with _lock:
+        conn = _connect()
+        row = conn.execute(
+            'SELECT is_promotional, reason, last_used FROM classifications WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            _stats["misses"] += 1
+            return None
+        _stats["hits"] += 1
+        now = time.time()
+        if now - (row[2] or 0) > TOUCH_AFTER_SEC:
+            conn.execute('UPDATE classifications SET last_used = ? WHERE key = ?', (now, key))
+            conn.commit()
+    return bool(row[0]), row[1]
+
+
+def put(model: str, prompt: str, is_promotional: bool, reason: str):
+    """Stores a successful classification. Errors/timeouts should never be cached."""
+    global _puts_since_evict
+    if not CACHE_ENABLED:
+        return
+    key = make_key(model, prompt)
+    now = time.time()
+    with _lock:
+        conn = _connect()
+        conn.execute(
+            'INSERT OR REPLACE INTO classifications VALUES (?, ?, ?, ?, ?, ?)',
+            (key, model, int(bool(is_promotional)), reason, now, now),
+        )
+        conn.commit()
+        _puts_since_evict += 1
+        if _puts_since_evict >= 1000:
+            _puts_since_evict = 0
+            _evict()
+
+
+def stats() -> dict:
+    return dict(_stats)
+
+
+def reset_stats():
+    _stats["hits"] = 0
+    _stats["misses"] = 0
@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+from datetime import date
+
+# Headless entry point for cron and scripts: every main_menu option as a subcommand with
+# flags instead of prompts. Only the modules a subcommand needs are imported, and only once
+# it runs. Progress chatter goes to stderr and a JSON summary is printed on stdout at the
+# end, e.g. {"command": "tune", "ok": true, "exit_code": 0, "seconds": 12.3, "result": {...}}.
+#
+#   python cli.py fetch --dir /srv/storage/docker/email_data
+#   python cli.py tune --source archive.mbox --count 200 --workers 4
+#   python cli.py process --runs latest --mode M2
+#   python cli.py runs list
+#   python cli.py archive --name nightly
+#   python cli.py apply --mode label --dry-run
+
+# Exit codes: usage errors are argparse's 2; a run that finished but left some work
+# undone (failed batches, LLM errors) exits PARTIAL so a scheduler can retry it
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_PARTIAL = 3
+EXIT_INTERRUPTED = 130
+
+SOURCE_HELP = "raw emails directory, .mbox or pack (default: $EMAIL_STORAGE_DIR or the raw_emails directory)"
+DATA_DIR = "/srv/storage/docker/email_data"
+
+
+def _credentials():
+    return os.getenv('GMAIL_USER'), os.getenv('GMAIL_APP_PASSWORD')
+
+
+def cmd_fetch(args):
+    import downloader
+    target = args.file or os.path.join(args.dir, f"gmail_archive_{date.today().isoformat()}.mbox")
+    os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+    user, password = _credentials()
+    res = downloader.fetch_all_older_than_90_days(user, password, target, connections=args.connections,
+                                                  batch_size=args.batch_size)
+    if res["error"]:
+        return EXIT_FAILED, res
+    return (EXIT_PARTIAL if res["errors"] else EXIT_OK), res
+
+
+def cmd_tune(args):
+    import tuner
+    res = tuner.run_tuning_session(args.source, count=args.count, workers=args.workers,
+                                   batch_size=args.batch_size, results_dir=args.results_dir)
+    return (EXIT_PARTIAL if res["errors"] else EXIT_OK), res
+
+
+def cmd_process(args):
+    import processor
+    if args.revert_journal:
+        res = processor.revert_journal(args.revert_journal, dry_run=args.dry_run)
+    else:
+        runs = args.runs if args.runs in ('latest', 'all') else [r.strip() for r in args.runs.split(',') if r.strip()]
+        res = processor.process_runs(runs, op=args.mode, storage_dir=args.source, results_dir=args.results_dir,
+                                     staging_dir=args.staging_dir, dry_run=args.dry_run, bulk=not args.no_bulk,
+                                     resume=args.resume)
+    return (EXIT_PARTIAL if res["errors"] else EXIT_OK), res
+
+
+def cmd_runs(args):
+    import tuning_runs_manager
+    import results_store
+    if args.action == 'list':
+        return EXIT_OK, {"runs": tuning_runs_manager.list_runs(args.results_dir)}
+    if args.action == 'delete':
+        if not args.run_ids:
+            raise ValueError("runs delete needs at least one run id")
+        deleted = tuning_runs_manager.delete_runs(args.run_ids, args.results_dir)
+        return (EXIT_OK if len(deleted) == len(args.run_ids) else EXIT_PARTIAL), {"deleted": deleted}
+    if args.action == 'export':
+        if len(args.run_ids) != 1:
+            raise ValueError("runs export takes exactly one run id")
+        return EXIT_OK, tuning_runs_manager.export_run(args.run_ids[0], args.results_dir, args.out)
+    if args.action == 'import':
+        if not args.run_ids or not all(os.path.isfile(p) for p in args.run_ids):
+            raise ValueError("runs import takes the path(s) of existing tuning CSVs")
+        store = results_store.store_path(args.results_dir or tuning_runs_manager.RESULTS_DIR)
+        return EXIT_OK, {"imported": [results_store.import_csv(p, force=True, path=store, storage=args.source)
+                                      for p in args.run_ids]}
+    # conflicts
+    store = results_store.store_path(args.results_dir or tuning_runs_manager.RESULTS_DIR)
+    conflicts = results_store.conflicts(args.run_ids or None, path=store)
+    return EXIT_OK, {"conflicts": {str(seq_id): [{"run_id": r, "status": s, "reason": why} for r, s, why in rows]
+                                   for seq_id, rows in conflicts.items()}}
+
+
+def cmd_archive(args):
+    import archive_job
+    res = archive_job.run_job(args.name, args.source, shards=args.shards, workers=args.workers,
+                              batch_size=args.batch_size)
+    if res['merged'] is None:
+        return EXIT_INTERRUPTED, res
+    # Crashed shards leave part of the archive unclassified even though the merge ran
+    return (EXIT_PARTIAL if res['errors'] or res['failed_shards'] else EXIT_OK), res
+
+
+def cmd_apply(args):
+    import imap_apply
+    user, password = _credentials()
+    res = imap_apply.apply_deletions(user, password, delete_dir=args.delete_dir, source=args.source, mode=args.mode,
+                                     target=args.target, dry_run=args.dry_run, connections=args.connections,
+                                     batch_size=args.batch_size)
+    return (EXIT_PARTIAL if res["errors"] else EXIT_OK), res
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='cli.py', description="Gmail AI organizer, without the menu.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('fetch', help="download INBOX mail older than 90 days into an mbox (menu option 1)")
+    p.add_argument('--dir', default=DATA_DIR, help="directory for the mbox (default: %(default)s)")
+    p.add_argument('--file', help="full mbox path (default: <dir>/gmail_archive_<today>.mbox)")
+    p.add_argument('--connections', type=int, help="parallel IMAP connections")
+    p.add_argument('--batch-size', type=int, help="UIDs per FETCH")
+    p.set_defaults(func=cmd_fetch)
+
+    p = sub.add_parser('tune', help="classify the newest emails into a tuning run (menu option 2)")
+    p.add_argument('--source', help=SOURCE_HELP)
+    p.add_argument('--count', type=int, default=50, help="emails to review (default: %(default)s)")
+    p.add_argument('--workers', type=int, help="requests in flight")
+    p.add_argument('--batch-size', type=int, help="emails per LLM prompt")
+    p.add_argument('--results-dir', help="where tuning runs are kept")
+    p.set_defaults(func=cmd_tune)
+
+    p = sub.add_parser('process', help="move tuning results to staging, or revert them (menu option 3)")
+    p.add_argument('--source', help=SOURCE_HELP)
+    p.add_argument('--runs', default='latest', help="'latest', 'all', or run ids / list positions, comma-separated")
+    p.add_argument('--mode', default='M3', choices=['M1', 'M2', 'M3', 'R1', 'R2', 'R3'],
+                   help="M1/M2/M3 move KEEP/DELETE/both, R1/R2/R3 revert them (default: %(default)s)")
+    p.add_argument('--dry-run', action='store_true')
+    p.add_argument('--no-bulk', action='store_true', help="move emails one at a time, without a journal")
+    p.add_argument('--resume', action='store_true', help="if a bulk run was interrupted, finish it (and do nothing else)")
+    p.add_argument('--revert-journal', metavar='JOURNAL', help="revert a bulk run from its journal (path or number)")
+    p.add_argument('--results-dir', help="where tuning runs are kept")
+    p.add_argument('--staging-dir', help="to_delete staging directory")
+    p.set_defaults(func=cmd_process)
+
+    p = sub.add_parser('runs', help="list, delete, export or import tuning runs, or show conflicts (menu option 4)")
+    p.add_argument('action', choices=['list', 'delete', 'export', 'import', 'conflicts'])
+    p.add_argument('run_ids', nargs='*', help="run ids (CSV paths for import)")
+    p.add_argument('--out', help="CSV path for export")
+    p.add_argument('--source', help="for import: the raw emails directory, .mbox or pack the CSV classified")
+    p.add_argument('--results-dir', help="where tuning runs are kept")
+    p.set_defaults(func=cmd_runs)
+
+    p = sub.add_parser('archive', help="classify the whole archive as a resumable job (menu option 5)")
+    p.add_argument('--name', default='archive', help="job name; reuse it to resume (default: %(default)s)")
+    p.add_argument('--source', help=SOURCE_HELP)
+    p.add_argument('--shards', type=int, help="worker processes")
+    p.add_argument('--workers', type=int, help="requests in flight per shard")
+    p.add_argument('--batch-size', type=int, help="emails per LLM prompt")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser('apply', help="move or label staged deletions on Gmail (menu option 6)")
+    p.add_argument('--source', help="where the staged emails came from, for the UID manifest; " + SOURCE_HELP)
+    p.add_argument('--delete-dir', help="to_delete staging directory")
+    p.add_argument('--mode', choices=['move', 'label'], help="move to the trash or add a label")
+    p.add_argument('--target', help="mailbox to move to / label to add")
+    p.add_argument('--dry-run', action='store_true')
+    p.add_argument('--connections', type=int, help="parallel IMAP connections")
+    p.add_argument('--batch-size', type=int, help="UIDs per command")
+    p.set_defaults(func=cmd_apply)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    from dotenv import load_dotenv
+    load_dotenv()
+    summary = {"command": args.command, "ok": False, "exit_code": EXIT_FAILED, "result": None, "error": None}
+    start = time.time()
+    # Whatever the modules print is progress for a human; stdout carries only the summary
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            code, result = args.func(args)
+            summary["result"] = result
+        except KeyboardInterrupt:
+            code = EXIT_INTERRUPTED
+            summary["error"] = "interrupted"
+        except Exception as e:
+            code = EXIT_FAILED
+            summary["error"] = f"{type(e).__name__}: {e}"
+            print(f"Error: {summary['error']}")
+    summary.update(ok=code == EXIT_OK, exit_code=code, seconds=round(time.time() - start, 3))
+    print(json.dumps(summary, default=str))
+    return code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
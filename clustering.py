@@ -0,0 +1,122 @@
+import os
+import re
+import random
+import zlib
+from email.utils import parseaddr
+
+# Groups a session's emails into clusters of near-identical messages: same normalized
+# sender and same subject template (digits, amounts and ids masked), optionally split
+# further by MinHash similarity of the body snippets. Only a few representatives of
+# each cluster are classified; their label is propagated to the rest, and a random
+# sample of the rest is classified anyway as a spot check. Off by default: set
+# TUNING_CLUSTER=1 to enable it once spot checks show propagation can be trusted.
+CLUSTER_ENABLED = os.environ.get('TUNING_CLUSTER', '0') != '0'
+# Smaller groups are classified email by email; propagation isn't worth the risk
+MIN_SIZE = int(os.environ.get('CLUSTER_MIN_SIZE', '4'))
+# Newest members of a cluster that are always classified directly
+REPRESENTATIVES = int(os.environ.get('CLUSTER_REPRESENTATIVES', '2'))
+# Share of the remaining members classified anyway to check the propagated label
+SPOT_CHECK = float(os.environ.get('CLUSTER_SPOT_CHECK', '0.1'))
+MINHASH_ENABLED = os.environ.get('CLUSTER_MINHASH', '1') != '0'
+# Estimated Jaccard similarity of snippet shingles needed to share a cluster
+MINHASH_THRESHOLD = float(os.environ.get('CLUSTER_MINHASH_THRESHOLD', '0.5'))
+MINHASH_PERMUTATIONS = 32
+SHINGLE_WORDS = 3
+
+_PREFIX_RE = re.compile(r'^\s*((re|fwd?|aw|wg)\s*(\[\d+\])?\s*:\s*)+', re.IGNORECASE)
+# Any token with a digit in it: dates, order numbers, prices, counts
+_NUMERIC_RE = re.compile(r'\S*\d\S*')
+_WORD_RE = re.compile(r'\w+')
+_WS_RE = re.compile(r'\s+')
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240101)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(MINHASH_PERMUTATIONS)]
+
+
+def sender_key(sender: str) -> str:
+    """Lower-cased address with +tags dropped and digits masked (bounce-1234@ == bounce-99@)."""
+    name, addr = parseaddr(sender or '')
+    addr = (addr or name or sender or '').strip().lower()
+    local, at, domain = addr.partition('@')
+    local = re.sub(r'\d+', '#', local.split('+', 1)[0])
+    return f"{local}{at}{domain}"
+
+
+def subject_template(subject: str) -> str:
+    """The subject with reply/forward prefixes removed and anything numeric masked."""
+    subject = _PREFIX_RE.sub('', subject or '')
+    subject = _NUMERIC_RE.sub('#', subject.lower())
+    return _WS_RE.sub(' ', subject).strip()
+
+
+def minhash(text: str) -> tuple:
+    """MinHash signature of the word shingles of `text`."""
+    words = _WORD_RE.findall((text or '').lower())
+    if len(words) < SHINGLE_WORDS:
+        shingles = {' '.join(words)}
+    else:
+        shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+    hashes = [zlib.crc32(s.encode()) for s in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(sig_a: tuple, sig_b: tuple) -> float:
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / len(sig_a)
+
+
+def group(emails: list) -> list:
+    """Splits (seq_id, sender, subject, snippet) tuples into clusters; returns lists of seq_ids in input order."""
+    groups = {}
+    for email in emails:
+        groups.setdefault((sender_key(email[1]), subject_template(email[2])), []).append(email)
+
+    clusters = []
+    for members in groups.values():
+        if not MINHASH_ENABLED or len(members) < MIN_SIZE:
+            clusters.append([m[0] for m in members])
+            continue
+        # Greedy: each email joins the first sub-cluster whose founder's snippet is similar enough
+        subs = []
+        for seq_id, _, _, snippet in members:
+            sig = minhash(snippet)
+            for founder, ids in subs:
+                if similarity(founder, sig) >= MINHASH_THRESHOLD:
+                    ids.append(seq_id)
+                    break
+            else:
+                subs.append((sig, [seq_id]))
+        clusters.extend(ids for _, ids in subs)
+    return clusters
+
+
+def plan(emails: list, representatives: int = None, spot_check: float = None, seed: int = None) -> list:
+    """Which emails of each cluster to classify and which to propagate to.
+
+    `emails` should be newest first (as the tuner selects them), so the representatives
+    are the newest members. Returns one dict per cluster of at least MIN_SIZE emails:
+    {'sampled': [seq_ids to classify], 'propagate': [seq_ids to copy the label to]}.
+    """
+    representatives = max(1, REPRESENTATIVES if representatives is None else representatives)
+    spot_check = SPOT_CHECK if spot_check is None else spot_check
+    rng = random.Random(seed)
+    plans = []
+    for ids in group(emails):
+        if len(ids) < max(MIN_SIZE, representatives + 1):
+            continue
+        rest = ids[representatives:]
+        checks = set(rng.sample(rest, round(len(rest) * spot_check))) if spot_check > 0 else set()
+        plans.append({
+            'sampled': ids[:representatives] + [s for s in rest if s in checks],
+            'propagate': [s for s in rest if s not in checks],
+        })
+    return plans
+
+
+def agreed_status(statuses: list):
+    """The common status of the classified members, or None if they disagree or any failed."""
+    unique = set(statuses)
+    if len(unique) != 1:
+        return None
+    status = unique.pop()
+    return status if status in ('[DELETE]', '[ KEEP ]') else None
@@ -1,9 +1,15 @@
 package main
 
 import (
+	"bufio"
+	"encoding/json"
+	"flag"
 	"fmt"
 	"log"
+	"net/mail"
 	"os"
+	"path/filepath"
+	"sort"
 	"strconv"
 	"strings"
 	"sync"
@@ -18,18 +24,42 @@ import (
 var completedCount uint64
 var total uint64
 
+// Files are named <uid>.eml; the UIDVALIDITY they belong to is recorded here.
+const uidValidityFile = ".uidvalidity"
+
+// Where the last complete sync left off; lets the next run ask only for what changed.
+const syncStateFile = ".sync-state.json"
+
+type syncState struct {
+	UIDValidity   uint32 `json:"uidvalidity"`
+	UIDNext       uint32 `json:"uidnext"`
+	HighestModSeq uint64 `json:"highestmodseq"`
+	Cutoff        string `json:"cutoff"`
+}
+
 func main() {
 	godotenv.Load("../.env")
 	user := os.Getenv("GMAIL_USER")
 	pass := os.Getenv("GMAIL_APP_PASSWORD")
-	storageDir := "/srv/storage/docker/email_data/raw_emails"
+
+	storageDirFlag := flag.String("dir", "/srv/storage/docker/email_data/raw_emails", "directory for <uid>.eml files")
+	numWorkers := flag.Int("workers", 15, "parallel IMAP connections")
+	batchSize := flag.Int("batch", 200, "UIDs claimed and fetched per UID FETCH")
+	migrate := flag.Bool("migrate", false, "re-key existing files (seq-named, or from an old UIDVALIDITY) to UIDs by Message-ID")
+	flag.Parse()
+	storageDir := *storageDirFlag
 
 	// Ensure directory exists
 	if err := os.MkdirAll(storageDir, 0755); err != nil {
 		log.Fatalf("failed to create storage directory %q: %v", storageDir, err)
 	}
 
-	// 1. Initial connection to get the IDs
+	// A re-key interrupted between its rename phases leaves *.eml.rekey files behind
+	if err := finishRekey(storageDir); err != nil {
+		log.Fatalf("failed to finish the interrupted re-key: %v", err)
+	}
+
+	// 1. Initial connection to get the UIDs
 	c, err := imapclient.DialTLS("imap.gmail.com:993", nil)
 	if err != nil {
 		log.Fatalf("failed to dial IMAP server: %v", err)
@@ -37,76 +67,178 @@ func main() {
 	if err := c.Login(user, pass).Wait(); err != nil {
 		log.Fatalf("failed to login: %v", err)
 	}
-	if _, err := c.Select("INBOX", nil).Wait(); err != nil {
+
+	// One STATUS round trip tells us whether anything moved since the last complete sync
+	threeMonthsAgo := time.Now().AddDate(0, -3, 0)
+	statusData, err := c.Status("INBOX", &imap.StatusOptions{
+		UIDNext:       true,
+		UIDValidity:   true,
+		HighestModSeq: c.Caps().Has(imap.CapCondStore),
+	}).Wait()
+	if err != nil {
+		log.Fatalf("status failed: %v", err)
+	}
+	next := syncState{
+		UIDValidity:   statusData.UIDValidity,
+		UIDNext:       uint32(statusData.UIDNext),
+		HighestModSeq: statusData.HighestModSeq,
+		Cutoff:        threeMonthsAgo.Format("2006-01-02"),
+	}
+	prev, havePrev := readSyncState(storageDir)
+	recorded, haveRecorded := readUIDValidity(storageDir)
+	incremental := havePrev && haveRecorded && prev.UIDValidity == next.UIDValidity && recorded == next.UIDValidity
+	if incremental && prev == next {
+		fmt.Println("Mailbox unchanged since the last sync. Nothing to do.")
+		_ = c.Logout().Wait()
+		return
+	}
+
+	selectData, err := c.Select("INBOX", &imap.SelectOptions{ReadOnly: true}).Wait()
+	if err != nil {
 		log.Fatalf("failed to select INBOX: %v", err)
 	}
 
-	threeMonthsAgo := time.Now().AddDate(0, -3, 0)
+	if incremental {
+		missing, candidates := incrementalCandidates(c, storageDir, prev, threeMonthsAgo)
+		if err := c.Logout().Wait(); err != nil {
+			log.Printf("logout error: %v", err)
+		}
+		total = uint64(candidates)
+		completedCount = total - uint64(len(missing))
+		fmt.Printf("Incremental sync: %d candidate(s) since the last run, %d to download.\n", candidates, len(missing))
+		if download(missing, user, pass, storageDir, *numWorkers, *batchSize) {
+			writeSyncState(storageDir, next)
+		}
+		return
+	}
+
 	criteria := &imap.SearchCriteria{Before: threeMonthsAgo}
-	searchData, err := c.Search(criteria, nil).Wait()
+	searchData, err := c.UIDSearch(criteria, nil).Wait()
 	if err != nil {
 		log.Fatalf("search failed: %v", err)
 	}
-	allIds := searchData.AllSeqNums()
+	allUIDs := searchData.AllUIDs()
 
-	// Resume logic: skip IDs that already exist on disk
-	fmt.Println("Checking local storage for existing files...")
-	existingEntries, err := os.ReadDir(storageDir)
-	if err != nil {
-		log.Fatalf("failed to read storage directory %q: %v", storageDir, err)
-	}
-	existingMap := make(map[uint32]bool)
-	for _, entry := range existingEntries {
-		if !entry.IsDir() && strings.HasSuffix(entry.Name(), ".eml") {
-			idStr := strings.TrimSuffix(entry.Name(), ".eml")
-			if idVal, err := strconv.ParseUint(idStr, 10, 32); err == nil {
-				existingMap[uint32(idVal)] = true
+	// Make sure the files on disk are keyed by UIDs of the current UIDVALIDITY
+	existing := listEml(storageDir)
+	needsRekey := len(existing) > 0 && (!haveRecorded || recorded != selectData.UIDValidity)
+	if needsRekey {
+		if !*migrate {
+			if !haveRecorded {
+				log.Fatalf("%s holds %d sequence-numbered files from an older version; re-run with -migrate to re-key them by UID",
+					storageDir, len(existing))
 			}
+			log.Fatalf("UIDVALIDITY changed (%d -> %d); re-run with -migrate to re-key existing files by Message-ID",
+				recorded, selectData.UIDValidity)
+		}
+		if stale := keyedElsewhere(); len(stale) > 0 {
+			log.Fatalf("refusing to re-key: %s still refer to emails by their current file names. "+
+				"Revert the staged emails into %s (processor R3) and export/delete the tuning runs first, then re-run -migrate",
+				strings.Join(stale, " and "), storageDir)
+		}
+		if err := rekeyByMessageID(c, storageDir, existing, *batchSize); err != nil {
+			log.Fatalf("migration failed: %v", err)
 		}
+		existing = listEml(storageDir)
+	}
+	if err := writeUIDValidity(storageDir, selectData.UIDValidity); err != nil {
+		log.Fatalf("failed to record UIDVALIDITY: %v", err)
 	}
 
-	var missingIds []uint32
-	for _, id := range allIds {
-		if !existingMap[id] {
-			missingIds = append(missingIds, id)
+	// Resume logic: skip UIDs that already exist on disk
+	var missing []imap.UID
+	for _, uid := range allUIDs {
+		if !existing[uint32(uid)] {
+			missing = append(missing, uid)
 		}
 	}
 
-	total = uint64(len(allIds))
-	completedCount = uint64(len(existingMap))
+	total = uint64(len(allUIDs))
+	completedCount = total - uint64(len(missing))
 	if err := c.Logout().Wait(); err != nil {
 		log.Printf("logout error: %v", err)
 	}
 
-	if len(missingIds) == 0 {
+	if len(missing) == 0 {
 		fmt.Println("All emails already downloaded. Nothing to do.")
+		writeSyncState(storageDir, next)
 		return
 	}
 
-	fmt.Printf("Found %d total, %d already on disk. Resuming download for %d missing emails...\n",
-		total, len(existingMap), len(missingIds))
+	fmt.Printf("Found %d total, %d already on disk. Resuming download for %d missing emails in batches of %d...\n",
+		total, completedCount, len(missing), *batchSize)
+
+	if download(missing, user, pass, storageDir, *numWorkers, *batchSize) {
+		writeSyncState(storageDir, next)
+	}
+}
+
+// incrementalCandidates asks the server only for what can have changed since `prev`:
+// UIDs at or above the old UIDNEXT, and older mail that crossed the date cutoff since the
+// last run. It checks just those files on disk instead of listing the whole directory.
+func incrementalCandidates(c *imapclient.Client, dir string, prev syncState, cutoff time.Time) ([]imap.UID, int) {
+	seen := make(map[imap.UID]bool)
+	var searches []*imap.SearchCriteria
+	searches = append(searches, &imap.SearchCriteria{
+		UID:    []imap.UIDSet{{imap.UIDRange{Start: imap.UID(prev.UIDNext), Stop: 0}}}, // Stop 0 = "*"
+		Before: cutoff,
+	})
+	if prevCutoff, err := time.Parse("2006-01-02", prev.Cutoff); err == nil && prev.Cutoff != cutoff.Format("2006-01-02") {
+		searches = append(searches, &imap.SearchCriteria{Since: prevCutoff, Before: cutoff})
+	}
+	for _, criteria := range searches {
+		data, err := c.UIDSearch(criteria, nil).Wait()
+		if err != nil {
+			log.Fatalf("incremental search failed: %v", err)
+		}
+		for _, uid := range data.AllUIDs() {
+			seen[uid] = true
+		}
+	}
+
+	var missing []imap.UID
+	for uid := range seen {
+		if _, err := os.Stat(filepath.Join(dir, fmt.Sprintf("%d.eml", uid))); os.IsNotExist(err) {
+			missing = append(missing, uid)
+		}
+	}
+	sort.Slice(missing, func(i, j int) bool { return missing[i] < missing[j] })
+	return missing, len(seen)
+}
+
+// download fetches `missing` with a pool of workers and reports whether every UID was saved.
+func download(missing []imap.UID, user, pass, dir string, numWorkers, batchSize int) bool {
+	if len(missing) == 0 {
+		return true
+	}
+	before := atomic.LoadUint64(&completedCount)
 
-	// 2. Setup Worker Pool
-	idChan := make(chan uint32, len(missingIds))
+	// 2. Setup Worker Pool: workers claim contiguous runs of UIDs, one UID FETCH each
+	batches := make(chan []imap.UID, len(missing)/batchSize+1)
 	var wg sync.WaitGroup
-	numWorkers := 15 // Increased worker count per request
 
 	for w := 1; w <= numWorkers; w++ {
 		wg.Add(1)
-		go worker(w, idChan, user, pass, storageDir, &wg)
+		go worker(w, batches, user, pass, dir, &wg)
 	}
 
-	// 3. Feed only missing IDs into the channel
-	for _, id := range missingIds {
-		idChan <- id
+	// 3. Feed only missing UIDs into the channel
+	for start := 0; start < len(missing); start += batchSize {
+		end := start + batchSize
+		if end > len(missing) {
+			end = len(missing)
+		}
+		batches <- missing[start:end]
 	}
-	close(idChan) // Workers will stop when channel is empty
+	close(batches) // Workers will stop when channel is empty
 
 	wg.Wait()
-	fmt.Println("\nAll workers finished.")
+	saved := atomic.LoadUint64(&completedCount) - before
+	fmt.Printf("\nAll workers finished. %d/%d saved.\n", saved, len(missing))
+	return saved == uint64(len(missing))
 }
 
-func worker(id int, ids <-chan uint32, user, pass, dir string, wg *sync.WaitGroup) {
+func worker(id int, batches <-chan []imap.UID, user, pass, dir string, wg *sync.WaitGroup) {
 	defer wg.Done()
 
 	// Each worker opens ONE connection
@@ -124,55 +256,343 @@ func worker(id int, ids <-chan uint32, user, pass, dir string, wg *sync.WaitGrou
 		log.Printf("Worker %d login failed: %v", id, err)
 		return
 	}
-	if _, err := c.Select("INBOX", nil).Wait(); err != nil {
+	if _, err := c.Select("INBOX", &imap.SelectOptions{ReadOnly: true}).Wait(); err != nil {
 		log.Printf("Worker %d select failed: %v", id, err)
 		return
 	}
 
-	for seqNum := range ids {
-		section := &imap.FetchItemBodySection{}
-		fetchOptions := &imap.FetchOptions{
-			BodySection: []*imap.FetchItemBodySection{section},
+	section := &imap.FetchItemBodySection{Peek: true}
+	fetchOptions := &imap.FetchOptions{
+		UID:         true,
+		BodySection: []*imap.FetchItemBodySection{section},
+	}
+
+	for batch := range batches {
+		// One round trip for the whole run of UIDs
+		cmd := c.Fetch(imap.UIDSetNum(batch...), fetchOptions)
+		for {
+			msg := cmd.Next()
+			if msg == nil {
+				break
+			}
+			buf, err := msg.Collect()
+			if err != nil {
+				log.Printf("Worker %d collect failed in batch %d-%d: %v", id, batch[0], batch[len(batch)-1], err)
+				continue
+			}
+			bodyBytes := buf.FindBodySection(section)
+			if bodyBytes == nil {
+				log.Printf("Worker %d no body for UID %d", id, buf.UID)
+				continue
+			}
+
+			// Save to disk; write then rename so a crash never leaves a truncated <uid>.eml
+			filename := filepath.Join(dir, fmt.Sprintf("%d.eml", buf.UID))
+			if err := os.WriteFile(filename+".part", bodyBytes, 0644); err != nil {
+				log.Printf("Worker %d write failed for %s: %v", id, filename, err)
+				continue
+			}
+			if err := os.Rename(filename+".part", filename); err != nil {
+				log.Printf("Worker %d rename failed for %s: %v", id, filename, err)
+				continue
+			}
+
+			// Progress: atomic increment and periodic status
+			newCount := atomic.AddUint64(&completedCount, 1)
+			if newCount%100 == 0 {
+				fmt.Printf("\rProgress: %d / %d (%.2f%%)", newCount, total, float64(newCount)/float64(total)*100)
+			}
 		}
 
-		cmd := c.Fetch(imap.SeqSetNum(seqNum), fetchOptions)
-		msg := cmd.Next()
-		if msg == nil {
-			// Ensure command is closed before continuing
-			_ = cmd.Close()
-			continue
+		// Close the fetch command for this batch
+		if err := cmd.Close(); err != nil {
+			log.Printf("Worker %d fetch close error for batch %d-%d: %v", id, batch[0], batch[len(batch)-1], err)
 		}
+	}
+}
+
+// listEml returns the numeric names of the <n>.eml files in dir.
+func listEml(dir string) map[uint32]bool {
+	entries, err := os.ReadDir(dir)
+	if err != nil {
+		log.Fatalf("failed to read storage directory %q: %v", dir, err)
+	}
+	out := make(map[uint32]bool)
+	for _, entry := range entries {
+		if !entry.IsDir() && strings.HasSuffix(entry.Name(), ".eml") {
+			idStr := strings.TrimSuffix(entry.Name(), ".eml")
+			if idVal, err := strconv.ParseUint(idStr, 10, 32); err == nil {
+				out[uint32(idVal)] = true
+			}
+		}
+	}
+	return out
+}
+
+func readUIDValidity(dir string) (uint32, bool) {
+	data, err := os.ReadFile(filepath.Join(dir, uidValidityFile))
+	if err != nil {
+		return 0, false
+	}
+	v, err := strconv.ParseUint(strings.TrimSpace(string(data)), 10, 32)
+	if err != nil {
+		return 0, false
+	}
+	return uint32(v), true
+}
+
+func readSyncState(dir string) (syncState, bool) {
+	var st syncState
+	data, err := os.ReadFile(filepath.Join(dir, syncStateFile))
+	if err != nil {
+		return st, false
+	}
+	if err := json.Unmarshal(data, &st); err != nil {
+		return st, false
+	}
+	return st, true
+}
+
+// writeSyncState is only called after a complete run, so a failed run is retried in full next time.
+func writeSyncState(dir string, st syncState) {
+	data, err := json.MarshalIndent(st, "", "  ")
+	if err != nil {
+		log.Printf("failed to encode sync state: %v", err)
+		return
+	}
+	tmp := filepath.Join(dir, syncStateFile+".tmp")
+	if err := os.WriteFile(tmp, data, 0644); err != nil {
+		log.Printf("failed to write sync state: %v", err)
+		return
+	}
+	if err := os.Rename(tmp, filepath.Join(dir, syncStateFile)); err != nil {
+		log.Printf("failed to write sync state: %v", err)
+	}
+}
+
+func writeUIDValidity(dir string, v uint32) error {
+	return os.WriteFile(filepath.Join(dir, uidValidityFile), []byte(fmt.Sprintf("%d\n", v)), 0644)
+}
+
+func fileMessageID(path string) string {
+	f, err := os.Open(path)
+	if err != nil {
+		return ""
+	}
+	defer f.Close()
+	msg, err := mail.ReadMessage(bufio.NewReader(f))
+	if err != nil {
+		return ""
+	}
+	return strings.Trim(strings.TrimSpace(msg.Header.Get("Message-Id")), "<>")
+}
 
-		buf, err := msg.Collect()
+// rekeyByMessageID renames existing <n>.eml files (sequence numbers from the old
+// downloader, or UIDs from a previous UIDVALIDITY) to <uid>.eml by matching their
+// Message-ID against the server. Unmatched files, and local duplicates of a Message-ID
+// beyond the server's copies, go to unmatched/. The old_name,uid mapping is written to
+// rekey-<timestamp>.csv before anything is renamed, so an interrupted run is finished by
+// finishRekey on the next start (and older tuning CSVs can be translated with it).
+func rekeyByMessageID(c *imapclient.Client, dir string, existing map[uint32]bool, batchSize int) error {
+	fmt.Printf("Re-keying %d existing files by Message-ID...\n", len(existing))
+
+	// Message-ID -> UIDs for the whole mailbox, a batch of UIDs per round trip
+	all, err := c.UIDSearch(&imap.SearchCriteria{}, nil).Wait()
+	if err != nil {
+		return fmt.Errorf("search all: %w", err)
+	}
+	uids := all.AllUIDs()
+	byMessageID := make(map[string][]imap.UID, len(uids))
+	for start := 0; start < len(uids); start += batchSize * 5 {
+		end := start + batchSize*5
+		if end > len(uids) {
+			end = len(uids)
+		}
+		cmd := c.Fetch(imap.UIDSetNum(uids[start:end]...), &imap.FetchOptions{UID: true, Envelope: true})
+		msgs, err := cmd.Collect()
 		if err != nil {
-			log.Printf("Worker %d collect failed for %d: %v", id, seqNum, err)
-			_ = cmd.Close()
-			continue
+			return fmt.Errorf("fetch envelopes: %w", err)
 		}
-		bodyBytes := buf.FindBodySection(section)
-		if bodyBytes == nil {
-			log.Printf("Worker %d no body for %d", id, seqNum)
-			_ = cmd.Close()
-			continue
+		for _, m := range msgs {
+			if m.Envelope != nil && m.Envelope.MessageID != "" {
+				id := strings.Trim(m.Envelope.MessageID, "<>")
+				byMessageID[id] = append(byMessageID[id], m.UID)
+			}
 		}
+	}
+
+	names := make([]uint32, 0, len(existing))
+	for n := range existing {
+		names = append(names, n)
+	}
+	sort.Slice(names, func(i, j int) bool { return names[i] < names[j] })
 
-		// Save to disk
-		filename := fmt.Sprintf("%s/%d.eml", dir, seqNum)
-		if err := os.WriteFile(filename, bodyBytes, 0644); err != nil {
-			log.Printf("Worker %d write failed for %s: %v", id, filename, err)
-			_ = cmd.Close()
+	unmatchedDir := filepath.Join(dir, "unmatched")
+	mapping := []string{"old_name,uid"}
+	var moves []rekeyMove
+	unmatched, duplicates := 0, 0
+	for _, n := range names {
+		path := filepath.Join(dir, fmt.Sprintf("%d.eml", n))
+		// Each server copy of a Message-ID is claimed by at most one local file
+		id := fileMessageID(path)
+		candidates, known := byMessageID[id]
+		if len(candidates) == 0 {
+			if known {
+				duplicates++
+			}
+			if err := moveUnmatched(path, unmatchedDir, n); err != nil {
+				return err
+			}
+			unmatched++
 			continue
 		}
+		uid := candidates[0]
+		byMessageID[id] = candidates[1:]
+		moves = append(moves, newRekeyMove(dir, n, uint32(uid)))
+		mapping = append(mapping, fmt.Sprintf("%d.eml,%d", n, uid))
+	}
 
-		// Close the fetch command for this iteration
-		if err := cmd.Close(); err != nil {
-			log.Printf("Worker %d fetch close error for %d: %v", id, seqNum, err)
+	mapName := fmt.Sprintf("rekey-%s.csv", time.Now().Format("20060102-150405"))
+	if err := os.WriteFile(filepath.Join(dir, mapName), []byte(strings.Join(mapping, "\n")+"\n"), 0644); err != nil {
+		return err
+	}
+	if err := writeRekeyPending(dir, mapName, false); err != nil {
+		return err
+	}
+	if err := applyRekey(dir, mapName, moves, false); err != nil {
+		return err
+	}
+	fmt.Printf("Re-keyed %d files, %d unmatched (%d of them duplicates; moved to %s). Mapping saved to %s\n",
+		len(moves), unmatched, duplicates, unmatchedDir, filepath.Join(dir, mapName))
+	return nil
+}
+
+// Marks a re-key in progress: the mapping CSV's name, then "renamed" once every file
+// has its temporary name.
+const rekeyPendingFile = ".rekey-pending"
+
+type rekeyMove struct{ from, tmp, to string }
+
+func newRekeyMove(dir string, n, uid uint32) rekeyMove {
+	return rekeyMove{
+		from: filepath.Join(dir, fmt.Sprintf("%d.eml", n)),
+		tmp:  filepath.Join(dir, fmt.Sprintf("%d.eml.rekey", uid)),
+		to:   filepath.Join(dir, fmt.Sprintf("%d.eml", uid)),
+	}
+}
+
+func writeRekeyPending(dir, mapName string, renamed bool) error {
+	content := mapName + "\n"
+	if renamed {
+		content += "renamed\n"
+	}
+	return os.WriteFile(filepath.Join(dir, rekeyPendingFile), []byte(content), 0644)
+}
+
+// applyRekey renames in two phases so an old name that equals another file's new UID is
+// never overwritten. Both phases skip files that are already done, so it can be re-run.
+func applyRekey(dir, mapName string, moves []rekeyMove, renamed bool) error {
+	if !renamed {
+		for _, m := range moves {
+			if err := os.Rename(m.from, m.tmp); err != nil && !os.IsNotExist(err) {
+				return err
+			}
+		}
+		if err := writeRekeyPending(dir, mapName, true); err != nil {
+			return err
 		}
+	}
+	for _, m := range moves {
+		if err := os.Rename(m.tmp, m.to); err != nil && !os.IsNotExist(err) {
+			return err
+		}
+	}
+	return os.Remove(filepath.Join(dir, rekeyPendingFile))
+}
 
-		// Progress: atomic increment and periodic status
-		newCount := atomic.AddUint64(&completedCount, 1)
-		if newCount%100 == 0 {
-			fmt.Printf("\rProgress: %d / %d (%.2f%%)", newCount, total, float64(newCount)/float64(total)*100)
+// finishRekey completes a re-key that was interrupted, from the mapping it recorded;
+// until then the *.eml.rekey files are invisible to listEml.
+func finishRekey(dir string) error {
+	data, err := os.ReadFile(filepath.Join(dir, rekeyPendingFile))
+	if os.IsNotExist(err) {
+		return nil
+	}
+	if err != nil {
+		return err
+	}
+	lines := strings.Split(strings.TrimSpace(string(data)), "\n")
+	mapName := lines[0]
+	raw, err := os.ReadFile(filepath.Join(dir, mapName))
+	if err != nil {
+		return fmt.Errorf("read %s: %w", mapName, err)
+	}
+	var moves []rekeyMove
+	for _, line := range strings.Split(strings.TrimSpace(string(raw)), "\n")[1:] {
+		oldName, uidStr, _ := strings.Cut(line, ",")
+		n, err1 := strconv.ParseUint(strings.TrimSuffix(oldName, ".eml"), 10, 32)
+		uid, err2 := strconv.ParseUint(uidStr, 10, 32)
+		if err1 != nil || err2 != nil {
+			return fmt.Errorf("bad line in %s: %q", mapName, line)
+		}
+		moves = append(moves, newRekeyMove(dir, uint32(n), uint32(uid)))
+	}
+	fmt.Printf("Finishing an interrupted re-key of %d files from %s...\n", len(moves), mapName)
+	return applyRekey(dir, mapName, moves, len(lines) > 1 && lines[1] == "renamed")
+}
+
+// moveUnmatched parks <n>.eml in unmatched/ without overwriting a file an earlier
+// migration left there.
+func moveUnmatched(path, unmatchedDir string, n uint32) error {
+	if err := os.MkdirAll(unmatchedDir, 0755); err != nil {
+		return err
+	}
+	dst := filepath.Join(unmatchedDir, fmt.Sprintf("%d.eml", n))
+	for i := 1; ; i++ {
+		if _, err := os.Stat(dst); os.IsNotExist(err) {
+			break
+		}
+		dst = filepath.Join(unmatchedDir, fmt.Sprintf("%d.%d.eml", n, i))
+	}
+	return os.Rename(path, dst)
+}
+
+// keyedElsewhere lists what outside the storage directory refers to its emails by file
+// name: staged copies and tuning runs (same defaults as the Python tools). Re-keying
+// would silently point those at different emails.
+func keyedElsewhere() []string {
+	var found []string
+	for _, d := range []string{
+		envOr("STAGING_TO_DELETE_DIR", "/srv/storage/docker/email_data/staging/to_delete"),
+		envOr("STAGING_KEEP_DIR", "/srv/storage/docker/email_data/staging/to_keep"),
+	} {
+		if n := countEml(d); n > 0 {
+			found = append(found, fmt.Sprintf("%d staged email(s) in %s", n, d))
+		}
+	}
+	results := envOr("TUNING_RESULTS_DIR", "../tuning_results")
+	if runs, _ := filepath.Glob(filepath.Join(results, "tuning_*.csv")); len(runs) > 0 {
+		found = append(found, fmt.Sprintf("%d tuning run(s) in %s", len(runs), results))
+	}
+	return found
+}
+
+func envOr(key, fallback string) string {
+	if v := os.Getenv(key); v != "" {
+		return v
+	}
+	return fallback
+}
+
+func countEml(dir string) int {
+	entries, err := os.ReadDir(dir)
+	if err != nil {
+		return 0
+	}
+	n := 0
+	for _, entry := range entries {
+		if !entry.IsDir() && strings.HasSuffix(entry.Name(), ".eml") {
+			n++
 		}
 	}
+	return n
 }
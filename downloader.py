@@ -1,49 +1,293 @@
-import imaplib
+import os
+import json
+import queue
 import mailbox
+import threading
 from datetime import date, timedelta
+import imap_client
+import mbox_reader
 
-def fetch_all_older_than_90_days(user, password, full_file_path):
+# UIDs fetched per UID FETCH round trip, and parallel IMAP connections
+BATCH_SIZE = int(os.environ.get('DOWNLOAD_BATCH_SIZE', '200'))
+CONNECTIONS = int(os.environ.get('DOWNLOAD_CONNECTIONS', '1'))
+
+
+def _sidecar_path(full_file_path):
+    return f"{full_file_path}.uids"
+
+
+def _load_sidecar(full_file_path):
+    """Reads the sidecar index of already-saved messages.
+
+    Format (one entry per line): 'V <uidvalidity>' starts a UIDVALIDITY epoch,
+    'M <uid>\\t<message-id>' records a saved message and 'S <bytes>' marks the mbox size
+    at the last durable checkpoint. Returns (uidvalidity, saved_uids, message_ids, size).
+    """
+    validity = None
+    uids = set()
+    message_ids = set()
+    size = None
+    path = _sidecar_path(full_file_path)
+    if not os.path.exists(path):
+        return validity, uids, message_ids, size
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # torn final line from a crash
+            kind, _, rest = line.rstrip('\n').partition(' ')
+            if kind == 'V':
+                validity = int(rest)
+                uids = set()  # UIDs from an older epoch mean nothing now
+            elif kind == 'M':
+                uid, _, msgid = rest.partition('\t')
+                uids.add(int(uid))
+                if msgid:
+                    message_ids.add(msgid)
+            elif kind == 'S':
+                size = int(rest)
+    return validity, uids, message_ids, size
+
+
+def _start_epoch(full_file_path, validity, matched):
+    """Appends a 'V' line for a new UIDVALIDITY plus an 'M' line for each {uid: message_id} already saved."""
+    with open(_sidecar_path(full_file_path), 'a', encoding='utf-8') as sidecar:
+        sidecar.write(f"V {validity}\n")
+        sidecar.write(''.join(f"M {uid}\t{msgid}\n" for uid, msgid in sorted(matched.items())))
+        sidecar.flush()
+        os.fsync(sidecar.fileno())
+
+
+def _message_ids_for(M, uids, batch_size):
+    """Fetches just the Message-ID header for `uids`, in batches."""
+    out = {}
+    for batch in imap_client.chunks(uids, batch_size):
+        status, data = M.uid('fetch', imap_client.compress_uids(batch), '(UID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])')
+        if status != 'OK':
+            continue
+        for msg in imap_client.parse_fetch(data):
+            hdr = msg.get('BODY[HEADER.FIELDS (MESSAGE-ID)]') or b''
+            out[msg['UID']] = imap_client.header_message_id(hdr)
+    return out
+
+
+def _fetch_worker(user, password, batches, results, errors):
+    """One IMAP connection: takes UID batches off `batches` and puts (uid, raw) onto `results`."""
+    try:
+        M = imap_client.connect(user, password, readonly=True)
+    except Exception as e:
+        errors.append(f"connect failed: {e}")
+        results.put(None)
+        return
+    try:
+        while True:
+            try:
+                batch = batches.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                status, data = M.uid('fetch', imap_client.compress_uids(batch), '(UID RFC822)')
+                if status != 'OK':
+                    raise RuntimeError(f"FETCH returned {status}")
+                for msg in imap_client.parse_fetch(data):
+                    if msg.get('RFC822') is not None:
+                        results.put((msg['UID'], bytes(msg['RFC822'])))
+            except Exception as e:
+                errors.append(f"batch {batch[0]}-{batch[-1]}: {e}")
+    finally:
+        try:
+            M.logout()
+        except Exception:
+            pass
+        results.put(None)
+
+
+def _state_path(full_file_path):
+    return f"{full_file_path}.sync.json"
+
+
+def _load_state(full_file_path):
+    try:
+        with open(_state_path(full_file_path), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_state(full_file_path, state):
+    """Writes the sync state atomically (tmp file + rename)."""
+    tmp = _state_path(full_file_path) + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, _state_path(full_file_path))
+
+
+def _imap_date(d):
+    return d.strftime("%d-%b-%Y")
+
+
+def fetch_all_older_than_90_days(user, password, full_file_path, connections=None, batch_size=None):
+    """Downloads every INBOX message older than 90 days into an mbox, resumably.
+
+    UIDs are fetched in batches (one round trip per `batch_size` messages), optionally
+    over several connections, and appended to the mbox by a single writer. A sidecar
+    '<mbox>.uids' records what has been saved so a re-run appends only what is missing.
+
+    '<mbox>.sync.json' keeps UIDVALIDITY, UIDNEXT, HIGHESTMODSEQ (when the server has
+    CONDSTORE) and the date cutoff of the last complete run. If none of them moved, the
+    run ends after a single STATUS; otherwise only new UIDs and messages that have
+    crossed the 90-day line since then are searched for.
+
+    Returns counts: 'found', 'already', 'saved', 'errors' (failed batches) and 'error'
+    (the message of an error that stopped the run, else None).
+    """
+    connections = max(1, connections or CONNECTIONS)
+    batch_size = max(1, batch_size or BATCH_SIZE)
+    result = {"mbox": full_file_path, "found": 0, "already": 0, "saved": 0, "errors": 0, "error": None}
     print(f"\nConnecting to Gmail...")
     try:
-        M = imaplib.IMAP4_SSL('imap.gmail.com')
-        M.login(user, password)
-        M.select('INBOX')
-
-        three_months_ago = (date.today() - timedelta(days=90)).strftime("%d-%b-%Y")
-        search_query = f'(BEFORE "{three_months_ago}")'
-        
-        status, data = M.search(None, search_query)
-        email_ids = data[0].split()
-        
-        total = len(email_ids)
+        M = imap_client.connect(user, password, mailbox=None)
+        status = imap_client.status(M, 'INBOX')
+        validity = status.get('UIDVALIDITY', 0)
+        cutoff = date.today() - timedelta(days=90)
+        new_state = {
+            "uidvalidity": validity,
+            "uidnext": status.get('UIDNEXT'),
+            "highestmodseq": status.get('HIGHESTMODSEQ'),
+            "cutoff": cutoff.isoformat(),
+        }
+        state = _load_state(full_file_path)
+        same_epoch = bool(state) and state.get("uidvalidity") == validity and os.path.exists(full_file_path)
+
+        if same_epoch and all(state.get(k) == new_state[k] for k in ("uidnext", "highestmodseq", "cutoff")):
+            print("Mailbox unchanged since the last sync. Nothing to do.")
+            M.logout()
+            return result
+
+        imap_client.select(M, 'INBOX', readonly=True)
+
+        if same_epoch:
+            # Only what can have changed: new UIDs, and older mail that crossed the cutoff since last time
+            uids = set()
+            if state.get("uidnext") != new_state["uidnext"]:
+                uids.update(imap_client.search_uids(
+                    M, f'(UID {state["uidnext"]}:* BEFORE "{_imap_date(cutoff)}")'))
+            if state.get("cutoff") != new_state["cutoff"]:
+                prev_cutoff = date.fromisoformat(state["cutoff"])
+                uids.update(imap_client.search_uids(
+                    M, f'(SINCE "{_imap_date(prev_cutoff)}" BEFORE "{_imap_date(cutoff)}")'))
+            uids = sorted(uids)
+            print(f"Incremental sync: {len(uids)} candidate email(s) since the last run.")
+        else:
+            search_query = f'(BEFORE "{_imap_date(cutoff)}")'
+            uids = imap_client.search_uids(M, search_query)
+
+        total = len(uids)
+        result["found"] = total
         if total == 0:
             print("No emails found matching the criteria.")
-            return
+            M.logout()
+            if os.path.exists(full_file_path):
+                _save_state(full_file_path, new_state)
+            return result
+
+        saved_validity, saved_uids, saved_msgids, saved_size = _load_sidecar(full_file_path)
+        if saved_validity is not None and saved_validity != validity and saved_msgids:
+            # UIDs were renumbered server-side; fall back to matching by Message-ID
+            print("UIDVALIDITY changed since the last run; matching saved emails by Message-ID...")
+            ids = _message_ids_for(M, uids, batch_size)
+            missing = [u for u in uids if not ids.get(u) or ids[u] not in saved_msgids]
+            # Record the matches under their new UIDs, so a later full run (or imap_apply)
+            # sees them as saved in this epoch rather than downloading them again
+            _start_epoch(full_file_path, validity, {u: ids[u] for u in uids if ids.get(u) in saved_msgids})
+            saved_validity = validity
+        else:
+            missing = [u for u in uids if u not in saved_uids]
+        M.logout()
+        result["already"] = total - len(missing)
+
+        if not missing:
+            print(f"All {total} emails already saved in {full_file_path}. Nothing to do.")
+            _save_state(full_file_path, new_state)
+            return result
+
+        print(f"Found {total} emails, {total - len(missing)} already saved. "
+              f"Downloading {len(missing)} to {full_file_path} ({connections} connection(s), batches of {batch_size})...")
 
-        print(f"Found {total} emails. Starting download to {full_file_path}...")
+        # Drop anything appended after the last durable checkpoint (a crash mid-batch)
+        if saved_size is not None and os.path.exists(full_file_path) and os.path.getsize(full_file_path) > saved_size:
+            mbox_reader.discard_after(full_file_path, saved_size)
+            with open(full_file_path, 'r+b') as f:
+                f.truncate(saved_size)
 
-        # Open an mbox file for writing
+        batches = queue.Queue()
+        for batch in imap_client.chunks(missing, batch_size):
+            batches.put(batch)
+        # Bounded so fetchers can't run far ahead of the writer and balloon memory
+        results = queue.Queue(maxsize=batch_size * 2)
+        errors = []
+        workers = [
+            threading.Thread(target=_fetch_worker, args=(user, password, batches, results, errors), daemon=True)
+            for _ in range(connections)
+        ]
+        for t in workers:
+            t.start()
+
+        # Open an mbox file for writing (appends to an existing archive)
         mbox = mailbox.mbox(full_file_path)
         mbox.lock()
-
+        saved = 0
+        pending_lines = []
         try:
-            for i, num in enumerate(email_ids):
-                status, data = M.fetch(num, '(RFC822)')
-                raw_email = data[0][1]
-                
-                # Add to mbox
-                mbox.add(raw_email)
-                
-                if (i + 1) % 100 == 0:
-                    print(f"Progress: {i + 1}/{total} downloaded...")
-            
-            mbox.flush()
+            with open(_sidecar_path(full_file_path), 'a', encoding='utf-8') as sidecar:
+                if saved_validity != validity:
+                    sidecar.write(f"V {validity}\n")
+
+                def checkpoint():
+                    mbox.flush()
+                    sidecar.write(''.join(pending_lines))
+                    sidecar.write(f"S {os.path.getsize(full_file_path)}\n")
+                    sidecar.flush()
+                    os.fsync(sidecar.fileno())
+                    pending_lines.clear()
+
+                finished = 0
+                while finished < len(workers):
+                    item = results.get()
+                    if item is None:
+                        finished += 1
+                        continue
+                    uid, raw_email = item
+
+                    # Add to mbox
+                    mbox.add(raw_email)
+                    msgid = imap_client.header_message_id(raw_email.split(b'\r\n\r\n', 1)[0])
+                    pending_lines.append(f"M {uid}\t{msgid}\n")
+                    saved += 1
+
+                    if saved % batch_size == 0:
+                        checkpoint()
+                    if saved % 100 == 0:
+                        print(f"Progress: {saved}/{len(missing)} downloaded...")
+
+                checkpoint()
         finally:
             mbox.unlock()
             mbox.close()
 
-        M.logout()
-        print(f"\nFinished! {total} emails saved to {full_file_path}")
+        for err in errors:
+            print(f"Fetch error: {err}")
+        result["saved"] = saved
+        result["errors"] = len(errors)
+        # Index the new tail now so the tuner and processor can open the archive instantly
+        indexed = mbox_reader.refresh(full_file_path)
+        print(f"Offset index: {indexed['total']} messages ({indexed['indexed']} new).")
+        if not errors:
+            # Only a complete run may advance the sync point
+            _save_state(full_file_path, new_state)
+        print(f"\nFinished! {saved} new emails saved to {full_file_path} "
+              f"({total - len(missing) + saved}/{total} of this run's matches saved)")
 
     except Exception as e:
         print(f"An error occurred: {e}")
+        result["error"] = str(e)
+    return result
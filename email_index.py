@@ -0,0 +1,178 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+import fast_parser
+import snippet
+import sqlite_local
+
+# Persistent metadata + snippet index over a raw_emails directory. Rows are keyed by
+# seq_id and carry size/mtime so refresh() only reparses new or changed files, across
+# all cores. The database sits next to the directory (raw_emails.index.sqlite) so
+# writing it never touches the directory's own mtime.
+INDEX_ENABLED = os.environ.get('EMAIL_INDEX', '1') != '0'
+# Bump when the extracted fields change so existing indexes are rebuilt
+PARSER_VERSION = '2'
+# Below this many changed files, parse inline rather than paying for a process pool
+POOL_THRESHOLD = 64
+
+
+def _parser_key() -> str:
+    # Snippet settings change what is stored, so they invalidate the index too
+    return f"{PARSER_VERSION}/clean={int(snippet.CLEAN_ENABLED)}/budget={snippet.TOKEN_BUDGET}"
+
+
+def index_path(storage_dir: str) -> str:
+    storage_dir = os.path.abspath(storage_dir)
+    return os.environ.get('EMAIL_INDEX_PATH') or f"{storage_dir}.index.sqlite"
+
+
+def _init(conn):
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS emails ('
+        ' seq_id INTEGER PRIMARY KEY,'
+        ' size INTEGER,'
+        ' mtime_ns INTEGER,'
+        ' message_id TEXT,'
+        ' sender TEXT,'
+        ' subject TEXT,'
+        ' date TEXT,'
+        ' snippet TEXT,'
+        ' headers TEXT)'
+    )
+
+
+def _connect(storage_dir: str) -> sqlite3.Connection:
+    return sqlite_local.connect(index_path(storage_dir), _init)
+
+
+def _get_meta(conn, key):
+    row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(conn, key, value):
+    conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
+
+
+def _index_one(args):
+    """Worker: parses one file into an index row. Runs in a separate process."""
+    path, seq_id, size, mtime_ns = args
+    try:
+        info = fast_parser.parse_path(path)
+        return (
+            seq_id, size, mtime_ns,
+            str(info['message_id']), str(info['sender']), str(info['subject']), str(info['date']),
+            info['snippet'], json.dumps({k: str(v) for k, v in info['headers'].items()}),
+        )
+    except Exception as e:
+        return (seq_id, size, mtime_ns, '(Error)', 'Error', 'Error', '(no date)', str(e), '{}')
+
+
+def refresh(storage_dir: str, workers: int = None, force: bool = False) -> dict:
+    """Brings the index in line with the directory; only new or changed files are parsed.
+
+    Every file's size and mtime are checked on each refresh: the directory's own mtime
+    only moves when files are added or removed, so it would miss a file that was indexed
+    while the downloader was still writing it. `force` reparses everything.
+    """
+    conn = _connect(storage_dir)
+    stats = {"total": 0, "parsed": 0, "removed": 0}
+
+    if force or _get_meta(conn, 'parser_version') != _parser_key():
+        conn.execute('DELETE FROM emails')
+        _set_meta(conn, 'parser_version', _parser_key())
+        conn.commit()
+
+    on_disk = {}
+    with os.scandir(storage_dir) as it:
+        for entry in it:
+            name = entry.name
+            if not name.endswith('.eml') or not name[:-4].isdigit():
+                continue
+            st = entry.stat()
+            on_disk[int(name[:-4])] = (entry.path, st.st_size, st.st_mtime_ns)
+
+    known = {row[0]: (row[1], row[2]) for row in conn.execute('SELECT seq_id, size, mtime_ns FROM emails')}
+    removed = [(seq,) for seq in known if seq not in on_disk]
+    todo = [
+        (path, seq, size, mtime_ns)
+        for seq, (path, size, mtime_ns) in on_disk.items()
+        if known.get(seq) != (size, mtime_ns)
+    ]
+
+    if removed:
+        conn.executemany('DELETE FROM emails WHERE seq_id = ?', removed)
+
+    if todo:
+        if len(todo) < POOL_THRESHOLD:
+            rows = map(_index_one, todo)
+            _insert(conn, rows)
+        else:
+            workers = workers or os.cpu_count() or 1
+            print(f"Indexing {len(todo)} email(s) on {workers} cores...")
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                _insert(conn, pool.map(_index_one, todo, chunksize=64))
+
+    conn.commit()
+
+    stats["total"] = len(on_disk)
+    stats["parsed"] = len(todo)
+    stats["removed"] = len(removed)
+    return stats
+
+
+def _insert(conn, rows, batch: int = 1000):
+    buf = []
+    for row in rows:
+        buf.append(row)
+        if len(buf) >= batch:
+            conn.executemany('INSERT OR REPLACE INTO emails VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', buf)
+            buf = []
+    if buf:
+        conn.executemany('INSERT OR REPLACE INTO emails VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', buf)
+
+
+def latest(storage_dir: str, count: int = 50) -> list:
+    """Filenames of the newest `count` emails (highest seq_id first), straight from the index."""
+    rows = _connect(storage_dir).execute(
+        'SELECT seq_id FROM emails ORDER BY seq_id DESC LIMIT ?', (count,)
+    ).fetchall()
+    return [f"{r[0]}.eml" for r in rows]
+
+
+def lookup(storage_dir: str, seq_ids) -> dict:
+    """Returns {seq_id: row dict} for the given ids that are in the index."""
+    conn = _connect(storage_dir)
+    out = {}
+    seq_ids = list(seq_ids)
+    for i in range(0, len(seq_ids), 500):
+        chunk = seq_ids[i:i + 500]
+        marks = ','.join('?' * len(chunk))
+        for row in conn.execute(
+            f'SELECT seq_id, message_id, sender, subject, date, snippet, headers '
+            f'FROM emails WHERE seq_id IN ({marks})', chunk
+        ):
+            out[row[0]] = {
+                'message_id': row[1],
+                'sender': row[2],
+                'subject': row[3],
+                'date': row[4],
+                'snippet': row[5],
+                'headers': json.loads(row[6] or '{}'),
+            }
+    return out
+
+
+if __name__ == '__main__':
+    # Usage: python email_index.py [RAW_DIR]  (build / update the index)
+    target = sys.argv[1] if len(sys.argv) > 1 else os.environ.get(
+        'EMAIL_STORAGE_DIR', '/srv/storage/docker/email_data/raw_emails')
+    start = time.time()
+    res = refresh(target)
+    print(f"Index {index_path(target)}: {res['total']} emails, {res['parsed']} parsed, "
+          f"{res['removed']} removed in {time.time() - start:.1f}s")
@@ -0,0 +1,147 @@
+import os
+import fast_parser
+import mbox_reader
+import pack_store
+
+# Where raw emails are read from: a directory of <seq>.eml files, a single .mbox archive
+# read in place through mbox_reader, or a pack directory (pack_store). Either way an
+# email is addressed as <source>/<seq>.eml, so for an mbox or pack the "path" names
+# message <seq> inside it and the tuner, processor and kNN stage don't need to know
+# which kind they have. In a pack, <pack>/to_delete/<seq>.eml and <pack>/to_keep/<seq>.eml
+# name messages carrying that staging flag.
+
+
+def is_mbox(source: str) -> bool:
+    return os.path.isfile(source)
+
+
+def is_pack(source: str) -> bool:
+    return pack_store.is_pack(source)
+
+
+def is_archive(source: str) -> bool:
+    """True for sources that aren't a plain directory of .eml files."""
+    return is_mbox(source) or is_pack(source)
+
+
+def _locate(source: str):
+    """(module, container, stage) for an mbox, a pack or a pack's staging pseudo-directory, else None."""
+    if is_mbox(source):
+        return mbox_reader, source, None
+    if is_pack(source):
+        return pack_store, source, None
+    parent, name = os.path.split(source)
+    if name in pack_store.STAGE_DIRS and is_pack(parent):
+        return pack_store, parent, pack_store.STAGE_DIRS[name]
+    return None
+
+
+def numbering(source: str) -> str:
+    """What a source's <seq> numbers mean; results only carry over between sources numbered alike.
+
+    An mbox numbers its messages 1..N in file order. A directory or pack named by Gmail
+    UIDs has a .uidvalidity file and shares its numbers with every copy of that epoch
+    (e.g. a pack made from the directory). Anything else is numbered only for itself.
+    """
+    if is_mbox(source):
+        return f"mbox:{os.path.abspath(source)}"
+    try:
+        with open(os.path.join(source, pack_store.UIDVALIDITY_FILE), 'r', encoding='ascii') as f:
+            return f"uid:{int(f.read().strip())}"
+    except (OSError, ValueError):
+        return f"dir:{os.path.abspath(source)}"
+
+
+def split(path: str):
+    """(module, container, seq_id, stage) if `path` names a message inside an mbox or pack, else None."""
+    parent, name = os.path.split(path)
+    stem = name[:-len('.eml')] if name.endswith('.eml') else name
+    where = _locate(parent) if stem.isdigit() else None
+    if where is None:
+        return None
+    module, container, stage = where
+    return module, container, int(stem), stage
+
+
+def restage(src: str, dst: str) -> bool:
+    """Moves a message between a pack's raw and staging flags if both paths are in the same pack."""
+    a, b = split(src), split(dst)
+    if not (a and b and a[0] is pack_store and b[0] is pack_store and a[1:3] == b[1:3]):
+        return False
+    pack_store.set_stage(a[1], a[2], a[3], b[3])
+    return True
+
+
+def makedirs(directory: str):
+    """os.makedirs, except for the inside of an mbox or pack, which needs none."""
+    if _locate(directory) is None:
+        os.makedirs(directory, exist_ok=True)
+
+
+def refresh(source: str) -> dict:
+    """Brings an mbox's offset index up to date (no-op for other sources)."""
+    if is_mbox(source):
+        return mbox_reader.refresh(source)
+    return {}
+
+
+def latest(source: str, count: int = 50) -> list:
+    """Filenames of the newest `count` emails in an mbox or pack (highest seq first; unstaged only)."""
+    if is_pack(source):
+        return [f"{seq_id}.eml" for seq_id in pack_store.latest(source, count)]
+    mbox_reader.refresh(source)
+    return [f"{seq_id}.eml" for seq_id in mbox_reader.latest(source, count)]
+
+
+def names(source: str) -> set:
+    """Every <seq>.eml the source holds (an empty set if it doesn't exist)."""
+    where = _locate(source)
+    if where is not None:
+        module, container, stage = where
+        if module is mbox_reader:
+            mbox_reader.refresh(container)
+            return {f"{seq_id}.eml" for seq_id in mbox_reader.seq_ids(container)}
+        return {f"{seq_id}.eml" for seq_id in pack_store.seq_ids(container, stage)}
+    if not os.path.isdir(source):
+        return set()
+    with os.scandir(source) as it:
+        return {e.name for e in it if e.name.endswith('.eml')}
+
+
+def exists(path: str) -> bool:
+    where = split(path)
+    if where is None:
+        return os.path.exists(path)
+    module, container, seq_id, stage = where
+    row = module.lookup(container, [seq_id]).get(seq_id)
+    return row is not None and (module is mbox_reader or row['stage'] == stage)
+
+
+def open_email(path: str):
+    """A binary file-like object positioned at the start of the email."""
+    where = split(path)
+    if where is None:
+        return open(path, 'rb')
+    module, container, seq_id, _ = where
+    if module is mbox_reader:
+        return mbox_reader.open_message(container, seq_id)
+    return pack_store.open_message(container, seq_id)
+
+
+def read(path: str) -> bytes:
+    where = split(path)
+    if where is None:
+        with open(path, 'rb') as f:
+            return f.read()
+    module, container, seq_id, _ = where
+    return module.read(container, seq_id)
+
+
+def parse_path(path: str, snippet_len: int = 500) -> dict:
+    with open_email(path) as f:
+        return fast_parser.parse_file(f, snippet_len)
+
+
+def read_headers(path: str):
+    with open_email(path) as f:
+        return fast_parser.parse_headers(f)
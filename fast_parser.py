@@ -0,0 +1,147 @@
+import base64
+import codecs
+import quopri
+from email import policy
+from email.parser import BytesHeaderParser
+import snippet
+
+# Lazy .eml reader for the classifier. It parses only the header block(s) and the first
+# text/plain part (or, failing that, the first text/html part), skipping attachment
+# payloads line by line without decoding them, and stops reading the file as soon as
+# it has enough body text for the snippet.
+_header_parser = BytesHeaderParser(policy=policy.default)
+# Markup is mostly tags, so read more of an HTML part to get the same amount of text
+HTML_READ_FACTOR = 4
+
+
+def _read_header_block(fp) -> bytes:
+    """Reads lines up to and including the blank line that ends a header block."""
+    lines = []
+    for line in iter(fp.readline, b''):
+        if line in (b'\r\n', b'\n'):
+            break
+        lines.append(line)
+    return b''.join(lines)
+
+
+def parse_headers(fp):
+    """Parses only the header block at the current position of an open binary file."""
+    return _header_parser.parsebytes(_read_header_block(fp))
+
+
+def _delimiter_status(line: bytes, delim: bytes):
+    """Returns 'next' for a part delimiter, 'end' for the closing delimiter, else None."""
+    if not line.startswith(delim):
+        return None
+    rest = line[len(delim):].rstrip()
+    if rest == b'--':
+        return 'end'
+    if rest == b'':
+        return 'next'
+    return None
+
+
+def _skip_to_delimiter(fp, delim: bytes) -> str:
+    # Sources that can search ahead (mbox_reader / pack_store MessageFile) jump between candidate lines
+    next_line = getattr(fp, 'readline_startswith', None)
+    lines = iter(lambda: next_line(delim), b'') if next_line else iter(fp.readline, b'')
+    for line in lines:
+        status = _delimiter_status(line, delim)
+        if status:
+            return status
+    return 'eof'
+
+
+def _collect_until_delimiter(fp, delim: bytes, max_bytes: int) -> bytes:
+    out = []
+    size = 0
+    for line in iter(fp.readline, b''):
+        if delim and _delimiter_status(line, delim):
+            break
+        out.append(line)
+        size += len(line)
+        if size >= max_bytes:
+            break
+    return b''.join(out)
+
+
+def _decode(raw: bytes, headers) -> str:
+    cte = (headers.get('Content-Transfer-Encoding') or '').strip().lower()
+    if cte == 'base64':
+        compact = b''.join(raw.split())
+        # A truncated read may end mid-quantum; drop the partial tail
+        compact = compact[: len(compact) // 4 * 4]
+        try:
+            raw = base64.b64decode(compact)
+        except Exception:
+            raw = b''
+    elif cte == 'quoted-printable':
+        raw = quopri.decodestring(raw)
+
+    charset = headers.get_content_charset() or 'utf-8'
+    try:
+        codecs.lookup(charset)
+    except LookupError:
+        charset = 'utf-8'
+    return raw.decode(charset, errors='ignore')
+
+
+def _first_text_in_multipart(fp, boundary: str, max_bytes: int, html: list):
+    """Returns the decoded first non-attachment text/plain part, or None if there isn't one.
+
+    The first text/html part met on the way is decoded into `html` (a one-slot list) so
+    HTML-only messages still have something to show.
+    """
+    delim = b'--' + boundary.encode('ascii', errors='ignore')
+    status = _skip_to_delimiter(fp, delim)  # preamble
+    while status == 'next':
+        part = parse_headers(fp)
+        ctype = part.get_content_type()
+        inline = part.get_content_disposition() != 'attachment'
+        if ctype.startswith('multipart/') and part.get_boundary():
+            found = _first_text_in_multipart(fp, part.get_boundary(), max_bytes, html)
+            if found is not None:
+                return found
+            status = _skip_to_delimiter(fp, delim)
+        elif ctype == 'text/plain' and inline:
+            return _decode(_collect_until_delimiter(fp, delim, max_bytes), part)
+        elif ctype == 'text/html' and inline and not html:
+            html.append(_decode(_collect_until_delimiter(fp, delim, max_bytes * HTML_READ_FACTOR), part))
+            status = _skip_to_delimiter(fp, delim)
+        else:
+            # Attachments and other parts are skipped without decoding
+            status = _skip_to_delimiter(fp, delim)
+    return None
+
+
+def parse_file(fp, snippet_len: int = 500) -> dict:
+    """Extracts what the classifier needs from an open binary file positioned at the message start."""
+    msg = parse_headers(fp)
+    # Enough raw bytes for snippet_len characters even through base64 / multi-byte charsets
+    max_bytes = snippet_len * 8 + 1024
+
+    if msg.get_content_maintype() == 'multipart' and msg.get_boundary():
+        html = []
+        body = _first_text_in_multipart(fp, msg.get_boundary(), max_bytes, html)
+        is_html = body is None and bool(html)
+        if body is None:
+            body = html[0] if html else ''
+    else:
+        is_html = msg.get_content_type() == 'text/html'
+        body = _decode(_collect_until_delimiter(fp, b'', max_bytes * (HTML_READ_FACTOR if is_html else 1)), msg)
+
+    sender = msg.get('from', '(Unknown)')
+    subject = msg.get('subject', '(No Subject)')
+    return {
+        'sender': sender,
+        'subject': subject,
+        'message_id': msg.get('Message-ID', '(No Message-ID)'),
+        'date': msg.get('Date', '(no date)'),
+        'headers': {k.lower(): v for k, v in msg.raw_items()},
+        'snippet': snippet.build(str(sender), str(subject), body, is_html=is_html, max_chars=snippet_len),
+    }
+
+
+def parse_path(path: str, snippet_len: int = 500) -> dict:
+    with open(path, 'rb') as f:
+        return parse_file(f, snippet_len)
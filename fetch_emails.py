@@ -1,11 +1,19 @@
 import imaplib
 import os
+import io
+import csv
 import email
 import json
+import queue
+import sqlite3
+import threading
 import requests
-import pandas as pd
 from datetime import date, timedelta
 from dotenv import load_dotenv
+import classification_cache
+import ollama_client
+import imap_client
+import fast_parser
 
 # --- CONFIG ---
 # Load environment variables from the .env file
@@ -14,13 +22,29 @@ load_dotenv()
 GMAIL_USER = os.getenv('GMAIL_USER')
 GMAIL_APP_PASSWORD = os.getenv('GMAIL_APP_PASSWORD')
 IMAP_SERVER = 'imap.gmail.com'
-OLLAMA_API_URL = 'http://127.0.0.1:11434/api/generate'
 OLLAMA_MODEL = 'mistral:7b-instruct-q5_K_M'
 OUTPUT_FILE = '/srv/storage/docker/email_data/deletions.csv'
 
+# Streaming pipeline: each stage runs its own threads and hands work on through a
+# bounded queue, so IMAP round trips overlap with inference and memory stays flat.
+PIPELINE_ENABLED = os.environ.get('FETCH_PIPELINE', '1') != '0'
+FETCH_CONNECTIONS = int(os.environ.get('FETCH_CONNECTIONS', '2'))
+FETCH_BATCH_SIZE = int(os.environ.get('FETCH_BATCH_SIZE', '25'))
+PARSE_WORKERS = int(os.environ.get('FETCH_PARSE_WORKERS', '2'))
+LLM_WORKERS = int(os.environ.get('FETCH_LLM_WORKERS', '4'))
+QUEUE_DEPTH = int(os.environ.get('FETCH_QUEUE_DEPTH', '64'))
+# Light mode fetches only the headers the classifier reads, BODYSTRUCTURE and the first
+# PARTIAL_BYTES of the text/plain part instead of the whole message and its attachments.
+LIGHT_FETCH = os.environ.get('FETCH_LIGHT', '1') != '0'
+PARTIAL_BYTES = int(os.environ.get('FETCH_PARTIAL_BYTES', '2048'))
+CLASSIFY_HEADERS = 'FROM SUBJECT MESSAGE-ID DATE LIST-UNSUBSCRIBE LIST-ID PRECEDENCE'
+# If set, kept (non-promotional) emails are fetched in full and saved here as <uid>.eml
+ARCHIVE_DIR = os.environ.get('FETCH_ARCHIVE_DIR', '')
+CSV_FIELDS = ['uid', 'message_id', 'subject', 'sender']
+
 # --- 1. LLM Classification Function ---
 def classify_with_ollama(sender, subject, body_snippet):
-    """Sends email data to the local LLM and returns the classification."""
+    """Sends email data to the local LLM and returns the classification (None if it couldn't be made)."""
     
     # The prompt is designed for Mistral to output structured JSON
     prompt = f"""
@@ -35,31 +59,33 @@ def classify_with_ollama(sender, subject, body_snippet):
     """
 
     try:
-        # We send the request to your local Ollama API
-        response = requests.post(OLLAMA_API_URL, json={
-            "model": OLLAMA_MODEL,
-            "prompt": prompt,
-            "stream": False,
-            "format": "json" # Crucial for forcing structured output
-        })
-        
-        # Check for successful API response
-        response.raise_for_status() 
-        
-        # Ollama's response is a JSON string inside a 'response' field
-        response_data = response.json()
+        cached = classification_cache.get(OLLAMA_MODEL, prompt)
+        if cached is not None:
+            return cached[0]
+
+        # We send the request to your local Ollama API (pooled, with retries)
+        response_data = ollama_client.generate(OLLAMA_MODEL, prompt, format="json") # Crucial for forcing structured output
         
         # Attempt to parse the actual JSON output from the model
         model_output = json.loads(response_data.get('response', '{}'))
-        
-        return model_output.get('is_promotional', False)
+        is_promo = model_output.get('is_promotional', False)
+        classification_cache.put(OLLAMA_MODEL, prompt, is_promo, model_output.get('reason', 'N/A'))
 
-    except requests.exceptions.RequestException as e:
+        return is_promo
+
+    # Unknown, not KEEP: returning None leaves the email out of both the kept and archived sets
+    except ollama_client.OllamaUnavailable as e:
         print(f"Ollama API Error: {e}. Is your Ollama container running?")
-        return False
+        return None
+    except requests.exceptions.RequestException as e:
+        print(f"Ollama API Error: {e}")
+        return None
     except json.JSONDecodeError:
         print("LLM returned malformed JSON. Skipping.")
-        return False
+        return None
+    except sqlite3.Error as e:
+        print(f"Classification cache error: {e}")
+        return None
 
 # --- 2. Email Fetching and Processing ---
 def fetch_and_process_emails():
@@ -80,6 +106,8 @@ def fetch_and_process_emails():
         return
 
     print(f"Found {len(uids)} emails. Starting LLM classification...")
+    ollama_client.warm_up(OLLAMA_MODEL)
+    ollama_client.reset_endpoint_stats()
     
     deletion_list = []
     
@@ -124,7 +152,9 @@ def fetch_and_process_emails():
         # --- LLM CALL ---
         is_promo = classify_with_ollama(sender, subject, body_snippet)
         
-        if is_promo:
+        if is_promo is None:
+            print(f"[{i+1}/{len(uids)}] Could not classify, skipping: {subject[:50]}...")
+        elif is_promo:
             deletion_list.append({
                 'uid': uid,
                 'message_id': msg['message-id'],
@@ -137,8 +167,267 @@ def fetch_and_process_emails():
             
     M.logout()
     print("IMAP session closed.")
+    cache_stats = classification_cache.stats()
+    print(f"Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    ollama_client.print_endpoint_stats()
     return deletion_list
 
+# --- 2b. Streaming Pipeline ---
+def _search_query():
+    yesterday = (date.today() - timedelta(days=1)).strftime("%d-%b-%Y")
+    return f'(SINCE "{yesterday}" NOT X-GM-LABELS "Social" NOT X-GM-LABELS "Forums" NOT X-GM-LABELS "Receipts")'
+
+
+def _start_stage(target, workers, inbox, outbox, downstream, *args):
+    """Runs `workers` threads of `target(inbox, outbox, *args)`.
+
+    Once they have all returned, one None per downstream worker is put on `outbox`
+    so the next stage knows its input is exhausted.
+    """
+    threads = [threading.Thread(target=target, args=(inbox, outbox) + args, daemon=True) for _ in range(workers)]
+    for t in threads:
+        t.start()
+
+    def close():
+        for t in threads:
+            t.join()
+        for _ in range(downstream):
+            outbox.put(None)
+
+    closer = threading.Thread(target=close, daemon=True)
+    closer.start()
+    return closer
+
+
+def _fetch_full(M, batch):
+    """Whole messages for a batch of UIDs. Returns ([(uid, raw)], bytes transferred, full bytes)."""
+    status, data = M.uid('fetch', imap_client.compress_uids(batch), '(UID RFC822)')
+    if status != 'OK':
+        raise RuntimeError(f"FETCH returned {status}")
+    out = [(msg['UID'], bytes(msg['RFC822'])) for msg in imap_client.parse_fetch(data) if msg.get('RFC822') is not None]
+    return out, imap_client.response_bytes(data), sum(len(raw) for _, raw in out)
+
+
+def _fetch_light(M, batch):
+    """Headers + BODYSTRUCTURE for a batch, then a byte-limited partial of each text part.
+
+    The pieces are stitched into a minimal message (fetched headers, the part's own
+    Content-Type/Transfer-Encoding, the partial body) that fast_parser reads as usual.
+    """
+    status, data = M.uid('fetch', imap_client.compress_uids(batch),
+                         f'(UID RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({CLASSIFY_HEADERS})])')
+    if status != 'OK':
+        raise RuntimeError(f"FETCH returned {status}")
+    transferred = imap_client.response_bytes(data)
+    full = 0
+    heads = {}
+    by_section = {}
+    for msg in imap_client.parse_fetch(data):
+        structure = msg.get('BODYSTRUCTURE')
+        # Same preference as fast_parser: text/plain, else text/html, else a single part's body
+        part = imap_client.text_part(structure) or imap_client.text_part(structure, 'html')
+        if part is None and structure and not isinstance(structure[0], list):
+            part = imap_client.text_part(structure, subtype=None)
+        heads[msg['UID']] = (bytes(imap_client.item(msg, 'BODY[HEADER.FIELDS') or b''), part)
+        full += int(msg.get('RFC822.SIZE') or 0)
+        if part:
+            # Markup is mostly tags, so HTML parts get a bigger slice
+            size = PARTIAL_BYTES * (fast_parser.HTML_READ_FACTOR if part['subtype'] == 'html' else 1)
+            by_section.setdefault((part['section'], size), []).append(msg['UID'])
+
+    # One round trip per distinct section (usually just '1' and '1.1')
+    texts = {}
+    for (section, size), uids in by_section.items():
+        status, data = M.uid('fetch', imap_client.compress_uids(uids), f'(UID BODY.PEEK[{section}]<0.{size}>)')
+        if status != 'OK':
+            continue
+        transferred += imap_client.response_bytes(data)
+        for msg in imap_client.parse_fetch(data):
+            texts[msg['UID']] = bytes(imap_client.item(msg, f'BODY[{section}]') or b'')
+
+    out = []
+    for uid, (head, part) in heads.items():
+        head = head.strip(b'\r\n')
+        raw = head + b'\r\n' if head else b''
+        if part:
+            raw += (f'Content-Type: text/{part["subtype"]}; charset="{part["charset"]}"\r\n'
+                    f'Content-Transfer-Encoding: {part["encoding"]}\r\n').encode('ascii', errors='replace')
+        out.append((uid, raw + b'\r\n' + texts.get(uid, b'')))
+    return out, transferred, full
+
+
+def _fetch_stage(batches, raw_q, user, password, errors, traffic, light):
+    """One IMAP connection: fetches whole batches and passes each message on."""
+    try:
+        M = imap_client.connect(user, password, readonly=True)
+    except Exception as e:
+        errors.append(f"connect failed: {e}")
+        return
+    try:
+        while True:
+            try:
+                batch = batches.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                messages, transferred, full = (_fetch_light if light else _fetch_full)(M, batch)
+                traffic.append((len(messages), transferred, full))
+                for uid, raw_email in messages:
+                    raw_q.put((uid, raw_email))  # blocks while parsers are behind
+            except Exception as e:
+                errors.append(f"batch {batch[0]}-{batch[-1]}: {e}")
+    finally:
+        try:
+            M.logout()
+        except Exception:
+            pass
+
+
+def _archive(user, password, uids, archive_dir, batch_size):
+    """Fetches the full message for each kept UID into archive_dir/<uid>.eml. Returns bytes transferred."""
+    os.makedirs(archive_dir, exist_ok=True)
+    uids = [u for u in uids if not os.path.exists(os.path.join(archive_dir, f"{u}.eml"))]
+    if not uids:
+        return 0
+    transferred = 0
+    M = imap_client.connect(user, password, readonly=True)
+    try:
+        for batch in imap_client.chunks(uids, batch_size):
+            messages, nbytes, _ = _fetch_full(M, batch)
+            transferred += nbytes
+            for uid, raw_email in messages:
+                path = os.path.join(archive_dir, f"{uid}.eml")
+                with open(path + '.part', 'wb') as f:
+                    f.write(raw_email)
+                os.replace(path + '.part', path)
+    finally:
+        M.logout()
+    return transferred
+
+
+def _parse_stage(raw_q, parsed_q):
+    while True:
+        item = raw_q.get()
+        if item is None:
+            return
+        uid, raw_email = item
+        try:
+            info = fast_parser.parse_file(io.BytesIO(raw_email))
+        except Exception as e:
+            print(f"Failed to parse UID {uid}: {e}. Skipping.")
+            continue
+        parsed_q.put((uid, str(info['message_id']), str(info['sender']), str(info['subject']), info['snippet']))
+
+
+def _llm_stage(parsed_q, result_q):
+    while True:
+        item = parsed_q.get()
+        if item is None:
+            return
+        uid, message_id, sender, subject, snippet = item
+        # A dead worker would drop its email and, once all are gone, stall the parsers on a full queue
+        try:
+            is_promo = classify_with_ollama(sender, subject, snippet)
+        except Exception as e:
+            print(f"Failed to classify UID {uid}: {e}")
+            is_promo = None
+        result_q.put((uid, message_id, sender, subject, is_promo))
+
+
+def run_pipeline(output_file=OUTPUT_FILE, user=None, password=None, connections=None,
+                 batch_size=None, parse_workers=None, llm_workers=None, light=None, archive_dir=None):
+    """Fetch -> parse -> classify as overlapping stages; flagged emails are appended to
+    `output_file` as they are classified. Returns a stats dict.
+
+    With `light` (default LIGHT_FETCH) only headers and a partial of the text part are
+    fetched; `archive_dir` (default ARCHIVE_DIR) then receives full copies of kept emails.
+    """
+    user = user or GMAIL_USER
+    password = password or GMAIL_APP_PASSWORD
+    connections = max(1, connections or FETCH_CONNECTIONS)
+    batch_size = max(1, batch_size or FETCH_BATCH_SIZE)
+    parse_workers = max(1, parse_workers or PARSE_WORKERS)
+    llm_workers = max(1, llm_workers or LLM_WORKERS)
+    light = LIGHT_FETCH if light is None else light
+    archive_dir = ARCHIVE_DIR if archive_dir is None else archive_dir
+    stats = {"found": 0, "classified": 0, "flagged": 0, "errors": 0,
+             "bytes_fetched": 0, "bytes_full": 0, "bytes_archived": 0}
+
+    M = imap_client.connect(user, password, readonly=True)
+    uids = imap_client.search_uids(M, _search_query())
+    M.logout()
+    stats["found"] = len(uids)
+    if not uids:
+        print("No emails to process.")
+        return stats
+
+    print(f"Found {len(uids)} emails. Streaming through {connections} {'light ' if light else ''}fetcher(s), "
+          f"{parse_workers} parser(s) and {llm_workers} LLM worker(s)...")
+    ollama_client.warm_up(OLLAMA_MODEL)
+    ollama_client.reset_endpoint_stats()
+
+    batches = queue.Queue()
+    for batch in imap_client.chunks(uids, batch_size):
+        batches.put(batch)
+    raw_q = queue.Queue(maxsize=QUEUE_DEPTH)
+    parsed_q = queue.Queue(maxsize=QUEUE_DEPTH)
+    result_q = queue.Queue(maxsize=QUEUE_DEPTH)
+    errors = []
+    traffic = []
+    kept = []
+    llm_errors = 0
+
+    _start_stage(_fetch_stage, connections, batches, raw_q, parse_workers, user, password, errors, traffic, light)
+    _start_stage(_parse_stage, parse_workers, raw_q, parsed_q, llm_workers)
+    _start_stage(_llm_stage, llm_workers, parsed_q, result_q, 1)
+
+    with open(output_file, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        while True:
+            item = result_q.get()
+            if item is None:
+                break
+            uid, message_id, sender, subject, is_promo = item
+            if is_promo is None:
+                llm_errors += 1
+                continue
+            stats["classified"] += 1
+            if is_promo:
+                writer.writerow({'uid': uid, 'message_id': message_id, 'subject': subject, 'sender': sender})
+                f.flush()
+                stats["flagged"] += 1
+                print(f"[{stats['classified']}/{len(uids)}] Classified as PROMOTIONAL: {subject[:50]}...")
+            else:
+                kept.append(uid)
+                print(f"[{stats['classified']}/{len(uids)}] Classified as KEEP: {subject[:50]}...")
+
+    for err in errors:
+        print(f"Fetch error: {err}")
+    if llm_errors:
+        print(f"{llm_errors} email(s) could not be classified.")
+    stats["errors"] = len(errors) + llm_errors
+
+    fetched = sum(n for n, _, _ in traffic)
+    stats["bytes_fetched"] = sum(b for _, b, _ in traffic)
+    stats["bytes_full"] = sum(f for _, _, f in traffic)
+    if fetched:
+        line = (f"Transferred {stats['bytes_fetched'] / 1024:.0f} KB for {fetched} emails: "
+                f"{stats['bytes_fetched'] / fetched:.0f} bytes/email")
+        if light and stats["bytes_full"]:
+            saved = 100 * (1 - stats["bytes_fetched"] / stats["bytes_full"])
+            line += f" vs {stats['bytes_full'] / fetched:.0f} for full messages ({saved:.0f}% less)"
+        print(line)
+    if archive_dir and kept:
+        stats["bytes_archived"] = _archive(user, password, kept, archive_dir, batch_size)
+        print(f"Archived {len(kept)} kept email(s) to {archive_dir} "
+              f"({stats['bytes_archived'] / 1024:.0f} KB fetched)")
+    cache_stats = classification_cache.stats()
+    print(f"Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    stats["endpoints"] = ollama_client.endpoint_stats()
+    ollama_client.print_endpoint_stats()
+    return stats
+
 # --- 3. Save Output ---
 if __name__ == "__main__":
     if not os.path.exists(os.path.dirname(OUTPUT_FILE)):
@@ -149,13 +438,21 @@ if __name__ == "__main__":
     # Ensure the required libraries are installed (though already done in venv)
     # The script should be run in the active virtual environment
     try:
-        emails_to_delete = fetch_and_process_emails()
+        if PIPELINE_ENABLED:
+            # Rows are written to OUTPUT_FILE as they are classified
+            flagged = run_pipeline(OUTPUT_FILE)["flagged"]
+        else:
+            emails_to_delete = fetch_and_process_emails() or []
+            flagged = len(emails_to_delete)
+            if emails_to_delete:
+                with open(OUTPUT_FILE, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+                    writer.writeheader()
+                    writer.writerows(emails_to_delete)
 
-        if emails_to_delete:
-            df = pd.DataFrame(emails_to_delete)
-            df.to_csv(OUTPUT_FILE, index=False)
+        if flagged:
             print(f"\n--- SUCCESS! ---")
-            print(f"Total promotional emails flagged: {len(emails_to_delete)}")
+            print(f"Total promotional emails flagged: {flagged}")
             print(f"List saved to: {OUTPUT_FILE}")
         else:
             print("No promotional emails flagged for deletion.")
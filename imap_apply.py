@@ -0,0 +1,356 @@
+import os
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+import imap_client
+import email_source
+import mbox_reader
+import pack_store
+
+# Acts on Gmail for what the processor staged in to_delete: each staged message is mapped
+# to its INBOX UID and then moved to the trash (or given a label) with UID MOVE / UID STORE
+# commands that cover thousands of UIDs each, sent over a few parallel connections.
+#
+# UIDs come from a manifest where there is one for the current UIDVALIDITY: the Go
+# downloader names files <uid>.eml and records the epoch in .uidvalidity, and the mbox
+# downloader's <mbox>.uids sidecar pairs each UID with its Message-ID. A file name is only
+# taken as a UID once the server's message under that UID has the staged file's
+# Message-ID, since staged files may predate the UID layout or the current epoch.
+# Anything left is matched by Message-ID against the server, fetched in large batches.
+#
+# Every batch the server accepts is appended to a progress log, so an interrupted run
+# picks up where it stopped and a finished one isn't repeated.
+STORAGE_DIR = os.environ.get('EMAIL_STORAGE_DIR', '/srv/storage/docker/email_data/raw_emails')
+STAGING_DIR = os.environ.get('STAGING_TO_DELETE_DIR', '/srv/storage/docker/email_data/staging/to_delete')
+APPLY_LOG = os.environ.get('IMAP_APPLY_LOG', os.path.join(os.path.dirname(STAGING_DIR), 'imap_apply.jsonl'))
+# 'move' sends staged mail to TRASH_MAILBOX; 'label' adds APPLY_LABEL and leaves it in place
+APPLY_MODE = os.environ.get('IMAP_APPLY_MODE', 'move')
+TRASH_MAILBOX = os.environ.get('IMAP_TRASH_MAILBOX', '[Gmail]/Trash')
+APPLY_LABEL = os.environ.get('IMAP_APPLY_LABEL', 'AI/Delete')
+# UIDs per MOVE/STORE command (the set is also capped in length), and parallel connections
+APPLY_BATCH_SIZE = int(os.environ.get('IMAP_APPLY_BATCH_SIZE', '5000'))
+APPLY_CONNECTIONS = int(os.environ.get('IMAP_APPLY_CONNECTIONS', '2'))
+# UIDs per FETCH when matching Message-IDs against the server
+MSGID_FETCH_BATCH = int(os.environ.get('IMAP_MSGID_FETCH_BATCH', '5000'))
+UIDVALIDITY_FILE = pack_store.UIDVALIDITY_FILE
+
+
+def _norm_msgid(value) -> str:
+    return ' '.join(str(value or '').split())
+
+
+def _staged_ids(delete_dir: str) -> list:
+    return sorted(int(n[:-len('.eml')]) for n in email_source.names(delete_dir) if n[:-len('.eml')].isdigit())
+
+
+def _uid_named(source: str, validity: int) -> bool:
+    """True if the source's files are named by UID in the server's current UIDVALIDITY."""
+    if email_source.is_mbox(source):
+        return False
+    try:
+        with open(os.path.join(source, UIDVALIDITY_FILE), 'r', encoding='utf-8') as f:
+            return int(f.read().strip()) == validity
+    except (OSError, ValueError):
+        return False
+
+
+def _sidecar_uids(mbox_path: str, validity: int) -> dict:
+    """Message-ID -> UIDs from the mbox downloader's sidecar, if it is of the current UIDVALIDITY."""
+    path = f"{mbox_path}.uids"
+    out = {}
+    epoch = None
+    if not os.path.exists(path):
+        return out
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            kind, _, rest = line.rstrip('\n').partition(' ')
+            if kind == 'V':
+                epoch = int(rest)
+                out = {}
+            elif kind == 'M':
+                uid, _, msgid = rest.partition('\t')
+                if msgid:
+                    out.setdefault(_norm_msgid(msgid), set()).add(int(uid))
+    return out if epoch == validity else {}
+
+
+def _staged_message_ids(delete_dir: str, source: str, seq_ids) -> dict:
+    """seq_id -> Message-ID of each staged message."""
+    if email_source.is_mbox(source):
+        # Staged copies of mbox messages keep the archive's seq ids; its index has the Message-IDs
+        mbox_reader.refresh(source)
+        known = {s: row['message_id'] for s, row in mbox_reader.lookup(source, seq_ids).items()}
+    else:
+        known = {}
+    out = {}
+    for n, seq_id in enumerate(seq_ids, start=1):
+        msgid = known.get(seq_id)
+        if msgid is None:
+            try:
+                msgid = email_source.read_headers(os.path.join(delete_dir, f"{seq_id}.eml")).get('Message-ID')
+            except Exception as e:
+                print(f"[Apply] Could not read {seq_id}.eml: {e}")
+                continue
+        msgid = _norm_msgid(msgid)
+        if msgid and msgid != '(No Message-ID)':
+            out[seq_id] = msgid
+        if n % 10000 == 0:
+            print(f"[Apply] Read {n}/{len(seq_ids)} staged headers...")
+    return out
+
+
+def _server_message_ids(M, wanted: set) -> dict:
+    """Message-ID -> UIDs for the INBOX messages whose Message-ID is in `wanted`."""
+    out = {}
+    uids = imap_client.search_uids(M, 'ALL')
+    for batch in imap_client.chunks(uids, MSGID_FETCH_BATCH):
+        status, data = M.uid('fetch', imap_client.compress_uids(batch), '(UID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])')
+        if status != 'OK':
+            raise RuntimeError(f"FETCH of Message-IDs returned {status}")
+        for msg in imap_client.parse_fetch(data):
+            msgid = _norm_msgid(imap_client.header_message_id(imap_client.item(msg, 'BODY[HEADER') or b''))
+            if msgid in wanted:
+                out.setdefault(msgid, set()).add(msg['UID'])
+    return out
+
+
+def _message_ids_of(M, uids) -> dict:
+    """UID -> Message-ID for those of `uids` that exist in the selected mailbox."""
+    out = {}
+    for uid_set, _ in imap_client.uid_set_batches(uids, MSGID_FETCH_BATCH):
+        status, data = M.uid('fetch', uid_set, '(UID BODY.PEEK[HEADER.FIELDS (MESSAGE-ID)])')
+        if status != 'OK':
+            raise RuntimeError(f"FETCH of Message-IDs returned {status}")
+        for msg in imap_client.parse_fetch(data):
+            out[msg['UID']] = _norm_msgid(imap_client.header_message_id(imap_client.item(msg, 'BODY[HEADER') or b''))
+    return out
+
+
+def map_uids(M, delete_dir: str, source: str) -> dict:
+    """Maps what is staged in `delete_dir` to INBOX UIDs. `M` must have INBOX selected.
+
+    Returns {'uidvalidity', 'staged', 'uids' (sorted), 'by_manifest', 'by_message_id',
+    'unmatched' (seq ids)}. A Message-ID found on several INBOX messages maps to all of them.
+    """
+    validity = imap_client.uidvalidity(M)
+    seq_ids = _staged_ids(delete_dir)
+    plan = {"uidvalidity": validity, "staged": len(seq_ids), "uids": [],
+            "by_manifest": 0, "by_message_id": 0, "unmatched": []}
+    uids = set()
+    rest = seq_ids
+    if _uid_named(source, validity):
+        # Only a name whose server message carries the same Message-ID is trusted as its UID
+        msgids = _staged_message_ids(delete_dir, source, seq_ids)
+        server = _message_ids_of(M, seq_ids)
+        for seq_id in seq_ids:
+            if msgids.get(seq_id) and server.get(seq_id) == msgids[seq_id]:
+                uids.add(seq_id)
+                plan["by_manifest"] += 1
+            else:
+                plan["unmatched"].append(seq_id)
+        rest = []
+
+    if rest:
+        msgids = _staged_message_ids(delete_dir, source, rest)
+        manifest = _sidecar_uids(source, validity) if email_source.is_mbox(source) else {}
+        missing = {m for m in msgids.values() if m not in manifest}
+        server = {}
+        if missing:
+            print(f"[Apply] Looking up {len(missing)} Message-ID(s) on the server...")
+            server = _server_message_ids(M, missing)
+        for seq_id in rest:
+            msgid = msgids.get(seq_id)
+            if msgid in manifest:
+                uids.update(manifest[msgid])
+                plan["by_manifest"] += 1
+            elif msgid in server:
+                uids.update(server[msgid])
+                plan["by_message_id"] += 1
+            else:
+                plan["unmatched"].append(seq_id)
+    plan["uids"] = sorted(uids)
+    return plan
+
+
+def _action_key(mode: str, target: str) -> str:
+    return f"{mode}:{target}"
+
+
+def _applied_uids(log_path: str, validity: int, action: str) -> set:
+    """UIDs the progress log records as done for this UIDVALIDITY and action."""
+    done = set()
+    if not os.path.exists(log_path):
+        return done
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break  # torn final line from a crash: that batch is simply redone
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get('uidvalidity') == validity and entry.get('action') == action:
+                for part in entry['uids'].split(','):
+                    lo, _, hi = part.partition(':')
+                    done.update(range(int(lo), int(hi or lo) + 1))
+    return done
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _can_move(M) -> bool:
+    """MOVE, or UIDPLUS for COPY + UID EXPUNGE; a plain EXPUNGE would also remove mail others marked \\Deleted."""
+    return 'MOVE' in M.capabilities or 'UIDPLUS' in M.capabilities
+
+
+def _apply_batch(M, uid_set: str, mode: str, target: str):
+    """One command (three without MOVE support) for a whole UID set; raises if the server refuses it."""
+    if mode == 'label':
+        status, data = M.uid('STORE', uid_set, '+X-GM-LABELS', f'({_quote(target)})')
+    elif 'MOVE' in M.capabilities:
+        status, data = M.uid('MOVE', uid_set, _quote(target))
+    elif 'UIDPLUS' in M.capabilities:
+        status, data = M.uid('COPY', uid_set, _quote(target))
+        if status == 'OK':
+            status, data = M.uid('STORE', uid_set, '+FLAGS.SILENT', r'(\Deleted)')
+        if status == 'OK':
+            status, data = M.uid('EXPUNGE', uid_set)
+    else:
+        raise RuntimeError("server supports neither MOVE nor UIDPLUS")
+    if status != 'OK':
+        raise RuntimeError(f"{mode} returned {status}: {data}")
+
+
+def _apply_worker(user, password, batches, log, lock, stats, errors):
+    """One IMAP connection: takes (set, uids) batches off `batches` and logs each one the server accepts."""
+    try:
+        M = imap_client.connect(user, password)
+    except Exception as e:
+        errors.append(f"connect failed: {e}")
+        return
+    try:
+        while True:
+            try:
+                uid_set, uids = batches.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                _apply_batch(M, uid_set, stats["mode"], stats["target"])
+            except Exception as e:
+                errors.append(f"batch {uids[0]}-{uids[-1]}: {e}")
+                continue
+            entry = {"time": datetime.now().isoformat(timespec='seconds'), "uidvalidity": stats["uidvalidity"],
+                     "action": _action_key(stats["mode"], stats["target"]), "uids": uid_set}
+            with lock:
+                log.write(json.dumps(entry) + '\n')
+                log.flush()
+                os.fsync(log.fileno())
+                stats["applied"] += len(uids)
+                stats["batches"] += 1
+                print(f"[Apply] {stats['applied']}/{stats['pending']} applied...")
+    finally:
+        try:
+            M.logout()
+        except Exception:
+            pass
+
+
+def apply_deletions(user: str, password: str, delete_dir: str = None, source: str = None, mode: str = None,
+                    target: str = None, dry_run: bool = False, connections: int = None,
+                    batch_size: int = None, log_path: str = None) -> dict:
+    """Moves (or labels) the INBOX messages staged in `delete_dir`; returns stats.
+
+    `source` is the raw emails directory, mbox or pack the staged messages came from; it
+    supplies the UID manifest. With `dry_run` nothing is changed: the mapping is done and
+    the commands that would be sent are printed.
+    """
+    source = source or STORAGE_DIR
+    delete_dir = delete_dir or (pack_store.stage_dirs(source)[0] if email_source.is_pack(source) else STAGING_DIR)
+    mode = mode or APPLY_MODE
+    if mode not in ('move', 'label'):
+        raise ValueError(f"unknown apply mode {mode!r} (expected 'move' or 'label')")
+    target = target or (TRASH_MAILBOX if mode == 'move' else APPLY_LABEL)
+    connections = max(1, connections or APPLY_CONNECTIONS)
+    batch_size = max(1, batch_size or APPLY_BATCH_SIZE)
+    log_path = log_path or APPLY_LOG
+    stats = {"mode": mode, "target": target, "dry_run": dry_run, "staged": 0, "unmatched": 0,
+             "already": 0, "pending": 0, "applied": 0, "batches": 0, "errors": 0}
+
+    start = time.time()
+    M = imap_client.connect(user, password, readonly=True)
+    try:
+        if mode == 'move' and not _can_move(M):
+            raise ValueError("the server supports neither MOVE nor UIDPLUS, so moving could expunge other "
+                             "messages; use label mode instead")
+        plan = map_uids(M, delete_dir, source)
+    finally:
+        M.logout()
+    stats.update(uidvalidity=plan["uidvalidity"], staged=plan["staged"], unmatched=len(plan["unmatched"]))
+    if plan["unmatched"]:
+        sample = ', '.join(str(s) for s in plan["unmatched"][:10])
+        print(f"[Apply] {len(plan['unmatched'])} staged email(s) not matched to an INBOX message (already moved, deleted by hand, or staged under an older numbering?), e.g. {sample}; skipping them.")
+
+    done = _applied_uids(log_path, plan["uidvalidity"], _action_key(mode, target))
+    pending = [u for u in plan["uids"] if u not in done]
+    stats["already"] = len(plan["uids"]) - len(pending)
+    stats["pending"] = len(pending)
+    batches = list(imap_client.uid_set_batches(pending, batch_size))
+    verb = f"MOVE to {target}" if mode == 'move' else f"STORE +X-GM-LABELS ({target})"
+    print(f"[Apply] {plan['staged']} staged, {len(plan['uids'])} UID(s) matched "
+          f"({plan['by_manifest']} by manifest, {plan['by_message_id']} by Message-ID), "
+          f"{stats['already']} already applied; {len(pending)} to {verb} in {len(batches)} batch(es).")
+
+    if dry_run or not batches:
+        for uid_set, uids in batches[:5]:
+            print(f"   UID {'MOVE' if mode == 'move' else 'STORE'} {uid_set[:60]}{'...' if len(uid_set) > 60 else ''}"
+                  f"  ({len(uids)} UIDs)")
+        if len(batches) > 5:
+            print(f"   ... and {len(batches) - 5} more")
+        stats["sec"] = round(time.time() - start, 3)
+        return stats
+
+    work = queue.Queue()
+    for batch in batches:
+        work.put(batch)
+    errors = []
+    lock = threading.Lock()
+    os.makedirs(os.path.dirname(os.path.abspath(log_path)), exist_ok=True)
+    with open(log_path, 'a', encoding='utf-8') as log:
+        workers = [
+            threading.Thread(target=_apply_worker, args=(user, password, work, log, lock, stats, errors), daemon=True)
+            for _ in range(min(connections, len(batches)))
+        ]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+    for err in errors:
+        print(f"[Apply] Error: {err}")
+    stats["errors"] = len(errors)
+    stats["sec"] = round(time.time() - start, 3)
+    return stats
+
+
+def run_apply(storage_dir: str = None, delete_dir: str = None):
+    """Interactive front end for apply_deletions (main menu option)."""
+    source = storage_dir or STORAGE_DIR
+    choice = input(f"Move staged emails to {TRASH_MAILBOX} (M) or label them {APPLY_LABEL} (L)? "
+                   f"(Enter for {'M' if APPLY_MODE == 'move' else 'L'}): ").strip().upper()
+    mode = {'M': 'move', 'L': 'label'}.get(choice, APPLY_MODE)
+    dry_run = input("Dry run first (show what would be sent)? (Y/n): ").strip().lower() != 'n'
+    user, password = os.getenv('GMAIL_USER'), os.getenv('GMAIL_APP_PASSWORD')
+    try:
+        stats = apply_deletions(user, password, delete_dir=delete_dir, source=source, mode=mode, dry_run=dry_run)
+    except ValueError as e:
+        print(f"[Apply] {e}")
+        return
+    if dry_run and stats["pending"] and input("\nApply it now? (y/N): ").strip().lower() == 'y':
+        stats = apply_deletions(user, password, delete_dir=delete_dir, source=source, mode=mode)
+    print(f"\nApplied {stats['applied']} of {stats['pending']} pending UID(s) in {stats['batches']} batch(es) "
+          f"({stats['already']} already done, {stats['unmatched']} unmatched, {stats['errors']} failed batch(es)).")
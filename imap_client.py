@@ -0,0 +1,282 @@
+import os
+import re
+import imaplib
+
+# Shared IMAP helpers for the Python downloaders: connecting (Gmail by default, or any
+# host/port for local testing), compact UID sets and a parser for FETCH responses.
+IMAP_SERVER = os.environ.get('IMAP_SERVER', 'imap.gmail.com')
+IMAP_PORT = int(os.environ.get('IMAP_PORT', '993'))
+IMAP_SSL = os.environ.get('IMAP_SSL', '1') != '0'
+
+
+def connect(user: str, password: str, mailbox: str = 'INBOX', readonly: bool = False,
+            host: str = None, port: int = None, ssl: bool = None):
+    """Logs in and selects `mailbox` (unless it is None); returns the imaplib connection."""
+    host = host or IMAP_SERVER
+    port = port or IMAP_PORT
+    ssl = IMAP_SSL if ssl is None else ssl
+    M = imaplib.IMAP4_SSL(host, port) if ssl else imaplib.IMAP4(host, port)
+    M.login(user, password)
+    if mailbox:
+        select(M, mailbox, readonly)
+    return M
+
+
+def select(M, mailbox: str = 'INBOX', readonly: bool = False):
+    status, _ = M.select(mailbox, readonly=readonly)
+    if status != 'OK':
+        raise imaplib.IMAP4.error(f"SELECT {mailbox} failed")
+
+
+_STATUS_RE = re.compile(rb'(UIDNEXT|UIDVALIDITY|HIGHESTMODSEQ|MESSAGES)\s+(\d+)', re.IGNORECASE)
+
+
+def status(M, mailbox: str = 'INBOX') -> dict:
+    """One STATUS round trip: UIDNEXT, UIDVALIDITY, MESSAGES and (with CONDSTORE) HIGHESTMODSEQ."""
+    items = 'UIDNEXT UIDVALIDITY MESSAGES'
+    if 'CONDSTORE' in M.capabilities:
+        items += ' HIGHESTMODSEQ'
+    typ, data = M.status(mailbox, f'({items})')
+    if typ != 'OK' or not data or not data[0]:
+        raise imaplib.IMAP4.error(f"STATUS {mailbox} failed")
+    return {k.decode().upper(): int(v) for k, v in _STATUS_RE.findall(data[0])}
+
+
+def uidvalidity(M) -> int:
+    """UIDVALIDITY of the selected mailbox (from the SELECT response)."""
+    _, data = M.response('UIDVALIDITY')
+    if data and data[0]:
+        return int(data[0])
+    return 0
+
+
+def search_uids(M, criteria: str) -> list:
+    status, data = M.uid('search', None, criteria)
+    if status != 'OK' or not data or not data[0]:
+        return []
+    return [int(x) for x in data[0].split()]
+
+
+def compress_uids(uids) -> str:
+    """Renders UIDs as a compact IMAP set, e.g. [1, 2, 3, 7, 9, 10] -> '1:3,7,9:10'."""
+    ordered = sorted(set(uids))
+    if not ordered:
+        return ''
+    parts = []
+    start = prev = ordered[0]
+    for uid in ordered[1:]:
+        if uid == prev + 1:
+            prev = uid
+            continue
+        parts.append(f"{start}:{prev}" if start != prev else str(start))
+        start = prev = uid
+    parts.append(f"{start}:{prev}" if start != prev else str(start))
+    return ','.join(parts)
+
+
+def uid_set_batches(uids, max_uids: int, max_chars: int = 8000):
+    """Splits UIDs (ascending) into compact IMAP sets of at most `max_uids` UIDs and about
+    `max_chars` characters each, so a command line stays within server limits however
+    scattered the UIDs are. Yields (set_string, uids)."""
+    ordered = sorted(set(uids))
+    batch = []
+    length = 0
+    for uid in ordered:
+        # Extending a run (a:prev -> a:uid) costs at most a few chars; a new range costs its digits plus a comma
+        contiguous = batch and uid == batch[-1] + 1
+        cost = len(str(uid)) + 1
+        if batch and (len(batch) >= max_uids or (not contiguous and length + cost > max_chars)):
+            yield compress_uids(batch), batch
+            batch, length = [], 0
+        batch.append(uid)
+        length += 1 + len(str(uid)) if contiguous else cost
+    if batch:
+        yield compress_uids(batch), batch
+
+
+def chunks(items, size: int):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+# --- FETCH response parsing ---------------------------------------------------
+
+class _Literal(bytes):
+    """Marks a value that arrived as an IMAP literal."""
+
+
+_ATOM_END = b' ()\r\n'
+
+
+def _lex(text: bytes, out: list):
+    i = 0
+    n = len(text)
+    while i < n:
+        c = text[i:i + 1]
+        if c in (b' ', b'\r', b'\n'):
+            i += 1
+        elif c in (b'(', b')'):
+            out.append(c.decode())
+            i += 1
+        elif c == b'"':
+            j = i + 1
+            buf = bytearray()
+            while j < n and text[j:j + 1] != b'"':
+                if text[j:j + 1] == b'\\':
+                    j += 1
+                buf += text[j:j + 1]
+                j += 1
+            out.append(bytes(buf))
+            i = j + 1
+        elif c == b'{':
+            j = text.index(b'}', i)
+            out.append(_Literal())  # placeholder, filled from the following tuple element
+            i = j + 1
+        else:
+            # Atoms may contain bracketed sections with spaces, e.g. BODY[HEADER.FIELDS (FROM)]<0>
+            j = i
+            depth = 0
+            while j < n:
+                ch = text[j:j + 1]
+                if ch == b'[':
+                    depth += 1
+                elif ch == b']':
+                    depth -= 1
+                elif depth == 0 and ch in _ATOM_END:
+                    break
+                j += 1
+            out.append(text[i:j].decode('ascii', errors='replace'))
+            i = j
+
+
+def _tokens(data) -> list:
+    """Flattens imaplib's mix of (prefix, literal) tuples and plain bytes into one token list."""
+    out = []
+    for item in data:
+        if isinstance(item, tuple):
+            _lex(item[0], out)
+            if out and isinstance(out[-1], _Literal) and len(out[-1]) == 0:
+                out[-1] = _Literal(item[1])
+            else:
+                out.append(_Literal(item[1]))
+        elif isinstance(item, (bytes, bytearray)):
+            _lex(bytes(item), out)
+    return out
+
+
+def _parse_value(tokens, pos):
+    tok = tokens[pos]
+    if tok == '(':
+        items = []
+        pos += 1
+        while pos < len(tokens) and tokens[pos] != ')':
+            value, pos = _parse_value(tokens, pos)
+            items.append(value)
+        return items, pos + 1
+    if isinstance(tok, str) and tok.upper() == 'NIL':
+        return None, pos + 1
+    return tok, pos + 1
+
+
+def _item_name(key: str) -> str:
+    # Servers answer BODY.PEEK[...] as BODY[...]
+    return key.upper().replace('.PEEK', '')
+
+
+def parse_fetch(data) -> list:
+    """Parses the data of a (UID) FETCH response into one dict per message.
+
+    Keys are upper-cased item names (e.g. 'UID', 'RFC822', 'BODY[HEADER.FIELDS (FROM)]',
+    'BODYSTRUCTURE'); literals come back as bytes, lists as nested lists.
+    """
+    tokens = _tokens(data)
+    messages = []
+    pos = 0
+    while pos < len(tokens):
+        tok = tokens[pos]
+        if isinstance(tok, str) and tok.isdigit() and pos + 1 < len(tokens) and tokens[pos + 1] == '(':
+            items, pos = _parse_value(tokens, pos + 1)
+            msg = {'SEQ': int(tok)}
+            for k in range(0, len(items) - 1, 2):
+                if isinstance(items[k], str):
+                    msg[_item_name(items[k])] = items[k + 1]
+            if 'UID' in msg:
+                msg['UID'] = int(msg['UID'])
+            messages.append(msg)
+        else:
+            pos += 1
+    return messages
+
+
+def _text(value) -> str:
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).decode('ascii', errors='replace')
+    return value or ''
+
+
+def text_part(structure, subtype: str = 'plain', section: str = ''):
+    """Finds the first non-attachment text/<subtype> part (any text/* if `subtype` is None)
+    in a parsed BODYSTRUCTURE.
+
+    Returns {'section', 'subtype', 'charset', 'encoding', 'size'} (section as used in
+    BODY[...], e.g. '1' or '1.2'), or None if the message has no such part.
+    """
+    if not isinstance(structure, list) or not structure:
+        return None
+    if isinstance(structure[0], list):
+        # multipart: child parts come first, then the subtype and extension data
+        n = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            n += 1
+            found = text_part(child, subtype, f"{section}.{n}" if section else str(n))
+            if found:
+                return found
+        return None
+    if len(structure) < 7 or _text(structure[0]).lower() != 'text':
+        return None
+    if subtype is not None and _text(structure[1]).lower() != subtype:
+        return None
+    for ext in structure[7:]:
+        if isinstance(ext, list) and ext and _text(ext[0]).lower() == 'attachment':
+            return None
+    params = [_text(p) for p in structure[2] or [] if not isinstance(p, list)]
+    charset = dict(zip((p.lower() for p in params[::2]), params[1::2])).get('charset', 'utf-8')
+    size = _text(structure[6])
+    return {
+        'section': section or '1',
+        'subtype': _text(structure[1]).lower(),
+        'charset': charset,
+        'encoding': _text(structure[5]).lower() or '7bit',
+        'size': int(size) if size.isdigit() else 0,
+    }
+
+
+def item(msg: dict, prefix: str):
+    """Value of the first FETCH item whose name starts with `prefix` (servers differ in
+    how they echo e.g. HEADER.FIELDS lists or partial ranges)."""
+    for key, value in msg.items():
+        if key.startswith(prefix):
+            return value
+    return None
+
+
+def response_bytes(data) -> int:
+    """Rough number of bytes a response carried (literals plus protocol text)."""
+    total = 0
+    for item in data or []:
+        if isinstance(item, tuple):
+            total += sum(len(x) for x in item if isinstance(x, (bytes, bytearray)))
+        elif isinstance(item, (bytes, bytearray)):
+            total += len(item)
+    return total
+
+
+_MSGID_RE = re.compile(rb'^Message-ID:\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE)
+
+
+def header_message_id(header_bytes: bytes) -> str:
+    m = _MSGID_RE.search(header_bytes or b'')
+    return m.group(1).decode('utf-8', errors='replace') if m else ''
@@ -0,0 +1,305 @@
+import os
+import sys
+import time
+import threading
+import email_index
+import email_source
+import ollama_client
+import results_store
+
+try:
+    import numpy as np
+except ImportError:  # kNN stage is optional; the tuner falls back to the LLM for everything
+    np = None
+
+# First-stage classifier: every email labelled by the tuning runs is embedded once with an
+# Ollama embedding model and kept in a NumPy index (unit vectors + labels, saved as .npz).
+# A new email is embedded, scored against the whole index with one matrix product, and
+# decided by a similarity-weighted vote of its k nearest neighbours. Only votes that are
+# confident enough are returned; everything else is escalated to the generative model.
+KNN_ENABLED = os.environ.get('KNN', '1') != '0'
+EMBED_MODEL = os.environ.get('OLLAMA_EMBED_MODEL', 'nomic-embed-text')
+INDEX_PATH = os.environ.get('KNN_INDEX_PATH', './cache/knn_index.npz')
+STORAGE_DIR = os.environ.get('EMAIL_STORAGE_DIR', '/srv/storage/docker/email_data/raw_emails')
+RESULTS_DIR = os.environ.get('TUNING_RESULTS_DIR', './tuning_results')
+# Processed emails have left raw/ for staging; their labels are still worth embedding
+STAGING_DIRS = [
+    os.environ.get('STAGING_TO_DELETE_DIR', '/srv/storage/docker/email_data/staging/to_delete'),
+    os.environ.get('STAGING_KEEP_DIR', '/srv/storage/docker/email_data/staging/to_keep'),
+]
+K = int(os.environ.get('KNN_K', '7'))
+# Share of the (similarity-weighted) vote the winning label needs
+MIN_CONFIDENCE = float(os.environ.get('KNN_MIN_CONFIDENCE', '0.85'))
+# Mean similarity of the k neighbours; below this the email is unlike anything labelled
+MIN_SIMILARITY = float(os.environ.get('KNN_MIN_SIMILARITY', '0.6'))
+# With fewer labelled emails than this the stage stays off
+MIN_LABELS = int(os.environ.get('KNN_MIN_LABELS', '50'))
+EMBED_BATCH = 64
+
+_lock = threading.Lock()
+_index = None
+_loaded = False
+_failed = False
+
+
+def text(sender: str, subject: str, snippet: str) -> str:
+    """What gets embedded: the same fields the LLM prompt shows."""
+    return f"From: {sender}\nSubject: {subject}\nBody Snippet: {snippet}"
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _embed(texts: list):
+    out = []
+    for i in range(0, len(texts), EMBED_BATCH):
+        out.extend(ollama_client.embed(EMBED_MODEL, texts[i:i + EMBED_BATCH]))
+    if len(out) != len(texts):
+        raise ValueError(f"expected {len(texts)} embeddings, got {len(out)}")
+    return _normalize(out)
+
+
+def _read_index(path: str):
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {
+            'model': str(data['model']),
+            'numbering': str(data['numbering']) if 'numbering' in data.files else None,
+            'vectors': data['vectors'],
+            'labels': data['labels'],
+            'seq_ids': data['seq_ids'],
+        }
+
+
+def _write_index(path: str, index: dict):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + '.tmp.npz'
+    np.savez(tmp, model=np.array(index['model']), numbering=np.array(index['numbering']), vectors=index['vectors'],
+             labels=index['labels'], seq_ids=index['seq_ids'])
+    os.replace(tmp, path)
+
+
+def _load():
+    global _index, _loaded
+    with _lock:
+        if not _loaded:
+            _loaded = True
+            try:
+                index = _read_index(INDEX_PATH)
+            except Exception as e:
+                print(f"[kNN] Ignoring unreadable index {INDEX_PATH}: {e}")
+                index = None
+            if index is not None and index['model'] != EMBED_MODEL:
+                print(f"[kNN] Index was built with {index['model']}, not {EMBED_MODEL}; rebuild it to enable kNN")
+                index = None
+            _index = index
+    return _index
+
+
+def available() -> bool:
+    """True when numpy is installed and an index with enough labels exists for EMBED_MODEL."""
+    if not KNN_ENABLED or np is None or _failed:
+        return False
+    index = _load()
+    return index is not None and len(index['labels']) >= MIN_LABELS
+
+
+def reload():
+    """Forget the loaded index so the next call rereads INDEX_PATH (after a rebuild)."""
+    global _index, _loaded
+    with _lock:
+        _index, _loaded = None, False
+
+
+def _tally(sims, labels, k: int):
+    """Similarity-weighted vote over the top `k` columns of each row of `sims`.
+
+    Returns (promo_share, confidence, mean_similarity) arrays; one near-duplicate
+    outweighs several loose matches.
+    """
+    top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+    top_sims = np.take_along_axis(sims, top, axis=1)
+    weights = np.clip(top_sims, 0.0, None)
+    total = weights.sum(axis=1)
+    promo = np.where(total > 0, (weights * labels[top]).sum(axis=1) / np.maximum(total, 1e-12), 0.5)
+    return promo, np.maximum(promo, 1.0 - promo), top_sims.mean(axis=1)
+
+
+def vote(queries, index: dict, k: int = None):
+    """k-NN vote for each row of `queries` (unit vectors) against the whole index."""
+    k = max(1, min(k or K, len(index['labels'])))
+    return _tally(queries @ index['vectors'].T, index['labels'], k)
+
+
+def _decisions(promo, confidence, similarity) -> list:
+    out = []
+    for p, conf, sim in zip(promo, confidence, similarity):
+        if conf >= MIN_CONFIDENCE and sim >= MIN_SIMILARITY:
+            label = 'promotional' if p >= 0.5 else 'keep'
+            out.append((bool(p >= 0.5), f"kNN: {label} ({conf:.0%} of vote, similarity {sim:.2f})"))
+        else:
+            out.append(None)
+    return out
+
+
+def classify_many(emails: list) -> list:
+    """Classifies a list of (sender, subject, snippet) with one embedding call.
+
+    Returns one (is_promo, reason) per email, or None where the vote isn't confident
+    enough (or the stage is unavailable) and the email should go to the LLM.
+    """
+    global _failed
+    if not emails or not available():
+        return [None] * len(emails)
+    index = _load()
+    try:
+        queries = _embed([text(*e) for e in emails])
+    except Exception as e:
+        # Most likely the embedding model isn't pulled; don't pay for a failed call on every email
+        print(f"[kNN] Disabled for this run, embedding failed: {e}")
+        _failed = True
+        return [None] * len(emails)
+    return _decisions(*vote(queries, index))
+
+
+def classify(sender: str, subject: str, snippet: str):
+    """(is_promo, reason) from the neighbours, or None to escalate to the LLM."""
+    return classify_many([(sender, subject, snippet)])[0]
+
+
+def _labels_from_results(results_dir: str, storage_dir: str) -> dict:
+    """{seq_id: is_promo} from the tuning runs on `storage_dir`; the newest run wins when an email was reviewed twice.
+
+    Runs tuned on a differently numbered source (an mbox vs the UID-named directory) are
+    left out, as their seq_ids name other emails. Rows the kNN stage decided itself, and
+    cluster labels copied from another email, are skipped, so the index only learns from
+    the LLM and the rules.
+    """
+    labels = {}
+    if not os.path.isdir(results_dir):
+        return labels
+    store = results_store.store_path(results_dir)
+    results_store.sync(results_dir, path=store)
+    run_ids = [r['run_id'] for r in results_store.list_runs(store, numbering=email_source.numbering(storage_dir))]
+    # Newest run first, so the first row kept for an email is the one that wins
+    for row in results_store.decisions(run_ids=run_ids, statuses=results_store.SETTLED, path=store):
+        if (row['reason'] or '').startswith('kNN: ') or row['propagated_from'] is not None:
+            continue
+        labels.setdefault(row['seq_id'], row['status'] == '[DELETE]')
+    return labels
+
+
+def _texts(storage_dir: str, seq_ids: list) -> dict:
+    """{seq_id: embedding text} from the email index, else by parsing the file wherever it now lives."""
+    rows = {}
+    if email_index.INDEX_ENABLED and not email_source.is_archive(storage_dir):
+        try:
+            rows = email_index.lookup(storage_dir, seq_ids)
+        except Exception:
+            rows = {}
+    out = {}
+    for seq_id in seq_ids:
+        row = rows.get(seq_id)
+        if row is None:
+            for directory in [storage_dir] + STAGING_DIRS:
+                path = os.path.join(directory, f"{seq_id}.eml")
+                if email_source.exists(path):
+                    try:
+                        row = email_source.parse_path(path)
+                    except Exception:
+                        row = None
+                    break
+        if row is not None:
+            out[seq_id] = text(row['sender'], row['subject'], row['snippet'])
+    return out
+
+
+def build_index(results_dir: str = None, storage_dir: str = None, path: str = None, rebuild: bool = False) -> dict:
+    """Embeds every labelled email not yet in the index and saves it; returns counts.
+
+    Incremental: existing vectors are kept and only their labels refreshed, unless the
+    embedding model or the numbering of `storage_dir` changed, or `rebuild` is set.
+    """
+    if np is None:
+        raise RuntimeError("numpy is required for the kNN index")
+    results_dir = results_dir or RESULTS_DIR
+    storage_dir = storage_dir or STORAGE_DIR
+    path = path or INDEX_PATH
+
+    labels = _labels_from_results(results_dir, storage_dir)
+    numbering = email_source.numbering(storage_dir)
+    index = None if rebuild else _read_index(path)
+    # The stored seq_ids are only comparable with labels for the same numbering
+    if index is None or index['model'] != EMBED_MODEL or index['numbering'] != numbering:
+        index = {'model': EMBED_MODEL, 'numbering': numbering, 'vectors': None,
+                 'labels': np.zeros(0, dtype=np.float32), 'seq_ids': np.zeros(0, dtype=np.int64)}
+
+    known = {int(s): i for i, s in enumerate(index['seq_ids'])}
+    for seq_id, i in known.items():
+        if seq_id in labels:
+            index['labels'][i] = 1.0 if labels[seq_id] else 0.0
+
+    todo = sorted(s for s in labels if s not in known)
+    texts = _texts(storage_dir, todo)
+    new_ids = [s for s in todo if s in texts]
+    if new_ids:
+        vectors = _embed([texts[s] for s in new_ids])
+        new_labels = np.array([1.0 if labels[s] else 0.0 for s in new_ids], dtype=np.float32)
+        old = index['vectors']
+        index['vectors'] = vectors if old is None or not len(old) else np.vstack([old, vectors])
+        index['labels'] = np.concatenate([index['labels'], new_labels])
+        index['seq_ids'] = np.concatenate([index['seq_ids'], np.array(new_ids, dtype=np.int64)])
+    if index['vectors'] is not None:
+        _write_index(path, index)
+    reload()
+    return {
+        'labelled': len(labels),
+        'added': len(new_ids),
+        'missing': len(todo) - len(new_ids),
+        'total': len(index['seq_ids']),
+        'promotional': int(index['labels'].sum()),
+    }
+
+
+def evaluate(path: str = None, chunk: int = 1024) -> dict:
+    """Leave-one-out check of the current thresholds: how much kNN would decide, and how often it agrees."""
+    index = _read_index(path or INDEX_PATH)
+    if index is None or len(index['labels']) < 2:
+        return {'emails': 0 if index is None else len(index['labels'])}
+    vectors, labels = index['vectors'], index['labels']
+    decided = correct = 0
+    for start in range(0, len(labels), chunk):
+        queries = vectors[start:start + chunk]
+        # An email must not count as its own neighbour
+        sims = queries @ vectors.T
+        rows = np.arange(len(queries))
+        sims[rows, start + rows] = -np.inf
+        promo, confidence, similarity = _tally(sims, labels, max(1, min(K, len(labels) - 1)))
+        confident = (confidence >= MIN_CONFIDENCE) & (similarity >= MIN_SIMILARITY)
+        decided += int(confident.sum())
+        correct += int(((promo >= 0.5) == (labels[start:start + chunk] >= 0.5))[confident].sum())
+    return {
+        'emails': len(labels),
+        'decided': decided,
+        'coverage': decided / len(labels),
+        'agreement': correct / decided if decided else None,
+    }
+
+
+if __name__ == '__main__':
+    # Usage: python knn_classifier.py [RESULTS_DIR] [RAW_DIR] [--rebuild]
+    args = [a for a in sys.argv[1:] if a != '--rebuild']
+    start = time.time()
+    res = build_index(args[0] if args else None, args[1] if len(args) > 1 else None,
+                      rebuild='--rebuild' in sys.argv)
+    print(f"kNN index {INDEX_PATH} ({EMBED_MODEL}): {res['total']} emails ({res['promotional']} promotional), "
+          f"{res['added']} embedded, {res['missing']} labelled but not found, in {time.time() - start:.1f}s")
+    ev = evaluate()
+    if ev.get('decided') is not None:
+        agreement = 'n/a' if ev['agreement'] is None else f"{ev['agreement']:.1%}"
+        print(f"Leave-one-out at k={K}, confidence {MIN_CONFIDENCE}, similarity {MIN_SIMILARITY}: "
+              f"decides {ev['coverage']:.0%}, agrees with the label {agreement}")
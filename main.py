@@ -1,14 +1,18 @@
 import os
 from datetime import date
 from dotenv import load_dotenv
-import utils
-import downloader
-import tuner
-import processor
-import tuning_runs_manager
 
+# Each option imports what it needs when it is picked, so the menu comes up without
+# loading numpy, the kNN index or the IMAP code first (cli.py does the same per subcommand)
 load_dotenv()
 
+RAW_EMAILS_DIR = "/srv/storage/docker/email_data/raw_emails"
+
+def _ask_source():
+    """The raw_emails directory, or a downloaded .mbox to read in place."""
+    raw = input(f"Email source, a directory or .mbox? (Enter for {RAW_EMAILS_DIR}): ").strip()
+    return raw or RAW_EMAILS_DIR
+
 def main_menu():
     while True:
         print("\n" + "="*30)
@@ -18,11 +22,15 @@ def main_menu():
         print("2. Run Tuning/Review Session (default 50)")
         print("3. Process Tuning Results (move to staging)")
         print("4. Manage Tuning Runs (list/open/delete)")
+        print("5. Classify Entire Archive (resumable job)")
+        print("6. Apply Staged Deletions to Gmail (IMAP)")
         print("E. Exit")
         
         choice = input("\nSelect Option: ").strip().upper()
 
         if choice == '1':
+            import utils
+            import downloader
             default_dir = "/srv/storage/docker/email_data"
             target_dir = utils.get_target_directory(default_dir)
             
@@ -38,7 +46,8 @@ def main_menu():
                     )
 
         elif choice == '2':
-            storage_dir = "/srv/storage/docker/email_data/raw_emails"
+            import tuner
+            storage_dir = _ask_source()
             # Prompt for how many emails to review (default 50)
             raw = input("How many emails to review? (Enter for 50): ").strip()
             try:
@@ -47,16 +56,40 @@ def main_menu():
                     raise ValueError()
             except Exception:
                 n = 50
-            tuner.run_tuning_session(storage_dir, count=n)
+            raw = input(f"How many requests in flight? (Enter for {tuner.TUNING_WORKERS}): ").strip()
+            workers = int(raw) if raw.isdigit() and int(raw) > 0 else tuner.TUNING_WORKERS
+            raw = input(f"Emails per LLM prompt? (Enter for {tuner.TUNING_BATCH_SIZE}): ").strip()
+            batch_size = int(raw) if raw.isdigit() and int(raw) > 0 else tuner.TUNING_BATCH_SIZE
+            tuner.run_tuning_session(storage_dir, count=n, workers=workers, batch_size=batch_size)
         
         elif choice == '3':
-            storage_dir = "/srv/storage/docker/email_data/raw_emails"
+            import processor
+            storage_dir = _ask_source()
             # results_dir and staging_dir default via env; pass only storage_dir here
             processor.run_processor(storage_dir=storage_dir)
         
         elif choice == '4':
             # Manage previous tuning runs: list/delete/open
+            import tuning_runs_manager
             tuning_runs_manager.manage_tuning_runs()
+
+        elif choice == '5':
+            import tuner
+            import archive_job
+            storage_dir = _ask_source()
+            raw = input("Job name? (Enter for 'archive'; reuse a name to resume): ").strip()
+            name = raw or 'archive'
+            raw = input(f"How many shards (worker processes)? (Enter for {archive_job.SHARDS}): ").strip()
+            shards = int(raw) if raw.isdigit() and int(raw) > 0 else archive_job.SHARDS
+            raw = input(f"Requests in flight per shard? (Enter for {tuner.TUNING_WORKERS}): ").strip()
+            workers = int(raw) if raw.isdigit() and int(raw) > 0 else tuner.TUNING_WORKERS
+            archive_job.run_job(name, storage_dir, shards=shards, workers=workers)
+
+        elif choice == '6':
+            # The source supplies the UID manifest for what processor staged from it
+            import imap_apply
+            storage_dir = _ask_source()
+            imap_apply.run_apply(storage_dir=storage_dir)
             
         elif choice == 'E':
             print("Goodbye Keith!")
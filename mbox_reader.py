@@ -0,0 +1,294 @@
+import os
+import re
+import sys
+import mmap
+import time
+import sqlite3
+import threading
+import sqlite_local
+
+# Random access to the downloader's .mbox archive without exploding it into .eml files.
+# The file is memory-mapped and a persistent offset index (<mbox>.offsets.sqlite) records
+# where each message starts and ends plus its Message-ID and Date. Messages are numbered
+# 1..N in file order, which is the order the downloader appended them, so higher means
+# newer just like IMAP sequence ids. The archive only ever grows (a crash leaves a torn
+# tail that the next download truncates), so refresh() normally indexes just the new
+# tail; if the file shrank or its indexed prefix changed, it is reindexed from scratch.
+INDEX_SUFFIX = '.offsets.sqlite'
+# Bump when the indexed fields change so existing indexes are rebuilt
+INDEX_VERSION = '1'
+# Messages per INSERT batch and between progress lines while indexing
+INSERT_BATCH = 5000
+
+_HEADER_RE = re.compile(rb'^(message-id|date)[ \t]*:[ \t]*(.*(?:\r?\n[ \t].*)*)', re.IGNORECASE | re.MULTILINE)
+_FOLD_RE = re.compile(rb'\r?\n[ \t]+')
+
+_maps = {}
+_maps_lock = threading.Lock()
+
+
+def index_path(mbox_path: str) -> str:
+    return f"{os.path.abspath(mbox_path)}{INDEX_SUFFIX}"
+
+
+def _init(conn):
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS messages ('
+        ' seq_id INTEGER PRIMARY KEY,'
+        ' start INTEGER,'
+        ' end INTEGER,'
+        ' message_id TEXT,'
+        ' date TEXT)'
+    )
+
+
+def _connect(mbox_path: str) -> sqlite3.Connection:
+    return sqlite_local.connect(index_path(mbox_path), _init)
+
+
+def _get_meta(conn, key):
+    row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+
+def _set_meta(conn, key, value):
+    conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, str(value)))
+
+
+def _map(mbox_path: str):
+    """A read-only mmap of the archive, shared by all threads; remapped when the file has grown."""
+    path = os.path.abspath(mbox_path)
+    size = os.path.getsize(path)
+    with _maps_lock:
+        cached = _maps.get(path)
+        if cached is not None and cached[0] == size:
+            return cached[1]
+        if size == 0:
+            return b''
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # The old map is left to the garbage collector: another thread may still be slicing it
+        _maps[path] = (size, mm)
+        return mm
+
+
+def _headers(mm, start: int, end: int):
+    """(message_id, date) from the header block of the message at mm[start:end]."""
+    stop = min(p for p in (mm.find(b'\n\n', start, end), mm.find(b'\n\r\n', start, end), end) if p >= 0)
+    found = {}
+    for m in _HEADER_RE.finditer(mm[start:stop]):
+        name = m.group(1).lower()
+        if name not in found:
+            found[name] = _FOLD_RE.sub(b' ', m.group(2)).strip().decode('utf-8', errors='replace')
+    return found.get(b'message-id', '(No Message-ID)'), found.get(b'date', '(no date)')
+
+
+def _scan(mm, pos: int, seq_id: int):
+    """Yields (seq_id, start, end, message_id, date) for each message from offset `pos` on.
+
+    `pos` must be at a 'From ' separator line. start/end span the message itself, without
+    the separator line.
+    """
+    size = len(mm)
+    while pos < size:
+        line_end = mm.find(b'\n', pos)
+        if line_end < 0:
+            break
+        start = line_end + 1
+        nxt = mm.find(b'\nFrom ', start)
+        end = size if nxt < 0 else nxt + 1
+        seq_id += 1
+        yield (seq_id, start, end) + _headers(mm, start, end)
+        pos = end
+
+
+def refresh(mbox_path: str, force: bool = False) -> dict:
+    """Brings the offset index in line with the archive; returns counts.
+
+    An unchanged file (same size and mtime) costs one stat and one query. A file that grew
+    is indexed from its last known message on; one that shrank is reindexed.
+    """
+    conn = _connect(mbox_path)
+    stats = {"total": 0, "indexed": 0, "rebuilt": False, "unchanged": False}
+    st = os.stat(mbox_path)
+    stamp = f"{st.st_size}/{st.st_mtime_ns}"
+
+    if force or _get_meta(conn, 'version') != INDEX_VERSION:
+        conn.execute('DELETE FROM messages')
+        _set_meta(conn, 'version', INDEX_VERSION)
+        _set_meta(conn, 'stamp', '')
+        _set_meta(conn, 'size', 0)
+        conn.commit()
+    if _get_meta(conn, 'stamp') == stamp:
+        stats["total"] = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+        stats["unchanged"] = True
+        return stats
+
+    mm = _map(mbox_path)
+    indexed_size = int(_get_meta(conn, 'size') or 0)
+    last = conn.execute('SELECT seq_id, start FROM messages ORDER BY seq_id DESC LIMIT 1').fetchone()
+    # The last indexed message may have been cut short: reindex from its separator line
+    resume = None
+    if last is not None and indexed_size <= len(mm):
+        sep = mm.rfind(b'From ', 0, last[1])
+        if sep >= 0 and (sep == 0 or mm[sep - 1:sep] == b'\n'):
+            resume = (last[0] - 1, sep)
+    if resume is None:
+        if last is not None:
+            print(f"[Mbox] {mbox_path} changed before its last indexed message; reindexing it.")
+            stats["rebuilt"] = True
+        conn.execute('DELETE FROM messages')
+        resume = (0, 0)
+    else:
+        conn.execute('DELETE FROM messages WHERE seq_id > ?', (resume[0],))
+
+    # Skip anything before the first separator (an mbox should start with one)
+    pos = resume[1]
+    if mm[pos:pos + 5] != b'From ':
+        nxt = mm.find(b'\nFrom ', pos)
+        pos = len(mm) if nxt < 0 else nxt + 1
+
+    buf = []
+    for row in _scan(mm, pos, resume[0]):
+        buf.append(row)
+        if len(buf) >= INSERT_BATCH:
+            conn.executemany('INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)', buf)
+            stats["indexed"] += len(buf)
+            print(f"[Mbox] Indexed {resume[0] + stats['indexed']} message(s)...")
+            buf = []
+    if buf:
+        conn.executemany('INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)', buf)
+        stats["indexed"] += len(buf)
+    _set_meta(conn, 'size', len(mm))
+    _set_meta(conn, 'stamp', stamp)
+    conn.commit()
+    stats["total"] = conn.execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+    return stats
+
+
+def discard_after(mbox_path: str, size: int):
+    """Forgets indexed messages that don't fit in the first `size` bytes, before the archive is truncated.
+
+    Without this, messages appended after the truncation could land on the old offsets
+    and be taken for the messages indexed there before.
+    """
+    if not os.path.exists(index_path(mbox_path)):
+        return
+    conn = _connect(mbox_path)
+    with conn:
+        conn.execute('DELETE FROM messages WHERE end > ?', (size,))
+        _set_meta(conn, 'size', min(size, int(_get_meta(conn, 'size') or 0)))
+        _set_meta(conn, 'stamp', '')
+
+
+def count(mbox_path: str) -> int:
+    return _connect(mbox_path).execute('SELECT COUNT(*) FROM messages').fetchone()[0]
+
+
+def latest(mbox_path: str, count: int = 50) -> list:
+    """Seq ids of the newest `count` messages (highest first), straight from the index."""
+    rows = _connect(mbox_path).execute(
+        'SELECT seq_id FROM messages ORDER BY seq_id DESC LIMIT ?', (count,)).fetchall()
+    return [r[0] for r in rows]
+
+
+def seq_ids(mbox_path: str) -> list:
+    return [r[0] for r in _connect(mbox_path).execute('SELECT seq_id FROM messages ORDER BY seq_id')]
+
+
+def lookup(mbox_path: str, seq_ids) -> dict:
+    """Returns {seq_id: {'start', 'end', 'message_id', 'date'}} for the given ids that are indexed."""
+    conn = _connect(mbox_path)
+    out = {}
+    seq_ids = list(seq_ids)
+    for i in range(0, len(seq_ids), 500):
+        chunk = seq_ids[i:i + 500]
+        marks = ','.join('?' * len(chunk))
+        for row in conn.execute(
+            f'SELECT seq_id, start, end, message_id, date FROM messages WHERE seq_id IN ({marks})', chunk
+        ):
+            out[row[0]] = {'start': row[1], 'end': row[2], 'message_id': row[3], 'date': row[4]}
+    return out
+
+
+def _span(mbox_path: str, seq_id: int):
+    row = _connect(mbox_path).execute('SELECT start, end FROM messages WHERE seq_id = ?', (seq_id,)).fetchone()
+    if row is None:
+        raise KeyError(f"message {seq_id} is not in {mbox_path}")
+    return row
+
+
+def message(mbox_path: str, seq_id: int) -> memoryview:
+    """Message `seq_id` as a zero-copy view into the mapped archive."""
+    start, end = _span(mbox_path, seq_id)
+    return memoryview(_map(mbox_path))[start:end]
+
+
+def read(mbox_path: str, seq_id: int) -> bytes:
+    start, end = _span(mbox_path, seq_id)
+    return _map(mbox_path)[start:end]
+
+
+class MessageFile:
+    """A minimal read-only binary file over one message of the map, for fast_parser.
+
+    Lines are sliced straight out of the mmap, so nothing past what the parser asks for
+    is copied, and reads never run into the next message.
+    """
+
+    def __init__(self, mm, start: int, end: int):
+        self._mm = mm
+        self._pos = start
+        self._end = end
+
+    def readline(self, size: int = -1) -> bytes:
+        if self._pos >= self._end:
+            return b''
+        nl = self._mm.find(b'\n', self._pos, self._end)
+        stop = self._end if nl < 0 else nl + 1
+        if size is not None and size >= 0:
+            stop = min(stop, self._pos + size)
+        line = self._mm[self._pos:stop]
+        self._pos = stop
+        return line
+
+    def readline_startswith(self, prefix: bytes) -> bytes:
+        """The next line that starts with `prefix` (b'' if none), skipping the ones in between with find()."""
+        if self._mm[self._pos:self._pos + len(prefix)] != prefix:
+            hit = self._mm.find(b'\n' + prefix, self._pos, self._end)
+            if hit < 0:
+                self._pos = self._end
+                return b''
+            self._pos = hit + 1
+        return self.readline()
+
+    def read(self, size: int = -1) -> bytes:
+        stop = self._end if size is None or size < 0 else min(self._end, self._pos + size)
+        data = self._mm[self._pos:stop]
+        self._pos = stop
+        return data
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def open_message(mbox_path: str, seq_id: int) -> MessageFile:
+    start, end = _span(mbox_path, seq_id)
+    return MessageFile(_map(mbox_path), start, end)
+
+
+if __name__ == '__main__':
+    # Usage: python mbox_reader.py ARCHIVE.mbox  (build / update the offset index)
+    target = sys.argv[1]
+    begin = time.time()
+    res = refresh(target)
+    print(f"Index {index_path(target)}: {res['total']} messages, {res['indexed']} indexed"
+          f"{' (rebuilt)' if res['rebuilt'] else ''} in {time.time() - begin:.3f}s")
@@ -0,0 +1,334 @@
+import os
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+# Shared, pooled client for the local Ollama server(s). Every caller goes through one
+# requests.Session so TCP connections are reused, and through one retry/circuit-breaker
+# policy so a stopped container fails fast instead of timing out email by email.
+# OLLAMA_HOSTS may list several replicas; each request goes to the healthy endpoint with
+# the fewest requests in flight, and an endpoint that fails is taken out of rotation
+# until a health check (/api/version) finds it up again.
+def _normalize(host: str) -> str:
+    host = host.strip().rstrip('/')
+    return host if host.startswith('http') else f"http://{host}"
+
+
+OLLAMA_HOST = _normalize(os.environ.get('OLLAMA_HOST', 'http://127.0.0.1:11434'))
+OLLAMA_HOSTS = [_normalize(h) for h in os.environ.get('OLLAMA_HOSTS', '').split(',') if h.strip()] or [OLLAMA_HOST]
+TIMEOUT = float(os.environ.get('OLLAMA_TIMEOUT', '120'))
+MAX_RETRIES = int(os.environ.get('OLLAMA_MAX_RETRIES', '3'))
+BACKOFF_SEC = float(os.environ.get('OLLAMA_BACKOFF_SEC', '1.0'))
+POOL_SIZE = int(os.environ.get('OLLAMA_POOL_SIZE', '32'))
+# Consecutive failed requests (after retries) before the breaker opens, and how long it stays open
+BREAKER_THRESHOLD = int(os.environ.get('OLLAMA_BREAKER_THRESHOLD', '3'))
+BREAKER_COOLDOWN_SEC = float(os.environ.get('OLLAMA_BREAKER_COOLDOWN_SEC', '30'))
+HEALTH_TIMEOUT_SEC = float(os.environ.get('OLLAMA_HEALTH_TIMEOUT_SEC', '2'))
+# Passed through to /api/generate so the model stays resident between requests
+KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE')
+
+
+class OllamaUnavailable(Exception):
+    """Raised when Ollama cannot be reached (retries exhausted or every endpoint's circuit breaker open)."""
+
+
+_session = None
+_session_lock = threading.Lock()
+_breaker_lock = threading.Lock()
+
+
+def _new_endpoint(url: str) -> dict:
+    return {
+        "url": url,
+        "outstanding": 0,
+        # Consecutive failed requests; the breaker opens at BREAKER_THRESHOLD
+        "failures": 0,
+        "opened_at": None,
+        "requests": 0,
+        "errors": 0,
+        "busy_sec": 0.0,
+        "since": time.time(),
+    }
+
+
+_endpoints = [_new_endpoint(url) for url in OLLAMA_HOSTS]
+
+
+def session() -> requests.Session:
+    global _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=max(4, len(_endpoints)), pool_maxsize=POOL_SIZE)
+            s.mount('http://', adapter)
+            s.mount('https://', adapter)
+            _session = s
+    return _session
+
+
+def _probe(endpoint: dict) -> bool:
+    try:
+        r = session().get(f"{endpoint['url']}/api/version", timeout=HEALTH_TIMEOUT_SEC)
+        return r.status_code < 500
+    except requests.exceptions.RequestException:
+        return False
+
+
+def _open(endpoint: dict):
+    endpoint["opened_at"] = time.time()
+
+
+def _take(endpoint: dict) -> dict:
+    endpoint["outstanding"] += 1
+    endpoint["requests"] += 1
+    return endpoint
+
+
+def _acquire(tried: list, pinned: str = None) -> dict:
+    """The endpoint for the next attempt: least outstanding among healthy ones, untried first.
+
+    An endpoint whose breaker has cooled down gets a quick health check before it is
+    used again. Raises OllamaUnavailable when every endpoint is out.
+    """
+    while True:
+        with _breaker_lock:
+            now = time.time()
+            candidates = [e for e in _endpoints if pinned is None or e["url"] == pinned]
+            healthy = [e for e in candidates if e["opened_at"] is None]
+            if healthy:
+                fresh = [e for e in healthy if e["url"] not in {t["url"] for t in tried}] or healthy
+                return _take(min(fresh, key=lambda e: (e["outstanding"], e["requests"])))
+            cooled = [e for e in candidates if now - e["opened_at"] >= BREAKER_COOLDOWN_SEC]
+            if not cooled:
+                soonest = min(BREAKER_COOLDOWN_SEC - (now - e["opened_at"]) for e in candidates)
+                failures = max(e["failures"] for e in candidates)
+                raise OllamaUnavailable(
+                    f"Ollama circuit open after {failures} failures; retrying in {soonest:.0f}s"
+                )
+            probe = cooled[0]
+            if len(_endpoints) == 1:
+                # Half-open with a single server: let this request through as the probe
+                probe["opened_at"] = None
+                return _take(probe)
+            # Restart the cooldown so only this caller probes it
+            probe["opened_at"] = now
+        if _probe(probe):
+            with _breaker_lock:
+                probe["failures"] = 0
+                probe["opened_at"] = None
+
+
+def _release(endpoint: dict, ok: bool, elapsed: float, dead: bool = False):
+    with _breaker_lock:
+        endpoint["outstanding"] -= 1
+        endpoint["busy_sec"] += elapsed
+        if ok:
+            endpoint["failures"] = 0
+            endpoint["opened_at"] = None
+            return
+        endpoint["errors"] += 1
+        # A refused connection means the replica is gone; stop sending it work while others are up
+        if dead and any(e["opened_at"] is None for e in _endpoints if e is not endpoint):
+            _open(endpoint)
+
+
+def _record_failure(endpoints: list):
+    with _breaker_lock:
+        for endpoint in endpoints:
+            endpoint["failures"] += 1
+            if endpoint["failures"] >= BREAKER_THRESHOLD:
+                _open(endpoint)
+
+
+def breaker_open() -> bool:
+    """True while every endpoint's circuit breaker is open."""
+    with _breaker_lock:
+        return all(e["opened_at"] is not None for e in _endpoints)
+
+
+def endpoints() -> list:
+    """The configured endpoint URLs."""
+    return [e["url"] for e in _endpoints]
+
+
+def health_check() -> dict:
+    """Checks every endpoint now; returns {url: up} and takes down ones out of rotation."""
+    out = {}
+    for endpoint in _endpoints:
+        ok = _probe(endpoint)
+        with _breaker_lock:
+            if ok:
+                endpoint["failures"] = 0
+                endpoint["opened_at"] = None
+            elif endpoint["opened_at"] is None:
+                _open(endpoint)
+        out[endpoint["url"]] = ok
+    return out
+
+
+def endpoint_stats() -> list:
+    """Per-endpoint counters since the last reset, with throughput in requests/sec."""
+    now = time.time()
+    with _breaker_lock:
+        return [{
+            "url": e["url"],
+            "healthy": e["opened_at"] is None,
+            "outstanding": e["outstanding"],
+            "requests": e["requests"],
+            "errors": e["errors"],
+            "busy_sec": e["busy_sec"],
+            "requests_per_sec": e["requests"] / (now - e["since"]) if now > e["since"] else 0.0,
+        } for e in _endpoints]
+
+
+def print_endpoint_stats():
+    """One line per endpoint, when more than one is configured."""
+    if len(_endpoints) < 2:
+        return
+    for e in endpoint_stats():
+        print(f"Ollama {e['url']}: {e['requests']} requests ({e['requests_per_sec']:.2f}/s), "
+              f"{e['errors']} errors, busy {e['busy_sec']:.1f}s{'' if e['healthy'] else ' [DOWN]'}")
+
+
+def reset_endpoint_stats():
+    with _breaker_lock:
+        for e in _endpoints:
+            e.update(requests=0, errors=0, busy_sec=0.0, since=time.time())
+
+
+def request(method: str, path: str, timeout: float = None, retries: int = None, endpoint: str = None,
+            **kwargs) -> dict:
+    """Sends one request to Ollama with bounded retries on timeouts, connection errors and 5xx.
+
+    Each attempt goes to the least-loaded healthy endpoint, preferring ones this request
+    hasn't failed on yet; `endpoint` pins the request to one URL. Returns the decoded JSON
+    body. Raises OllamaUnavailable once retries are exhausted or while every endpoint's
+    circuit breaker is open; 4xx responses raise requests.HTTPError immediately.
+    """
+    timeout = timeout or TIMEOUT
+    retries = MAX_RETRIES if retries is None else retries
+    last_error = None
+    tried = []
+    for attempt in range(retries + 1):
+        target = _acquire(tried, endpoint)
+        # Failing over to another replica is immediate; retrying the same one backs off
+        if any(t is target for t in tried):
+            time.sleep(BACKOFF_SEC * (2 ** (attempt - 1)))
+        tried.append(target)
+        start = time.time()
+        try:
+            r = session().request(method, f"{target['url']}{path}", timeout=timeout, **kwargs)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+            # ConnectionError covers refused connections and replicas dying mid-request
+            _release(target, False, time.time() - start,
+                     dead=isinstance(e, requests.exceptions.ConnectionError))
+            last_error = f"{target['url']}: {type(e).__name__}: {e}"
+            continue
+        except Exception:
+            _release(target, False, time.time() - start)
+            raise
+        if r.status_code >= 500:
+            _release(target, False, time.time() - start)
+            last_error = f"{target['url']}: HTTP {r.status_code}: {r.text[:200]}"
+            continue
+        _release(target, True, time.time() - start)
+        r.raise_for_status()
+        return r.json()
+    failed = {e["url"]: e for e in tried}
+    _record_failure(list(failed.values()))
+    raise OllamaUnavailable(f"{path} failed after {retries + 1} attempt(s): {last_error}")
+
+
+def generate(model: str, prompt: str, options: dict = None, format: str = 'json', timeout: float = None,
+             endpoint: str = None) -> dict:
+    """Non-streaming /api/generate call; returns Ollama's full response object."""
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": False,
+    }
+    if format:
+        payload["format"] = format
+    if options:
+        payload["options"] = options
+    if KEEP_ALIVE:
+        payload["keep_alive"] = KEEP_ALIVE
+    return request('POST', '/api/generate', json=payload, timeout=timeout, endpoint=endpoint)
+
+
+def embed(model: str, inputs: list, timeout: float = None) -> list:
+    """Embeds a list of strings in one /api/embed call; returns one vector per input."""
+    payload = {"model": model, "input": list(inputs)}
+    if KEEP_ALIVE:
+        payload["keep_alive"] = KEEP_ALIVE
+    return request('POST', '/api/embed', json=payload, timeout=timeout).get('embeddings', [])
+
+
+def loaded_models(endpoint: str = None) -> list:
+    """Names of the models currently resident in memory (/api/ps)."""
+    data = request('GET', '/api/ps', timeout=10, retries=1, endpoint=endpoint)
+    return [m.get('name') or m.get('model') for m in data.get('models', [])]
+
+
+def _matches(model: str, name: str) -> bool:
+    return name == model or name == f"{model}:latest"
+
+
+def is_resident(model: str, endpoint: str = None) -> bool:
+    try:
+        return any(_matches(model, n or '') for n in loaded_models(endpoint))
+    except Exception:
+        return False
+
+
+def _warm_up_one(model: str, url: str, timeout: float) -> bool:
+    if is_resident(model, url):
+        return True
+    where = f" on {url}" if len(_endpoints) > 1 else ''
+    print(f"Loading model '{model}'{where} into memory...")
+    start = time.time()
+    try:
+        generate(model, '', format=None, timeout=timeout, endpoint=url)
+    except Exception as e:
+        print(f"Model warm-up failed{where}: {e}")
+        return False
+    print(f"Model '{model}' loaded{where} in {time.time() - start:.1f}s")
+    return True
+
+
+def warm_up(model: str, timeout: float = 600) -> bool:
+    """Loads `model` into memory on every endpoint before a session starts, unless /api/ps says it already is.
+
+    An empty prompt makes Ollama load the model without generating anything. Replicas
+    load in parallel. Returns True when the model is resident on at least one endpoint.
+    """
+    urls = [url for url, up in health_check().items() if up] if len(_endpoints) > 1 else endpoints()
+    if not urls:
+        print("Model warm-up skipped: no Ollama endpoint is reachable")
+        return False
+    with ThreadPoolExecutor(max_workers=len(urls)) as pool:
+        return any(list(pool.map(lambda url: _warm_up_one(model, url, timeout), urls)))
+
+
+_digests = {}
+
+
+def model_digest(model: str) -> str:
+    """Returns the digest Ollama reports for `model` (looked up once per process)."""
+    if model in _digests:
+        return _digests[model]
+    digest = 'unknown'
+    try:
+        data = request('GET', '/api/tags', timeout=5, retries=0)
+        for m in data.get('models', []):
+            if _matches(model, m.get('name') or '') or _matches(model, m.get('model') or ''):
+                digest = m.get('digest', 'unknown')
+                break
+    except Exception:
+        # Remember the failure too: retrying /api/tags for every cache lookup would count
+        # each miss toward the breaker while Ollama is down
+        pass
+    _digests[model] = digest
+    return digest
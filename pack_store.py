@@ -0,0 +1,448 @@
+import os
+import sys
+import time
+import zlib
+import struct
+import sqlite3
+import sqlite_local
+
+try:
+    import zstandard
+except ImportError:  # zlib is always there; zstd is smaller and much faster to decompress
+    zstandard = None
+
+# Optional packed layout for raw emails: instead of one file per message, messages are
+# compressed one by one and appended to large segment files (seg_00000.dat, ...) inside
+# a pack directory, with pack.sqlite mapping seq_id -> segment, offset and length. The
+# tuner and processor read a pack through email_source like any other source. Staging
+# is a flag in the index instead of a move: <pack>/to_delete/<seq>.eml and
+# <pack>/to_keep/<seq>.eml address flagged messages, so processor's journals and
+# reverts work unchanged. Each record starts with a small header (magic, seq_id,
+# lengths) so the segments stay self-describing.
+INDEX_NAME = 'pack.sqlite'
+# Written by the Go downloader next to its <uid>.eml files
+UIDVALIDITY_FILE = '.uidvalidity'
+SEGMENT_BYTES = int(os.environ.get('PACK_SEGMENT_MB', '256')) * 1024 * 1024
+ZSTD_LEVEL = int(os.environ.get('PACK_ZSTD_LEVEL', '3'))
+# Pseudo-directories inside a pack for each staging flag
+STAGE_DIRS = {'to_delete': 'delete', 'to_keep': 'keep'}
+# Messages per fsync + index commit while packing
+APPEND_BATCH = 500
+
+_RECORD = struct.Struct('>4sQII')  # magic, seq_id, stored length, raw length
+_MAGIC = b'EPK1'
+
+
+def is_pack(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, INDEX_NAME))
+
+
+def stage_dirs(pack: str):
+    """The (to_delete, to_keep) pseudo-directories processor uses as staging for a pack."""
+    return os.path.join(pack, 'to_delete'), os.path.join(pack, 'to_keep')
+
+
+def _init(conn):
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS messages ('
+        ' seq_id INTEGER PRIMARY KEY,'
+        ' segment INTEGER,'
+        ' offset INTEGER,'
+        ' length INTEGER,'
+        ' raw_length INTEGER,'
+        ' stage TEXT)'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_messages_stage ON messages(stage, seq_id)')
+
+
+def _connect(pack: str) -> sqlite3.Connection:
+    return sqlite_local.connect(os.path.join(os.path.abspath(pack), INDEX_NAME), _init, timeout=30)
+
+
+def _get_meta(conn, key):
+    row = conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+    return row[0] if row else None
+
+
+def create(pack: str, codec: str = None) -> str:
+    """Creates an empty pack (no-op if it exists); returns its codec."""
+    os.makedirs(pack, exist_ok=True)
+    conn = _connect(pack)
+    existing = _get_meta(conn, 'codec')
+    if existing:
+        return existing
+    codec = codec or ('zstd' if zstandard is not None else 'zlib')
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('codec', codec))
+        conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('created', time.strftime('%Y-%m-%dT%H:%M:%S')))
+    return codec
+
+
+def _codec(pack: str) -> str:
+    codec = _get_meta(_connect(pack), 'codec') or 'zlib'
+    if codec == 'zstd' and zstandard is None:
+        raise RuntimeError(f"{pack} is zstd-compressed; install the 'zstandard' package to read it")
+    return codec
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return zlib.compress(data, 6)
+
+
+def _decompress(data: bytes, codec: str, raw_length: int) -> bytes:
+    if codec == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_length)
+    return zlib.decompress(data)
+
+
+def _segment_path(pack: str, segment: int) -> str:
+    return os.path.join(pack, f"seg_{segment:05d}.dat")
+
+
+def append(pack: str, items) -> int:
+    """Appends (seq_id, raw bytes) pairs that aren't in the pack yet; returns how many were added.
+
+    Records are written and fsync'd before their index rows are committed, so a crash
+    can only leave unreferenced bytes at the end of a segment, never a dangling row.
+    """
+    codec = create(pack)
+    conn = _connect(pack)
+    row = conn.execute('SELECT MAX(segment) FROM messages').fetchone()
+    segment = row[0] or 0
+    known = {r[0] for r in conn.execute('SELECT seq_id FROM messages')}
+    added = 0
+    rows = []
+    f = open(_segment_path(pack, segment), 'ab')
+    try:
+        def commit():
+            f.flush()
+            os.fsync(f.fileno())
+            with conn:
+                conn.executemany('INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, NULL)', rows)
+            rows.clear()
+
+        for seq_id, data in items:
+            if seq_id in known:
+                continue
+            if f.tell() >= SEGMENT_BYTES:
+                commit()
+                f.close()
+                segment += 1
+                f = open(_segment_path(pack, segment), 'ab')
+            stored = _compress(data, codec)
+            f.write(_RECORD.pack(_MAGIC, seq_id, len(stored), len(data)))
+            offset = f.tell()
+            f.write(stored)
+            rows.append((seq_id, segment, offset, len(stored), len(data)))
+            known.add(seq_id)
+            added += 1
+            if len(rows) >= APPEND_BATCH:
+                commit()
+        commit()
+    finally:
+        f.close()
+    return added
+
+
+def _where(stage):
+    if stage == 'any':
+        return '', []
+    if stage is None:
+        return ' WHERE stage IS NULL', []
+    return ' WHERE stage = ?', [stage]
+
+
+def seq_ids(pack: str, stage=None) -> list:
+    """Seq ids with the given staging flag (None = not staged, 'any' = all), ascending."""
+    where, params = _where(stage)
+    return [r[0] for r in _connect(pack).execute(f'SELECT seq_id FROM messages{where} ORDER BY seq_id', params)]
+
+
+def latest(pack: str, count: int = 50, stage=None) -> list:
+    """Seq ids of the newest `count` messages with the given flag (highest first)."""
+    where, params = _where(stage)
+    rows = _connect(pack).execute(
+        f'SELECT seq_id FROM messages{where} ORDER BY seq_id DESC LIMIT ?', params + [count]).fetchall()
+    return [r[0] for r in rows]
+
+
+def lookup(pack: str, seq_ids) -> dict:
+    """Returns {seq_id: {'segment', 'offset', 'length', 'raw_length', 'stage'}} for ids in the pack."""
+    conn = _connect(pack)
+    out = {}
+    seq_ids = list(seq_ids)
+    for i in range(0, len(seq_ids), 500):
+        chunk = seq_ids[i:i + 500]
+        marks = ','.join('?' * len(chunk))
+        for row in conn.execute(
+            f'SELECT seq_id, segment, offset, length, raw_length, stage FROM messages WHERE seq_id IN ({marks})',
+            chunk,
+        ):
+            out[row[0]] = {'segment': row[1], 'offset': row[2], 'length': row[3], 'raw_length': row[4],
+                           'stage': row[5]}
+    return out
+
+
+def read(pack: str, seq_id: int) -> bytes:
+    row = _connect(pack).execute(
+        'SELECT segment, offset, length, raw_length FROM messages WHERE seq_id = ?', (seq_id,)).fetchone()
+    if row is None:
+        raise FileNotFoundError(f"message {seq_id} is not in {pack}")
+    with open(_segment_path(pack, row[0]), 'rb') as f:
+        f.seek(row[1])
+        return _decompress(f.read(row[2]), _codec(pack), row[3])
+
+
+class MessageFile:
+    """A read-only binary file over one record that decompresses as it is read, for fast_parser.
+
+    A reader that stops early never inflates the rest, and like mbox_reader.MessageFile it
+    can jump to the next line with a given prefix using find() instead of a per-line loop.
+    """
+
+    def __init__(self, f, length: int, codec: str):
+        self._f = f
+        self._left = length
+        self._d = zstandard.ZstdDecompressor().decompressobj() if codec == 'zstd' else zlib.decompressobj()
+        self._buf = b''
+        self._pos = 0
+
+    def _fill(self) -> bool:
+        """Inflates the next compressed chunk onto the unread tail; False once the record is used up."""
+        if self._left <= 0:
+            return False
+        chunk = self._f.read(min(65536, self._left))
+        if not chunk:
+            self._left = 0
+            return False
+        self._left -= len(chunk)
+        self._buf = self._buf[self._pos:] + self._d.decompress(chunk)
+        self._pos = 0
+        return True
+
+    def readline(self, size: int = -1) -> bytes:
+        scanned = self._pos
+        nl = self._buf.find(b'\n', scanned)
+        while nl < 0:
+            scanned = len(self._buf) - self._pos
+            if not self._fill():
+                break
+            nl = self._buf.find(b'\n', scanned)
+        stop = len(self._buf) if nl < 0 else nl + 1
+        if size is not None and size >= 0:
+            stop = min(stop, self._pos + size)
+        line = self._buf[self._pos:stop]
+        self._pos = stop
+        return line
+
+    def readline_startswith(self, prefix: bytes) -> bytes:
+        """The next line that starts with `prefix` (b'' if none), skipping the ones in between with find()."""
+        while len(self._buf) - self._pos < len(prefix) and self._fill():
+            pass
+        if self._buf.startswith(prefix, self._pos):
+            return self.readline()
+        needle = b'\n' + prefix
+        while True:
+            hit = self._buf.find(needle, self._pos)
+            if hit >= 0:
+                self._pos = hit + 1
+                return self.readline()
+            # Keep just enough of the tail for a match that straddles the next chunk
+            self._pos = max(self._pos, len(self._buf) - len(needle) + 1)
+            if not self._fill():
+                self._pos = len(self._buf)
+                return b''
+
+    def read(self, size: int = -1) -> bytes:
+        while (size is None or size < 0 or len(self._buf) - self._pos < size) and self._fill():
+            pass
+        stop = len(self._buf) if size is None or size < 0 else min(len(self._buf), self._pos + size)
+        data = self._buf[self._pos:stop]
+        self._pos = stop
+        return data
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def open_message(pack: str, seq_id: int) -> MessageFile:
+    """Message `seq_id` as a binary file that decompresses as it is read."""
+    row = _connect(pack).execute('SELECT segment, offset, length FROM messages WHERE seq_id = ?', (seq_id,)).fetchone()
+    if row is None:
+        raise FileNotFoundError(f"message {seq_id} is not in {pack}")
+    f = open(_segment_path(pack, row[0]), 'rb')
+    f.seek(row[1])
+    return MessageFile(f, row[2], _codec(pack))
+
+
+def set_stage(pack: str, seq_id: int, src_stage, dst_stage):
+    """Moves a message between staging flags (None = raw). Raises FileNotFoundError like a missing rename source."""
+    conn = _connect(pack)
+    with conn:
+        cur = conn.execute('UPDATE messages SET stage = ? WHERE seq_id = ? AND stage IS ?',
+                           (dst_stage, seq_id, src_stage))
+        if cur.rowcount:
+            return
+        row = conn.execute('SELECT stage FROM messages WHERE seq_id = ?', (seq_id,)).fetchone()
+    # Flagged already (e.g. before an interrupted run could journal it)?
+    if row is None or row[0] != dst_stage:
+        raise FileNotFoundError(f"message {seq_id} is not staged as {src_stage or 'raw'} in {pack}")
+
+
+def scan(pack: str, stage='any'):
+    """Yields (seq_id, raw bytes) in on-disk order, so a full pass is sequential reads of each segment."""
+    codec = _codec(pack)
+    where, params = _where(stage)
+    rows = _connect(pack).execute(
+        f'SELECT seq_id, segment, offset, length, raw_length FROM messages{where} ORDER BY segment, offset', params
+    ).fetchall()
+    f = None
+    current = None
+    try:
+        for seq_id, segment, offset, length, raw_length in rows:
+            if segment != current:
+                if f:
+                    f.close()
+                f = open(_segment_path(pack, segment), 'rb', buffering=1024 * 1024)
+                current = segment
+            if f.tell() != offset:
+                f.seek(offset)
+            yield seq_id, _decompress(f.read(length), codec, raw_length)
+    finally:
+        if f:
+            f.close()
+
+
+def stats(pack: str) -> dict:
+    conn = _connect(pack)
+    row = conn.execute(
+        'SELECT COUNT(*), COALESCE(SUM(raw_length), 0), COALESCE(SUM(length), 0), COUNT(DISTINCT segment),'
+        " COALESCE(SUM(stage = 'delete'), 0), COALESCE(SUM(stage = 'keep'), 0) FROM messages"
+    ).fetchone()
+    return {"messages": row[0], "raw_bytes": row[1], "stored_bytes": row[2], "segments": row[3],
+            "to_delete": row[4], "to_keep": row[5], "codec": _get_meta(conn, 'codec')}
+
+
+def _eml_files(directory: str):
+    if not directory or not os.path.isdir(directory):
+        return []
+    with os.scandir(directory) as it:
+        names = [e.name for e in it if e.name.endswith('.eml') and e.name[:-4].isdigit()]
+    return sorted((int(n[:-4]), os.path.join(directory, n)) for n in names)
+
+
+def pack_directory(raw_dir: str, pack: str, delete_dir: str = None, keep_dir: str = None) -> dict:
+    """Packs a raw_emails directory (and optionally the staging directories, as flags).
+
+    Resumable: messages already in the pack are skipped. The .eml files are left in place.
+    Each packed message's flag is then set from the directory it was found in (raw_dir
+    means unstaged), so flags left behind by an interrupted restage don't survive a repack.
+    """
+    before = dict(_connect(pack).execute('SELECT seq_id, stage FROM messages')) if is_pack(pack) else {}
+    stats_out = {}
+    placed = {}
+    for directory, stage in ((raw_dir, None), (delete_dir, 'delete'), (keep_dir, 'keep')):
+        files = _eml_files(directory)
+        if not files:
+            continue
+
+        def read_all():
+            for n, (seq_id, path) in enumerate(files, start=1):
+                with open(path, 'rb') as f:
+                    yield seq_id, f.read()
+                if n % 10000 == 0:
+                    print(f"[Pack] {n}/{len(files)} from {directory}...")
+
+        stats_out[stage or 'raw'] = append(pack, read_all())
+        for seq_id, _ in files:
+            placed[seq_id] = stage
+
+    if placed:
+        conn = _connect(pack)
+        with conn:
+            conn.executemany('UPDATE messages SET stage = ? WHERE seq_id = ? AND stage IS NOT ?',
+                             [(stage, seq_id, stage) for seq_id, stage in placed.items()])
+    stale = sum(1 for seq_id, stage in placed.items() if seq_id in before and before[seq_id] != stage)
+    if stale:
+        print(f"[Pack] Reset {stale} stage flag(s) that didn't match the directories packed.")
+    stats_out['reset'] = stale
+    _copy_uidvalidity(raw_dir, pack)
+    return stats_out
+
+
+def unpack(pack: str, raw_dir: str, delete_dir: str = None, keep_dir: str = None) -> dict:
+    """Writes the pack back out as <seq>.eml files; staged messages go to the staging dirs if given."""
+    targets = {None: raw_dir, 'delete': delete_dir, 'keep': keep_dir}
+    written = {}
+    for stage, directory in targets.items():
+        if not directory:
+            continue
+        os.makedirs(directory, exist_ok=True)
+        n = 0
+        for seq_id, data in scan(pack, stage):
+            path = os.path.join(directory, f"{seq_id}.eml")
+            if not os.path.exists(path):
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(path + '.tmp', path)
+                n += 1
+        written[stage or 'raw'] = n
+    _copy_uidvalidity(pack, raw_dir)
+    return written
+
+
+def _copy_uidvalidity(src_dir: str, dst_dir: str):
+    # Files named <uid>.eml by the Go downloader are only meaningful with the UIDVALIDITY it
+    # recorded next to them; it travels with them so imap_apply can still use them as UIDs
+    src = os.path.join(src_dir, UIDVALIDITY_FILE)
+    if os.path.exists(src):
+        with open(src, 'rb') as f:
+            data = f.read()
+        with open(os.path.join(dst_dir, UIDVALIDITY_FILE), 'wb') as f:
+            f.write(data)
+
+
+def _human(num: float) -> str:
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if num < 1024.0:
+            return f"{num:.1f}{unit}"
+        num /= 1024.0
+    return f"{num:.1f}TB"
+
+
+if __name__ == '__main__':
+    # Usage: python pack_store.py pack RAW_DIR PACK_DIR [DELETE_DIR KEEP_DIR]
+    #        python pack_store.py unpack PACK_DIR RAW_DIR [DELETE_DIR KEEP_DIR]
+    #        python pack_store.py stats PACK_DIR
+    cmd, args = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 2 else ('', [])
+    target = None
+    begin = time.time()
+    if cmd == 'pack':
+        print(f"Packed: {pack_directory(args[0], args[1], *args[2:4])}")
+        target = args[1]
+    elif cmd == 'unpack':
+        print(f"Unpacked: {unpack(args[0], args[1], *args[2:4])}")
+        target = args[0]
+    elif cmd == 'stats':
+        target = args[0]
+    else:
+        print("Usage: python pack_store.py pack RAW_DIR PACK_DIR [DELETE_DIR KEEP_DIR] | "
+              "unpack PACK_DIR RAW_DIR [DELETE_DIR KEEP_DIR] | stats PACK_DIR")
+        sys.exit(2)
+    s = stats(target)
+    ratio = s['stored_bytes'] / s['raw_bytes'] if s['raw_bytes'] else 0
+    print(f"{target}: {s['messages']} messages in {s['segments']} segment(s), {_human(s['raw_bytes'])} -> "
+          f"{_human(s['stored_bytes'])} ({ratio:.0%}, {s['codec']}); staged delete {s['to_delete']}, "
+          f"keep {s['to_keep']} ({time.time() - begin:.1f}s)")
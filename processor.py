@@ -1,10 +1,15 @@
 import os
 import sys
-import csv
+import json
+import time
+import errno
 import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List
-import email
-from email import policy
+import email_source
+import pack_store
+import results_store
 
 
 # Defaults align with tuner.py and storage layout
@@ -12,46 +17,51 @@ STORAGE_DIR = os.environ.get('EMAIL_STORAGE_DIR', '/srv/storage/docker/email_dat
 RESULTS_DIR = os.environ.get('TUNING_RESULTS_DIR', './tuning_results')
 STAGING_DIR = os.environ.get('STAGING_TO_DELETE_DIR', '/srv/storage/docker/email_data/staging/to_delete')
 STAGING_KEEP_DIR = os.environ.get('STAGING_KEEP_DIR', '/srv/storage/docker/email_data/staging/to_keep')
+# Journals of bulk runs (used to resume interrupted runs and to revert)
+JOURNAL_DIR = os.environ.get('PROCESSOR_JOURNAL_DIR', os.path.join(os.path.dirname(STAGING_DIR), 'journals'))
+# Parallel renames in bulk mode
+BULK_WORKERS = int(os.environ.get('PROCESSOR_WORKERS', '16'))
 
 
-def _list_tuning_csvs(results_dir: str) -> List[str]:
-    if not os.path.isdir(results_dir):
-        return []
-    files = [
-        os.path.join(results_dir, f)
-        for f in os.listdir(results_dir)
-        if f.startswith('tuning_') and f.endswith('.csv')
-    ]
-    # Sort by filename descending (tuning_YYYYMMDD-HHMMSS.csv → lexicographic = chronological)
-    files.sort(reverse=True)
-    return files
+def _trim(text: str, max_len: int = 60) -> str:
+    s = (text or '').replace('\n', ' ').strip()
+    return s if len(s) <= max_len else s[: max_len - 1] + '…'
 
 
-def _read_email_date(path: str) -> str:
-    try:
-        with open(path, 'rb') as f:
-            msg = email.message_from_binary_file(f, policy=policy.default)
-        return msg.get('Date', '(no date)')
-    except Exception:
-        return '(no date)'
+def _serial_process(run_ids, raw_dir, delete_dir, keep_dir, mode, apply_keep, apply_delete, dry_run,
+                    store: str = None) -> dict:
+    """Plans the selected runs like bulk mode (newest run's label wins), then moves one email at a time, no journal."""
+    labels = results_store.latest_labels(run_ids, path=store)
+    moves, stats = _plan_moves(run_ids, raw_dir, delete_dir, keep_dir, mode, apply_keep, apply_delete, store,
+                               labels=labels)
+    counter = "moved" if mode == 'move' else "reverted"
+    if not dry_run:
+        for d in {os.path.dirname(dst) for _, _, _, dst in moves}:
+            email_source.makedirs(d)
+    for seq_id, label, src, dst in moves:
+        subject = labels[int(seq_id)].get('subject') or ''
+        try:
+            if dry_run:
+                print(f"DRY-RUN {counter.upper()} {label} | id={seq_id:<6} | {_trim(subject, 50)}")
+            else:
+                _rename(src, dst)
+                print(f"{counter.upper():<9} {label} | id={seq_id:<6} | {_trim(subject, 50)}")
+            stats[f"{counter}_{label.lower()}"] += 1
+        except FileNotFoundError:
+            stats["missing"] += 1
+        except Exception as e:
+            stats["errors"] += 1
+            print(f"ERROR | id={seq_id} | {e}")
+    return stats
 
 
-def _trim(text: str, max_len: int = 60) -> str:
-    s = (text or '').replace('\n', ' ').strip()
-    return s if len(s) <= max_len else s[: max_len - 1] + '…'
+def _snapshot(directory: str) -> set:
+    """Filenames of the .eml files in a directory (or mbox), read once (empty if it doesn't exist)."""
+    return email_source.names(directory)
 
 
-def _process_csv(
-    csv_path: str,
-    raw_dir: str,
-    delete_dir: str,
-    keep_dir: str,
-    mode: str = 'move',
-    apply_keep: bool = True,
-    apply_delete: bool = True,
-    dry_run: bool = False,
-) -> dict:
-    stats = {
+def _new_stats() -> dict:
+    return {
         "moved_delete": 0,
         "moved_keep": 0,
         "reverted_delete": 0,
@@ -61,113 +71,371 @@ def _process_csv(
         "errors": 0,
     }
 
-    with open(csv_path, 'r', encoding='utf-8', newline='') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            status = (row.get('status') or '').strip()  # '[DELETE]' or '[ KEEP ]' or others
-            seq_id = str(row.get('seq_id') or '').strip()
-            subject = (row.get('subject') or '')
-
-            # Only act on requested statuses
-            if status == '[DELETE]' and not apply_delete:
-                continue
-            if status == '[ KEEP ]' and not apply_keep:
-                continue
-            if status not in ('[DELETE]', '[ KEEP ]'):
-                # Unknown or summary rows: skip silently
-                continue
 
-            if not seq_id.isdigit():
+def _plan_moves(
+    run_ids: List[str],
+    raw_dir: str,
+    delete_dir: str,
+    keep_dir: str,
+    mode: str = 'move',
+    apply_keep: bool = True,
+    apply_delete: bool = True,
+    store: str = None,
+    labels: dict = None,
+):
+    """Plans every move for the selected runs up front against one snapshot of the directories.
+
+    Returns (moves, stats) where each move is [seq_id, label, src, dst]. An email settled
+    by several runs is planned once, with the newest run's label; the status filter is
+    applied after that, so M2 doesn't stage an email a newer run decided to keep.
+    """
+    stats = _new_stats()
+    raw_set = _snapshot(raw_dir)
+    delete_set = _snapshot(delete_dir)
+    keep_set = _snapshot(keep_dir)
+    from_mbox = email_source.is_mbox(raw_dir)
+    moves = []
+
+    if labels is None:
+        labels = results_store.latest_labels(run_ids, path=store)
+    for seq_id in sorted(labels, reverse=True):
+        status = labels[seq_id]['status']
+        if status == '[DELETE]' and not apply_delete:
+            continue
+        if status == '[ KEEP ]' and not apply_keep:
+            continue
+
+        filename = f"{seq_id}.eml"
+        label = 'DELETE' if status == '[DELETE]' else 'KEEP'
+        stage_dir = delete_dir if label == 'DELETE' else keep_dir
+        stage_set = delete_set if label == 'DELETE' else keep_set
+
+        if mode == 'move':
+            if filename in delete_set or filename in keep_set:
+                stats["already"] += 1
+            elif filename in raw_set:
+                moves.append([str(seq_id), label, os.path.join(raw_dir, filename), os.path.join(stage_dir, filename)])
+            else:
                 stats["missing"] += 1
-                continue
+        elif mode == 'revert':
+            if filename in raw_set and not from_mbox:
+                stats["already"] += 1
+            elif filename in stage_set:
+                moves.append([str(seq_id), label, os.path.join(stage_dir, filename), os.path.join(raw_dir, filename)])
+            else:
+                stats["missing"] += 1
+        else:
+            stats["errors"] += 1
+    return moves, stats
 
-            filename = f"{seq_id}.eml"
 
+def _rename(src: str, dst: str):
+    # Within a pack, staging only flips the message's flag
+    if email_source.restage(src, dst):
+        return
+    # Staging from an mbox writes a copy of the message; reverting one just drops the copy
+    if email_source.split(src):
+        tmp = f"{dst}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(email_source.read(src))
+        os.replace(tmp, dst)
+        return
+    if email_source.split(dst):
+        os.remove(src)
+        return
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            # Renamed already (e.g. before an interrupted run could journal it)?
+            if not os.path.exists(src) and os.path.exists(dst):
+                return
+            raise
+        shutil.move(src, dst)
+
+
+def _write_journal_header(journal_path: str, mode: str, moves: list, sources: List[str]):
+    os.makedirs(os.path.dirname(journal_path), exist_ok=True)
+    with open(journal_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"type": "plan", "mode": mode, "created": time.strftime('%Y-%m-%d %H:%M:%S'),
+                            "sources": sources, "moves": moves}) + "\n")
+
+
+def _read_journal(journal_path: str):
+    """Returns (plan, done_indices, complete) from a journal file; a torn last line is ignored."""
+    plan = None
+    done = set()
+    complete = False
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry.get("type") == "plan":
+                plan = entry
+            elif entry.get("type") == "done":
+                done.add(entry["i"])
+            elif entry.get("type") == "complete":
+                complete = True
+    return plan, done, complete
+
+
+def _execute_journal(journal_path: str, workers: int = None, dry_run: bool = False) -> dict:
+    """Runs (or resumes) every move in a journal that isn't marked done, as parallel renames.
+
+    Each finished move is appended to the journal, so an interrupted run picks up where
+    it stopped and a revert can replay exactly what happened.
+    """
+    plan, done, _ = _read_journal(journal_path)
+    stats = _new_stats()
+    moves = plan["moves"]
+    counter = "moved" if plan["mode"] == 'move' else "reverted"
+    todo = [i for i in range(len(moves)) if i not in done]
+
+    if dry_run:
+        for i in todo:
+            seq_id, label, src, dst = moves[i]
+            print(f"DRY-RUN {counter.upper()} {label} | id={seq_id:<6} | {src} -> {dst}")
+            stats[f"{counter}_{label.lower()}"] += 1
+        return stats
+
+    for d in {os.path.dirname(moves[i][3]) for i in todo}:
+        email_source.makedirs(d)
+
+    workers = workers or BULK_WORKERS
+    with open(journal_path, 'a', encoding='utf-8') as journal, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_rename, moves[i][2], moves[i][3]): i for i in todo}
+        for n, fut in enumerate(as_completed(futures), start=1):
+            i = futures[fut]
+            seq_id, label, src, dst = moves[i]
             try:
-                if mode == 'move':
-                    src = os.path.join(raw_dir, filename)
-                    if status == '[DELETE]':
-                        dst = os.path.join(delete_dir, filename)
-                        label = 'DELETE'
-                    else:
-                        dst = os.path.join(keep_dir, filename)
-                        label = 'KEEP'
-
-                    # Already in either staging?
-                    if os.path.exists(os.path.join(delete_dir, filename)) or os.path.exists(os.path.join(keep_dir, filename)):
-                        stats["already"] += 1
-                        continue
-
-                    if os.path.exists(src):
-                        os.makedirs(os.path.dirname(dst), exist_ok=True)
-                        if dry_run:
-                            print(f"DRY-RUN MOVE {label} | id={seq_id:<6} | {_trim(subject, 50)}")
-                        else:
-                            shutil.move(src, dst)
-                            print(f"MOVED     {label} | id={seq_id:<6} | {_trim(subject, 50)}")
-                        if status == '[DELETE]':
-                            stats["moved_delete"] += 1
-                        else:
-                            stats["moved_keep"] += 1
-                    else:
-                        stats["missing"] += 1
-
-                elif mode == 'revert':
-                    if status == '[DELETE]':
-                        src = os.path.join(delete_dir, filename)
-                        label = 'DELETE'
-                    else:
-                        src = os.path.join(keep_dir, filename)
-                        label = 'KEEP'
-                    dst = os.path.join(raw_dir, filename)
-
-                    # Already back in raw?
-                    if os.path.exists(dst):
-                        stats["already"] += 1
-                        continue
-
-                    if os.path.exists(src):
-                        os.makedirs(raw_dir, exist_ok=True)
-                        if dry_run:
-                            print(f"DRY-RUN REVERT {label} | id={seq_id:<6} | {_trim(subject, 50)}")
-                        else:
-                            shutil.move(src, dst)
-                            print(f"REVERTED  {label} | id={seq_id:<6} | {_trim(subject, 50)}")
-                        if status == '[DELETE]':
-                            stats["reverted_delete"] += 1
-                        else:
-                            stats["reverted_keep"] += 1
-                    else:
-                        stats["missing"] += 1
-                else:
-                    # Unknown mode
-                    stats["errors"] += 1
+                fut.result()
+                journal.write(json.dumps({"type": "done", "i": i}) + "\n")
+                stats[f"{counter}_{label.lower()}"] += 1
+            except FileNotFoundError:
+                stats["missing"] += 1
             except Exception as e:
                 stats["errors"] += 1
                 print(f"ERROR | id={seq_id} | {e}")
+            if n % 1000 == 0:
+                journal.flush()
+                print(f"Progress: {n}/{len(todo)} moves...")
+        # A journal with failed moves stays incomplete so the next run offers to resume it
+        if not stats["errors"]:
+            journal.write(json.dumps({"type": "complete"}) + "\n")
+        journal.flush()
+        os.fsync(journal.fileno())
+    if stats["errors"]:
+        print(f"{stats['errors']} move(s) failed; the journal stays open, resume it to retry them: {journal_path}")
+    return stats
+
+
+def _list_journals(journal_dir: str) -> List[str]:
+    if not os.path.isdir(journal_dir):
+        return []
+    files = [os.path.join(journal_dir, f) for f in os.listdir(journal_dir) if f.endswith('.jsonl')]
+    files.sort(reverse=True)
+    return files
+
 
+def _incomplete_journals(journal_dir: str) -> List[str]:
+    return [p for p in _list_journals(journal_dir) if not _read_journal(p)[2]]
+
+
+def _bulk_process(run_ids, raw_dir, delete_dir, keep_dir, mode, apply_keep, apply_delete, dry_run,
+                  store: str = None) -> dict:
+    """Snapshot, plan and execute the selected runs as one journaled batch of renames."""
+    moves, stats = _plan_moves(run_ids, raw_dir, delete_dir, keep_dir, mode, apply_keep, apply_delete, store)
+    print(f"Planned {len(moves)} move(s); {stats['already']} already in place, {stats['missing']} missing.")
+    if not moves:
+        return stats
+
+    ts = time.strftime('%Y%m%d-%H%M%S')
+    journal_dir = JOURNAL_DIR
+    if dry_run:
+        journal_dir = os.path.join(tempfile.gettempdir(), 'email-processor-dry-run')
+    journal_path = os.path.join(journal_dir, f"journal_{ts}_{mode}.jsonl")
+    _write_journal_header(journal_path, mode, moves, list(run_ids))
+
+    res = _execute_journal(journal_path, dry_run=dry_run)
+    if dry_run:
+        os.remove(journal_path)
+    else:
+        print(f"Journal: {journal_path}")
+    for k in stats:
+        stats[k] += res.get(k, 0)
     return stats
 
 
+def _revert_from_journal(journal_path: str, dry_run: bool = False) -> dict:
+    """Undoes the moves a journal recorded as done, writing a new journal for the revert itself."""
+    plan, done, _ = _read_journal(journal_path)
+    moves = [[seq_id, label, dst, src] for i, (seq_id, label, src, dst) in enumerate(plan["moves"]) if i in done]
+    if not moves:
+        print("Nothing recorded as done in that journal.")
+        return _new_stats()
+
+    ts = time.strftime('%Y%m%d-%H%M%S')
+    journal_dir = os.path.join(tempfile.gettempdir(), 'email-processor-dry-run') if dry_run else JOURNAL_DIR
+    revert_path = os.path.join(journal_dir, f"journal_{ts}_revert.jsonl")
+    _write_journal_header(revert_path, 'revert', moves, [os.path.basename(journal_path)])
+    stats = _execute_journal(revert_path, dry_run=dry_run)
+    if dry_run:
+        os.remove(revert_path)
+    return stats
+
+
+# Operation codes offered by run_processor -> (mode, apply_keep, apply_delete)
+MODES = {
+    'M1': ('move', True, False),
+    'M2': ('move', False, True),
+    'M3': ('move', True, True),
+    'R1': ('revert', True, False),
+    'R2': ('revert', False, True),
+    'R3': ('revert', True, True),
+}
+
+
+def _staging_dirs(raw_dir: str, staging_dir: str = None):
+    if email_source.is_pack(raw_dir):
+        # Staging inside a pack is a flag on each message, not a move
+        return pack_store.stage_dirs(raw_dir)
+    return staging_dir or STAGING_DIR, STAGING_KEEP_DIR
+
+
+def _apply_runs(selected, raw_dir, stage_del_dir, stage_keep_dir, mode, apply_keep, apply_delete, dry_run,
+                bulk, store) -> dict:
+    print(f"\nProcessing {len(selected)} run(s)… ({'DRY-RUN' if dry_run else 'REAL'})")
+    if bulk:
+        return _bulk_process(
+            selected, raw_dir, stage_del_dir, stage_keep_dir, mode, apply_keep, apply_delete, dry_run, store
+        )
+
+    return _serial_process(
+        selected, raw_dir, stage_del_dir, stage_keep_dir, mode, apply_keep, apply_delete, dry_run, store
+    )
+
+
+def _runs_for(raw_dir: str, store: str):
+    """(runs that classified emails numbered like `raw_dir`, every run), newest first.
+
+    An mbox numbers its messages 1..N while a directory uses UIDs, so a run is only
+    applied to the source (or a copy of it) it was tuned on.
+    """
+    every = results_store.list_runs(store)
+    numbering = email_source.numbering(raw_dir)
+    matching = [r for r in every if results_store.same_numbering(r['numbering'], numbering)]
+    if len(matching) < len(every):
+        print(f"Note: {len(every) - len(matching)} tuning run(s) classified other emails than {raw_dir}; "
+              f"they are not offered.")
+    return matching, every
+
+
+def process_runs(runs='latest', op: str = 'M3', storage_dir: str = None, results_dir: str = None,
+                 staging_dir: str = None, dry_run: bool = False, bulk: bool = True, resume: bool = False) -> dict:
+    """run_processor without the prompts, for scheduled use; returns the summary counts plus 'runs'.
+
+    `runs` is 'latest', 'all' or a list of run ids and/or 1-based positions in the list of
+    runs tuned on this source (newest first). With `resume`, an interrupted bulk run is
+    finished instead, and nothing is processed if there is none. Raises ValueError for an
+    unknown run or operation code.
+    """
+    raw_dir = storage_dir or STORAGE_DIR
+    res_dir = results_dir or RESULTS_DIR
+    stage_del_dir, stage_keep_dir = _staging_dirs(raw_dir, staging_dir)
+    if op.upper() not in MODES:
+        raise ValueError(f"unknown operation {op!r} (expected one of {', '.join(MODES)})")
+    mode, apply_keep, apply_delete = MODES[op.upper()]
+
+    pending = _incomplete_journals(JOURNAL_DIR)
+    if resume:
+        # --resume only ever finishes an interrupted run; it never starts a new one
+        if not pending:
+            print(f"Nothing to resume in {JOURNAL_DIR}.")
+            return dict(_new_stats(), runs=[], resumed=None)
+        grand = _execute_journal(pending[0])
+        _print_summary(grand)
+        return dict(grand, runs=[], resumed=os.path.basename(pending[0]))
+    if pending:
+        print(f"Warning: {len(pending)} interrupted or failed bulk run(s) in {JOURNAL_DIR}; resume them with --resume.")
+
+    store = results_store.store_path(res_dir)
+    results_store.sync(res_dir, path=store)
+    matching, every = _runs_for(raw_dir, store)
+    listed = [r['run_id'] for r in matching]
+    other = {r['run_id']: r for r in every}
+    if runs == 'latest':
+        selected = listed[:1]
+    elif runs == 'all':
+        selected = listed
+    else:
+        selected = []
+        for run in runs:
+            run = str(run)
+            if run in listed:
+                selected.append(run)
+            elif run.isdigit() and 1 <= int(run) <= len(listed):
+                selected.append(listed[int(run) - 1])
+            elif run in other:
+                raise ValueError(f"tuning run {run!r} classified {other[run]['storage'] or 'other emails'}, "
+                                 f"not {raw_dir}")
+            else:
+                raise ValueError(f"no tuning run {run!r} in {res_dir}")
+    if not selected:
+        print(f"No tuning runs found in: {res_dir}")
+        return dict(_new_stats(), runs=[])
+
+    _print_conflicts(results_store.conflicts(selected, path=store))
+    grand = _apply_runs(selected, raw_dir, stage_del_dir, stage_keep_dir, mode, apply_keep, apply_delete,
+                        dry_run, bulk, store)
+    _print_summary(grand)
+    return dict(grand, runs=selected)
+
+
+def revert_journal(journal: str, dry_run: bool = False) -> dict:
+    """Reverts a bulk run from its journal, given as a path or a 1-based position in the journal list."""
+    if not os.path.exists(journal):
+        journals = _list_journals(JOURNAL_DIR)
+        if not (journal.isdigit() and 1 <= int(journal) <= len(journals)):
+            raise ValueError(f"no journal {journal!r} in {JOURNAL_DIR}")
+        journal = journals[int(journal) - 1]
+    grand = _revert_from_journal(journal, dry_run=dry_run)
+    _print_summary(grand)
+    return dict(grand, journal=os.path.basename(journal))
+
+
 def run_processor(storage_dir: str = None, results_dir: str = None, staging_dir: str = None):
     raw_dir = storage_dir or STORAGE_DIR
     res_dir = results_dir or RESULTS_DIR
-    stage_del_dir = staging_dir or STAGING_DIR
-    stage_keep_dir = STAGING_KEEP_DIR
+    stage_del_dir, stage_keep_dir = _staging_dirs(raw_dir, staging_dir)
+
+    # Offer to finish a bulk run that was interrupted part-way or had failed moves
+    pending = _incomplete_journals(JOURNAL_DIR)
+    if pending:
+        print(f"\nFound {len(pending)} interrupted or failed bulk run(s); latest: {os.path.basename(pending[0])}")
+        if input("Resume it now? (Y/n): ").strip().lower() != 'n':
+            _print_summary(_execute_journal(pending[0]))
+            return
 
-    csvs = _list_tuning_csvs(res_dir)
-    if not csvs:
-        print(f"No tuning CSVs found in: {res_dir}")
+    # Tuning CSVs that are new or were edited by hand are (re)imported first
+    store = results_store.store_path(res_dir)
+    results_store.sync(res_dir, path=store)
+    listed, _ = _runs_for(raw_dir, store)
+    if not listed:
+        print(f"No tuning runs found in: {res_dir}")
         return
+    runs = [r['run_id'] for r in listed]
 
     print("\n--- Tuning Results Available ---")
-    for i, p in enumerate(csvs, start=1):
-        print(f"{i:2d}. {os.path.basename(p)}")
+    for i, run in enumerate(listed, start=1):
+        print(f"{i:2d}. {run['run_id']}  ({run['emails']} emails: delete {run['deletes']}, keep {run['keeps']})")
 
-    print("\nSelect CSVs to process:")
+    print("\nSelect runs to process:")
     print(" - Enter comma-separated numbers (e.g. 1,3,4)")
     print(" - Enter 'L' for latest only")
     print(" - Enter 'A' for all")
+    print(" - Enter 'J' to revert a previous bulk run from its journal")
     print(" - Enter 'E' to cancel")
 
     choice = input("Your choice: ").strip().upper()
@@ -175,22 +443,39 @@ def run_processor(storage_dir: str = None, results_dir: str = None, staging_dir:
         print("Cancelled.")
         return
 
+    if choice == 'J':
+        journals = _list_journals(JOURNAL_DIR)
+        if not journals:
+            print(f"No journals found in: {JOURNAL_DIR}")
+            return
+        for i, p in enumerate(journals, start=1):
+            print(f"{i:2d}. {os.path.basename(p)}")
+        sel = input("Journal to revert: ").strip()
+        if not sel.isdigit() or not (1 <= int(sel) <= len(journals)):
+            print("Invalid selection.")
+            return
+        dry_run = input("Dry run? (y/N): ").strip().lower() == 'y'
+        _print_summary(_revert_from_journal(journals[int(sel) - 1], dry_run=dry_run))
+        return
+
     if choice == 'L':
-        selected = [csvs[0]]
+        selected = [runs[0]]
     elif choice == 'A':
-        selected = csvs
+        selected = runs
     else:
         try:
             idxs = [int(x) for x in choice.split(',') if x.strip().isdigit()]
-            selected = [csvs[i - 1] for i in idxs if 1 <= i <= len(csvs)]
+            selected = [runs[i - 1] for i in idxs if 1 <= i <= len(runs)]
         except Exception:
             print("Invalid selection.")
             return
 
     if not selected:
-        print("No files selected.")
+        print("No runs selected.")
         return
 
+    _print_conflicts(results_store.conflicts(selected, path=store))
+
     # Choose operation mode
     print("\nOperation modes:")
     print(" M1 - Move KEEP only")
@@ -201,47 +486,33 @@ def run_processor(storage_dir: str = None, results_dir: str = None, staging_dir:
     print(" R3 - Revert KEEP and DELETE")
     op_choice = input("Select mode [M3]: ").strip().upper() or 'M3'
 
-    mode = 'move'
-    apply_keep = True
-    apply_delete = True
-    if op_choice == 'M1':
-        mode = 'move'; apply_keep = True; apply_delete = False
-    elif op_choice == 'M2':
-        mode = 'move'; apply_keep = False; apply_delete = True
-    elif op_choice == 'M3':
-        mode = 'move'; apply_keep = True; apply_delete = True
-    elif op_choice == 'R1':
-        mode = 'revert'; apply_keep = True; apply_delete = False
-    elif op_choice == 'R2':
-        mode = 'revert'; apply_keep = False; apply_delete = True
-    elif op_choice == 'R3':
-        mode = 'revert'; apply_keep = True; apply_delete = True
-    else:
+    if op_choice not in MODES:
         print("Unknown selection; defaulting to Move KEEP and DELETE.")
-        mode = 'move'; apply_keep = True; apply_delete = True
+        op_choice = 'M3'
+    mode, apply_keep, apply_delete = MODES[op_choice]
 
     dry_raw = input("Dry run? (y/N): ").strip().lower()
     dry_run = dry_raw == 'y'
 
-    print(f"\nProcessing {len(selected)} CSV file(s)… ({'DRY-RUN' if dry_run else 'REAL'})")
-    grand = {"moved_delete": 0, "moved_keep": 0, "reverted_delete": 0, "reverted_keep": 0, "already": 0, "missing": 0, "errors": 0}
-
-    for path in selected:
-        print("\n" + "-" * 80)
-        print(f"Processing: {os.path.basename(path)}")
-        res = _process_csv(
-            path,
-            raw_dir,
-            stage_del_dir,
-            stage_keep_dir,
-            mode=mode,
-            apply_keep=apply_keep,
-            apply_delete=apply_delete,
-            dry_run=dry_run,
-        )
-        for k in grand:
-            grand[k] += res.get(k, 0)
+    bulk = input("Bulk mode (parallel renames, journal)? (Y/n): ").strip().lower() != 'n'
+
+    _print_summary(_apply_runs(selected, raw_dir, stage_del_dir, stage_keep_dir, mode, apply_keep, apply_delete,
+                               dry_run, bulk, store))
+
+
+def _print_conflicts(conflicts: dict, limit: int = 5):
+    """Warns about emails the selected runs labelled differently."""
+    if not conflicts:
+        return
+    print(f"\nNote: {len(conflicts)} email(s) were labelled differently by the selected runs; "
+          f"the newest run's label is used.")
+    for seq_id in list(conflicts)[:limit]:
+        print(f" - id={seq_id}: " + ', '.join(f"{run_id} {status}" for run_id, status, _ in conflicts[seq_id]))
+    if len(conflicts) > limit:
+        print(f" - … and {len(conflicts) - limit} more (see Manage Tuning Runs → Conflicts)")
+
 
+def _print_summary(grand: dict):
     print("\n" + "=" * 80)
     print("Summary:")
     print(f" - Moved to delete:   {grand['moved_delete']}")
@@ -0,0 +1,272 @@
+import os
+import csv
+import sys
+import json
+import time
+import sqlite3
+import email_source
+import sqlite_local
+
+# Indexed SQLite store of classification results: one row per run and one per (run, email)
+# decision with its status, reason and timings. The tuning CSVs stay as the human-readable
+# copy and are imported on sight, so runs written by older versions or edited by hand
+# (their size/mtime changes) are picked up again. processor and tuning_runs_manager read
+# from here instead of rescanning CSVs. Run ids are the CSV names without .csv
+# (tuning_YYYYMMDD-HHMMSS), which sort chronologically: the newest run wins. Each run also
+# records the email source it classified and how that source numbers its emails
+# (email_source.numbering), since an mbox's 1..N and a directory's UIDs are different
+# emails under the same seq_id.
+RESULTS_DIR = os.environ.get('TUNING_RESULTS_DIR', './tuning_results')
+# Per-email inference metrics, derived from /api/generate's timing fields (ns -> s)
+METRIC_FIELDS = ['llm_sec', 'load_sec', 'prompt_tokens', 'prompt_sec', 'eval_tokens', 'eval_sec']
+# Columns of a tuning CSV (processor only needs seq_id and status)
+CSV_FIELDS = ['seq_id', 'message_id', 'status', 'subject', 'parse_sec', 'ai_sec', 'reason'] + METRIC_FIELDS + [
+    'propagated_from']
+SETTLED = ('[DELETE]', '[ KEEP ]')
+_REAL_FIELDS = ['parse_sec', 'ai_sec'] + METRIC_FIELDS
+
+
+def store_path(results_dir: str = None) -> str:
+    return os.environ.get('RESULTS_STORE_PATH') or os.path.join(results_dir or RESULTS_DIR, 'results.sqlite')
+
+
+def _init(conn):
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS runs ('
+        ' run_id TEXT PRIMARY KEY,'
+        ' created TEXT,'
+        ' source TEXT,'
+        ' csv_path TEXT,'
+        ' csv_size INTEGER,'
+        ' csv_mtime_ns INTEGER,'
+        ' storage TEXT,'
+        ' numbering TEXT)'
+    )
+    # Stores from before sources were tracked
+    columns = {r[1] for r in conn.execute('PRAGMA table_info(runs)')}
+    for column in ('storage', 'numbering'):
+        if column not in columns:
+            conn.execute(f'ALTER TABLE runs ADD COLUMN {column} TEXT')
+    conn.execute(
+        'CREATE TABLE IF NOT EXISTS decisions ('
+        ' run_id TEXT REFERENCES runs(run_id) ON DELETE CASCADE,'
+        ' seq_id INTEGER,'
+        ' message_id TEXT,'
+        ' status TEXT,'
+        ' subject TEXT,'
+        ' reason TEXT,'
+        ' propagated_from INTEGER,'
+        + ''.join(f' {f} REAL,' for f in _REAL_FIELDS) +
+        ' PRIMARY KEY (run_id, seq_id))'
+    )
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_decisions_seq ON decisions(seq_id, run_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_decisions_status ON decisions(status, run_id)')
+
+
+def _connect(path: str = None) -> sqlite3.Connection:
+    return sqlite_local.connect(path or store_path(), _init, makedirs=True)
+
+
+def run_id_for(csv_path: str) -> str:
+    return os.path.splitext(os.path.basename(csv_path))[0]
+
+
+def _int(value):
+    value = str(value if value is not None else '').strip()
+    return int(value) if value.lstrip('-').isdigit() else None
+
+
+def _real(value):
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _decision(run_id: str, row: dict):
+    seq_id = _int(row.get('seq_id'))
+    if seq_id is None:
+        return None
+    metrics = row.get('metrics') or {}
+    return (
+        run_id, seq_id, row.get('message_id') or '', (row.get('status') or '').strip(), row.get('subject') or '',
+        row.get('reason') or '', _int(row.get('propagated_from')),
+        *[_real(metrics.get(f, row.get(f))) for f in _REAL_FIELDS],
+    )
+
+
+def record_run(run_id: str, rows, source: str = 'tuner', csv_path: str = None, path: str = None,
+               storage: str = None, numbering: str = None) -> int:
+    """Stores (or replaces) a run's decisions; `rows` are review rows or CSV dicts. Returns rows stored.
+
+    `storage` is the email source the run classified; its numbering is looked up unless given.
+    """
+    conn = _connect(path)
+    st = os.stat(csv_path) if csv_path and os.path.exists(csv_path) else None
+    decisions = [d for d in (_decision(run_id, r) for r in rows) if d is not None]
+    marks = ', '.join('?' * (7 + len(_REAL_FIELDS)))
+    if storage and not numbering:
+        numbering = email_source.numbering(storage)
+    with conn:
+        conn.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+        conn.execute(
+            'INSERT INTO runs (run_id, created, source, csv_path, csv_size, csv_mtime_ns, storage, numbering)'
+            ' VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (
+                run_id, time.strftime('%Y-%m-%dT%H:%M:%S'), source, os.path.abspath(csv_path) if csv_path else None,
+                st.st_size if st else None, st.st_mtime_ns if st else None,
+                os.path.abspath(storage) if storage else None, numbering,
+            ))
+        conn.executemany(f'INSERT OR REPLACE INTO decisions VALUES ({marks})', decisions)
+    return len(decisions)
+
+
+def _sidecar_storage(csv_path: str):
+    """(storage, numbering) from the tuner's <run>.metrics.json next to the CSV, if it recorded them."""
+    try:
+        with open(f"{os.path.splitext(csv_path)[0]}.metrics.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return meta.get('storage'), meta.get('numbering')
+    except (OSError, ValueError, AttributeError):
+        return None, None
+
+
+def import_csv(csv_path: str, force: bool = False, source: str = None, path: str = None,
+               storage: str = None) -> str:
+    """Imports a tuning CSV as run `run_id_for(csv_path)` unless it is already in with the same size/mtime.
+
+    The run keeps the email source it was recorded with; a new one takes `storage`, else
+    whatever the tuner's metrics file says, else stays unknown.
+    """
+    run_id = run_id_for(csv_path)
+    st = os.stat(csv_path)
+    known = _connect(path).execute(
+        'SELECT csv_size, csv_mtime_ns, storage, numbering FROM runs WHERE run_id = ?', (run_id,)).fetchone()
+    if known and not force and (known['csv_size'], known['csv_mtime_ns']) == (st.st_size, st.st_mtime_ns):
+        return run_id
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        rows = [r for r in csv.DictReader(f) if (r.get('status') or '').strip() != 'SUMMARY']
+    source = source or ('csv-edit' if known else 'import')
+    numbering = None
+    if not storage and known and known['numbering']:
+        storage, numbering = known['storage'], known['numbering']
+    elif not storage:
+        storage, numbering = _sidecar_storage(csv_path)
+    record_run(run_id, rows, source=source, csv_path=csv_path, path=path, storage=storage, numbering=numbering)
+    return run_id
+
+
+def sync(results_dir: str = None, path: str = None) -> list:
+    """Imports every tuning_*.csv in `results_dir` that is new or changed; returns the run ids imported."""
+    results_dir = results_dir or RESULTS_DIR
+    path = path or store_path(results_dir)
+    if not os.path.isdir(results_dir):
+        return []
+    known = {r['run_id']: (r['csv_size'], r['csv_mtime_ns'])
+             for r in _connect(path).execute('SELECT run_id, csv_size, csv_mtime_ns FROM runs')}
+    imported = []
+    for name in sorted(os.listdir(results_dir)):
+        if not (name.startswith('tuning_') and name.endswith('.csv')):
+            continue
+        csv_path = os.path.join(results_dir, name)
+        st = os.stat(csv_path)
+        if known.get(run_id_for(name)) != (st.st_size, st.st_mtime_ns):
+            imported.append(import_csv(csv_path, force=True, path=path))
+    return imported
+
+
+def export_csv(run_id: str, csv_path: str, path: str = None) -> int:
+    """Writes a run back out as a tuning CSV (newest email first); returns the number of rows."""
+    rows = decisions(run_ids=[run_id], path=path)
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_FIELDS)
+        for row in rows:
+            writer.writerow(['' if row.get(k) is None else row[k] for k in CSV_FIELDS])
+    return len(rows)
+
+
+def same_numbering(run_numbering, numbering: str) -> bool:
+    """Whether a run recorded with `run_numbering` can be applied to a source numbered `numbering`."""
+    if run_numbering is None:
+        # Runs from before sources were recorded all came from a raw_emails directory
+        return not numbering.startswith('mbox:')
+    return run_numbering == numbering
+
+
+def list_runs(path: str = None, numbering: str = None) -> list:
+    """Every run, newest first, with its email and per-status counts; only those for `numbering` if given."""
+    rows = _connect(path).execute(
+        'SELECT r.run_id, r.created, r.source, r.csv_path, r.storage, r.numbering, COUNT(d.seq_id) AS emails,'
+        " COALESCE(SUM(d.status = '[DELETE]'), 0) AS deletes, COALESCE(SUM(d.status = '[ KEEP ]'), 0) AS keeps,"
+        " COALESCE(SUM(d.status NOT IN ('[DELETE]', '[ KEEP ]')), 0) AS errors,"
+        ' COALESCE(SUM(d.propagated_from IS NOT NULL), 0) AS propagated'
+        ' FROM runs r LEFT JOIN decisions d USING (run_id)'
+        ' GROUP BY r.run_id ORDER BY r.run_id DESC'
+    ).fetchall()
+    return [dict(r) for r in rows if numbering is None or same_numbering(r['numbering'], numbering)]
+
+
+def delete_run(run_id: str, path: str = None):
+    with _connect(path) as conn:
+        conn.execute('DELETE FROM runs WHERE run_id = ?', (run_id,))
+
+
+def _where(run_ids=None, statuses=None, seq_ids=None):
+    clauses, params = [], []
+    for column, values in (('run_id', run_ids), ('status', statuses), ('seq_id', seq_ids)):
+        if values is not None:
+            values = list(values)
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})" if values else '0')
+            params.extend(values)
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def decisions(run_ids=None, statuses=None, seq_ids=None, path: str = None) -> list:
+    """Decision rows (dicts with CSV_FIELDS keys plus run_id) filtered by run, status and/or seq_id."""
+    where, params = _where(run_ids, statuses, seq_ids)
+    rows = _connect(path).execute(
+        f'SELECT * FROM decisions{where} ORDER BY run_id DESC, seq_id DESC', params).fetchall()
+    return [dict(r) for r in rows]
+
+
+def latest_labels(run_ids=None, statuses=SETTLED, path: str = None) -> dict:
+    """{seq_id: decision} using, for each email, the newest of `run_ids` (all runs if None) that settled it.
+
+    Only [DELETE]/[ KEEP ] count by default, so an [ERROR ] in a newer run doesn't hide an
+    older answer. Filter the result by status afterwards to act on one label only.
+    """
+    where, params = _where(run_ids, statuses)
+    rows = _connect(path).execute(
+        f'SELECT d.* FROM decisions d JOIN ('
+        f' SELECT seq_id, MAX(run_id) AS run_id FROM decisions{where} GROUP BY seq_id'
+        f') latest USING (seq_id, run_id)', params
+    ).fetchall()
+    return {r['seq_id']: dict(r) for r in rows}
+
+
+def conflicts(run_ids=None, path: str = None) -> dict:
+    """{seq_id: [(run_id, status, reason), ...] newest first} for emails the runs settled differently."""
+    where, params = _where(run_ids, SETTLED)
+    rows = _connect(path).execute(
+        f'SELECT seq_id, run_id, status, reason FROM decisions WHERE seq_id IN ('
+        f' SELECT seq_id FROM decisions{where} GROUP BY seq_id HAVING COUNT(DISTINCT status) > 1'
+        f'){where.replace(" WHERE ", " AND ", 1)} ORDER BY seq_id DESC, run_id DESC', params + params
+    ).fetchall()
+    out = {}
+    for r in rows:
+        out.setdefault(r['seq_id'], []).append((r['run_id'], r['status'], r['reason']))
+    return out
+
+
+if __name__ == '__main__':
+    # Usage: python results_store.py [RESULTS_DIR]  (import new/changed tuning CSVs, then list runs)
+    target = sys.argv[1] if len(sys.argv) > 1 else RESULTS_DIR
+    print(f"Imported {len(sync(target))} run(s) into {store_path(target)}")
+    for run in list_runs(store_path(target)):
+        print(f"{run['run_id']}: {run['emails']} emails, delete {run['deletes']}, keep {run['keeps']}, "
+              f"errors {run['errors']}")
@@ -0,0 +1,88 @@
+import os
+import re
+import html
+
+# Turns an email body into the short snippet the classifier sees: HTML is flattened to
+# text with a few regexes, quoted replies, tracking URLs and legal/unsubscribe footers
+# are dropped, whitespace is collapsed, and the result is cut to fit a token budget
+# shared with the sender and subject lines of the prompt.
+CLEAN_ENABLED = os.environ.get('SNIPPET_CLEAN', '1') != '0'
+# Approximate tokens for "From/Subject/Body Snippet" together (num_ctx is 1024 incl. system prompt)
+TOKEN_BUDGET = int(os.environ.get('SNIPPET_TOKEN_BUDGET', '128'))
+# Never fewer body tokens than this, however long the subject is
+MIN_BODY_TOKENS = 24
+# Rough English average; good enough for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+
+_DROP_BLOCKS_RE = re.compile(r'<(script|style|head|title)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+_BREAK_RE = re.compile(r'<(br|/p|/div|/tr|/li|/h[1-6]|/table)\b[^>]*>', re.IGNORECASE)
+_TAG_RE = re.compile(r'<[^>]+>')
+
+_URL_RE = re.compile(r'(?:https?://|www\.)([^/\s<>"\']+)[^\s<>"\']*', re.IGNORECASE)
+_REPLY_HEADER_RE = re.compile(
+    r'^(On .{0,200}wrote:|-{2,}\s*Original Message\s*-{2,}|From: .+\nSent: .+)', re.IGNORECASE | re.MULTILINE)
+_FOOTER_RE = re.compile(
+    r'(unsubscribe|you are receiving this|you received this|to stop receiving|manage (your )?(email )?preferences|'
+    r'update your preferences|view (this email )?in (your |a )?browser|privacy policy|all rights reserved|©|'
+    r'registered (office|in england)|this (e-?mail|message) (and any attachments )?(is|may be) confidential)',
+    re.IGNORECASE)
+_WS_RE = re.compile(r'\s+')
+
+
+def html_to_text(markup: str) -> str:
+    """Cheap HTML flattening: drops script/style/head, turns block ends into newlines, strips tags."""
+    markup = _DROP_BLOCKS_RE.sub(' ', markup)
+    markup = _COMMENT_RE.sub(' ', markup)
+    markup = _BREAK_RE.sub('\n', markup)
+    return html.unescape(_TAG_RE.sub(' ', markup))
+
+
+def _strip_quoted(text: str) -> str:
+    m = _REPLY_HEADER_RE.search(text)
+    if m and m.start() > 0:
+        text = text[:m.start()]
+    return '\n'.join(line for line in text.split('\n') if not line.lstrip().startswith('>'))
+
+
+def _strip_footer(text: str) -> str:
+    # Only cut in the back half, so a short "unsubscribe" notice can't eat the whole body
+    m = _FOOTER_RE.search(text, len(text) // 2)
+    return text[:m.start()] if m else text
+
+
+def _shorten_url(m) -> str:
+    # Tracking links are long and token-hungry; the host is the only useful part
+    return m.group(1).lower()
+
+
+def clean(text: str) -> str:
+    """Quoted replies, footers and long URLs removed, whitespace collapsed."""
+    text = text.replace('\r\n', '\n')
+    text = _strip_quoted(text)
+    text = _strip_footer(text)
+    text = _URL_RE.sub(_shorten_url, text)
+    return _WS_RE.sub(' ', text).strip()
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def build(sender: str, subject: str, body: str, is_html: bool = False,
+          budget: int = None, max_chars: int = 500) -> str:
+    """The body snippet for a prompt, cleaned and sized so sender + subject + body fit `budget` tokens."""
+    if is_html:
+        body = html_to_text(body)
+    if not CLEAN_ENABLED:
+        return body.strip().replace('\n', ' ')[:max_chars]
+
+    budget = TOKEN_BUDGET if budget is None else budget
+    body = clean(body)
+    overhead = estimate_tokens(f"From: {sender}\nSubject: {subject}\nBody Snippet: ")
+    limit = min(max_chars, max(MIN_BODY_TOKENS, budget - overhead) * CHARS_PER_TOKEN)
+    if len(body) <= limit:
+        return body
+    # Cut on a word boundary
+    cut = body.rfind(' ', 0, limit + 1)
+    return body[:cut if cut > limit // 2 else limit]
@@ -0,0 +1,28 @@
+import os
+import sqlite3
+import threading
+
+# sqlite connections can't be shared across threads, so each thread keeps one connection
+# per database file. email_index, results_store, pack_store and mbox_reader open theirs
+# through here; each passes an init function that sets its PRAGMAs and creates its
+# tables on first use.
+_local = threading.local()
+
+
+def connect(path: str, init=None, timeout: float = 5.0, makedirs: bool = False) -> sqlite3.Connection:
+    """Returns this thread's connection to `path`, opening it and calling init(conn) the first time.
+
+    makedirs=True creates the database's parent directory before opening it.
+    """
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(path)
+    if conn is None:
+        if makedirs:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, timeout=timeout)
+        if init is not None:
+            init(conn)
+        conns[path] = conn
+    return conn
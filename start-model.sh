@@ -1,4 +1,5 @@
-docker compose up -d
+# OLLAMA_REPLICAS=N also starts N replica containers (see docker-compose.yml)
+docker compose ${OLLAMA_REPLICAS:+--profile replicas} up -d
 # sleep to give ollama time to start
 sleep 5
-docker exec -i ollama ollama create email-triage -f /modelfiles/email-triage.modelfile
\ No newline at end of file
+docker exec -i ollama ollama create email-triage -f /modelfiles/email-triage.modelfile
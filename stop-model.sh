@@ -1 +1 @@
-docker compose down ollama
\ No newline at end of file
+docker compose --profile replicas down ollama ollama-replica
\ No newline at end of file
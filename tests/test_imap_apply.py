@@ -0,0 +1,96 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+import imap_apply
+import imap_client
+from benchmarks import corpus
+from benchmarks.fake_imap import FakeImapServer, Mailbox
+
+UIDVALIDITY = 5
+
+
+class ApplyDeletionsTest(unittest.TestCase):
+    """imap_apply against the in-process fake IMAP server, with a UID-named raw directory."""
+
+    def setUp(self):
+        rng = random.Random(1)
+        self.messages = [corpus.make_message(i, rng) for i in range(1, 31)]
+        self.work = tempfile.mkdtemp()
+        self.raw_dir = os.path.join(self.work, 'raw')
+        self.delete_dir = os.path.join(self.work, 'to_delete')
+        os.makedirs(self.raw_dir)
+        os.makedirs(self.delete_dir)
+        with open(os.path.join(self.raw_dir, '.uidvalidity'), 'w') as f:
+            f.write(f"{UIDVALIDITY}\n")
+        self.server = None
+        self._saved = (imap_client.IMAP_SERVER, imap_client.IMAP_PORT, imap_client.IMAP_SSL)
+
+    def tearDown(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        imap_client.IMAP_SERVER, imap_client.IMAP_PORT, imap_client.IMAP_SSL = self._saved
+        shutil.rmtree(self.work, ignore_errors=True)
+
+    def _serve(self, **caps):
+        mailbox = Mailbox(self.messages, uidvalidity=UIDVALIDITY)
+        self.server = FakeImapServer(mailbox, **caps).start()
+        imap_client.IMAP_SERVER, imap_client.IMAP_PORT, imap_client.IMAP_SSL = '127.0.0.1', self.server.port, False
+        return mailbox
+
+    def _stage(self, seq_id, raw):
+        with open(os.path.join(self.delete_dir, f"{seq_id}.eml"), 'wb') as f:
+            f.write(raw)
+
+    def _apply(self, **kwargs):
+        return imap_apply.apply_deletions('user', 'password', self.delete_dir, self.raw_dir, mode='move',
+                                          log_path=os.path.join(self.work, 'apply.jsonl'), **kwargs)
+
+    def test_message_id_mismatch_leaves_uid_alone(self):
+        for uid in range(1, 11):
+            self._stage(uid, self.messages[uid - 1])
+        # Named after UID 11 but holding message 20 (numbering went stale)
+        self._stage(11, self.messages[19])
+        mailbox = self._serve()
+
+        stats = self._apply()
+
+        self.assertEqual(stats['unmatched'], 1)
+        self.assertEqual(stats['applied'], 10)
+        remaining = {m['uid'] for m in mailbox.messages}
+        self.assertIn(11, remaining)
+        self.assertIn(20, remaining)
+        self.assertFalse(remaining & set(range(1, 11)))
+
+    def test_move_refused_without_move_or_uidplus(self):
+        for uid in range(1, 6):
+            self._stage(uid, self.messages[uid - 1])
+        mailbox = self._serve(move=False, uidplus=False)
+        # Someone else's pending deletion that a plain EXPUNGE would take with it
+        mailbox.messages[25]['flags'].add('\\Deleted')
+
+        with self.assertRaises(ValueError):
+            self._apply()
+
+        self.assertEqual(len(mailbox.messages), len(self.messages))
+        self.assertFalse(mailbox.folders)
+
+    def test_move_with_uidplus_only_expunges_its_own_uids(self):
+        for uid in range(1, 6):
+            self._stage(uid, self.messages[uid - 1])
+        mailbox = self._serve(move=False, uidplus=True)
+        mailbox.messages[25]['flags'].add('\\Deleted')
+
+        stats = self._apply()
+
+        self.assertEqual(stats['applied'], 5)
+        remaining = {m['uid'] for m in mailbox.messages}
+        self.assertIn(26, remaining)
+        self.assertFalse(remaining & set(range(1, 6)))
+
+
+if __name__ == '__main__':
+    unittest.main()
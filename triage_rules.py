@@ -0,0 +1,79 @@
+import os
+import re
+import json
+
+# Deterministic rules checked before the LLM. Obvious cases (family senders, receipts,
+# bulk mail headers) are decided here in microseconds; everything else goes to Ollama.
+RULES_PATH = os.environ.get(
+    'TRIAGE_RULES_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modelfiles', 'email-triage.rules.json'),
+)
+
+_rules = None
+
+
+def _compile(pattern: str):
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def load_rules(path: str = None) -> list:
+    """Loads and compiles the rules file. A missing file means no rules (everything goes to the LLM)."""
+    path = path or RULES_PATH
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    compiled = []
+    for rule in data.get('rules', []):
+        action = rule.get('action', '').lower()
+        if action not in ('keep', 'delete'):
+            raise ValueError(f"Rule {rule.get('name')!r}: action must be 'keep' or 'delete'")
+        compiled.append({
+            "name": rule.get('name', f"rule-{len(compiled) + 1}"),
+            "is_promotional": action == 'delete',
+            "from": _compile(rule['from']) if 'from' in rule else None,
+            "subject": _compile(rule['subject']) if 'subject' in rule else None,
+            "body": _compile(rule['body']) if 'body' in rule else None,
+            "text": _compile(rule['text']) if 'text' in rule else None,
+            "headers": {k.lower(): _compile(v) for k, v in rule.get('headers', {}).items()},
+        })
+    return compiled
+
+
+def rules() -> list:
+    global _rules
+    if _rules is None:
+        _rules = load_rules()
+    return _rules
+
+
+def _matches(rule: dict, sender: str, subject: str, snippet: str, headers: dict) -> bool:
+    if rule["from"] and not rule["from"].search(sender):
+        return False
+    if rule["subject"] and not rule["subject"].search(subject):
+        return False
+    if rule["body"] and not rule["body"].search(snippet):
+        return False
+    if rule["text"] and not (rule["text"].search(subject) or rule["text"].search(snippet)):
+        return False
+    for name, pattern in rule["headers"].items():
+        value = headers.get(name)
+        if value is None or not pattern.search(value):
+            return False
+    return True
+
+
+def evaluate(sender: str, subject: str, snippet: str, headers: dict = None):
+    """Returns (is_promotional, reason) from the first matching rule, or None to defer to the LLM.
+
+    `headers` maps lower-cased header names to their raw values.
+    """
+    headers = headers or {}
+    sender = str(sender or '')
+    subject = str(subject or '')
+    snippet = str(snippet or '')
+    for rule in rules():
+        if _matches(rule, sender, subject, snippet, headers):
+            return rule["is_promotional"], f"Rule: {rule['name']}"
+    return None
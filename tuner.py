@@ -1,94 +1,542 @@
 import os
 import time
 import csv
-import email
-from email import policy
-import requests
 import json
+import classification_cache
+import clustering
+import email_index
+import email_source
+import knn_classifier
+import ollama_client
+import results_store
+import triage_rules
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-OLLAMA_API_URL = 'http://127.0.0.1:11434/api/generate'
 # Hard-pin model to custom modelfile
 OLLAMA_MODEL = 'email-triage'
+OLLAMA_OPTIONS = {
+    "temperature": 0.0,
+    "num_thread": 8,
+    "num_predict": 128,
+    "num_ctx": 1024
+}
 
 # Global paths
 STORAGE_DIR = os.environ.get('EMAIL_STORAGE_DIR', '/srv/storage/docker/email_data/raw_emails')
 RESULTS_DIR = os.environ.get('TUNING_RESULTS_DIR', './tuning_results')
+# Number of emails parsed/classified concurrently (1 = sequential)
+TUNING_WORKERS = int(os.environ.get('TUNING_WORKERS', '1'))
+# Emails packed into one LLM prompt (1 = one request per email)
+TUNING_BATCH_SIZE = int(os.environ.get('TUNING_BATCH_SIZE', '1'))
+# A load_duration above this means Ollama had to (re)load the model for that request
+COLD_LOAD_SEC = float(os.environ.get('TUNING_COLD_LOAD_SEC', '0.25'))
+# Per-email inference metrics and the tuning CSV columns, shared with the results store
+METRIC_FIELDS = results_store.METRIC_FIELDS
+CSV_FIELDS = results_store.CSV_FIELDS
 
 def get_latest_emails(directory, count=50):
-    """Returns the filenames of the newest emails based on sequence ID."""
+    """Returns the filenames of the newest emails based on sequence ID.
+
+    `directory` may also be an .mbox archive; its messages are named <seq>.eml too.
+    """
+    if email_source.is_archive(directory):
+        return email_source.latest(directory, count)
+    if email_index.INDEX_ENABLED:
+        try:
+            email_index.refresh(directory)
+            return email_index.latest(directory, count)
+        except Exception as e:
+            print(f"[Index] Falling back to directory listing: {e}")
+
     files = [f for f in os.listdir(directory) if f.endswith('.eml')]
     # Sort numerically descending (Highest SeqID = Newest)
     files.sort(key=lambda x: int(x.split('.')[0]), reverse=True)
     return files[:count]
 
 def parse_eml(filepath):
-    """Extracts basic info from an eml file for the LLM, including Message-ID."""
+    """Extracts basic info from an eml file for the LLM, including Message-ID.
+
+    Also returns the raw headers (lower-cased names) for the rule prefilter. Uses the
+    lazy parser, so attachments are never decoded and reading stops after the first text part.
+    `filepath` may name a message inside an mbox (<archive.mbox>/<seq>.eml).
+    """
     try:
-        with open(filepath, 'rb') as f:
-            msg = email.message_from_binary_file(f, policy=policy.default)
-        
-        sender = msg.get('from', '(Unknown)')
-        subject = msg.get('subject', '(No Subject)')
-        message_id = msg.get('Message-ID', '(No Message-ID)')
-        
-        # Extract plain text body snippet
-        body = ""
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain":
-                    payload = part.get_payload(decode=True)
-                    if payload:
-                        body = payload.decode(errors='ignore')
-                    break
-        else:
-            payload = msg.get_payload(decode=True)
-            if payload:
-                body = payload.decode(errors='ignore')
-        
-        # Clean up whitespace and limit snippet
-        snippet = body.strip().replace('\n', ' ')[:500]
-        return sender, subject, snippet, message_id
+        info = email_source.parse_path(filepath)
+        return info['sender'], info['subject'], info['snippet'], info['message_id'], info['headers']
     except Exception as e:
-        return "Error", "Error", str(e), "(Error)"
+        return "Error", "Error", str(e), "(Error)", {}
 
             
+def _metrics(response_data, share=1.0):
+    """Ollama's timing fields as METRIC_FIELDS; `share` splits a batched call across its emails."""
+    ns = lambda key: (response_data.get(key) or 0) / 1e9 * share  # noqa: E731
+    cold = (response_data.get('load_duration') or 0) / 1e9 > COLD_LOAD_SEC
+    return {
+        'llm_sec': ns('total_duration'),
+        'load_sec': ns('load_duration'),
+        'prompt_tokens': (response_data.get('prompt_eval_count') or 0) * share,
+        'prompt_sec': ns('prompt_eval_duration'),
+        'eval_tokens': (response_data.get('eval_count') or 0) * share,
+        'eval_sec': ns('eval_duration'),
+        # Summed over a session this counts calls that paid for a model load
+        'cold_load': share if cold else 0.0,
+    }
+
+def _add_metrics(metrics, seq_id, m):
+    # An email retried after a malformed batch answer carries the cost of both calls
+    if seq_id in metrics:
+        m = {k: metrics[seq_id][k] + v for k, v in m.items()}
+    metrics[seq_id] = m
+
 def classify_email(sender, subject, snippet):
     """Simplified call using the custom 'email-triage' modelfile."""
+    is_promo, reason, _ = _classify_with_metrics(sender, subject, snippet)
+    return is_promo, reason
+
+def _classify_with_metrics(sender, subject, snippet, lookup=True):
+    """classify_email, plus Ollama's timing metrics for the call (None when answered from cache).
+
+    lookup=False skips the cache for emails the caller already looked up and missed.
+    """
 
     prompt = f"From: {sender}\nSubject: {subject}\nBody Snippet: {snippet}"
 
     try:
-        #Model context window: Added num_ctx: 1024 to the Ollama options in tuner.py for tighter memory use and potential CPU cache benefits.
+        cached = classification_cache.get(OLLAMA_MODEL, prompt) if lookup else None
+        if cached is not None:
+            return cached[0], cached[1], None
 
-        r = requests.post(OLLAMA_API_URL, json={
-            "model": OLLAMA_MODEL,
-            "prompt": prompt,
-            "stream": False,
-            "format": "json",
-            "options": {
-                "temperature": 0.0,
-                "num_thread": 8,
-                "num_predict": 128,
-                "num_ctx": 1024 
-            }
-        }, timeout=60)
+        #Model context window: Added num_ctx: 1024 to the Ollama options in tuner.py for tighter memory use and potential CPU cache benefits.
 
-        r.raise_for_status()
-        response_data = r.json()
+        response_data = ollama_client.generate(OLLAMA_MODEL, prompt, options=OLLAMA_OPTIONS)
         model_output = json.loads(response_data.get('response', '{}'))
-        return model_output.get('is_promotional', False), model_output.get('reason', 'N/A')
+        is_promo, reason = model_output.get('is_promotional', False), model_output.get('reason', 'N/A')
+        classification_cache.put(OLLAMA_MODEL, prompt, is_promo, reason)
+        return is_promo, reason, _metrics(response_data)
 
-    except requests.exceptions.Timeout:
-        return False, "LLM Timeout (Still thinking...)"
+    except ollama_client.OllamaUnavailable as e:
+        # Unknown, not KEEP: the row is written as [ERROR ] so processor leaves it in raw
+        return None, f"LLM Unavailable: {e}", None
 
     except Exception as e:
-        return False, f"LLM Error: {str(e)}"
+        return None, f"LLM Error: {str(e)}", None
+
+def _batch_prompt(items):
+    """Packs several emails into one prompt; each is tagged with its seq_id so answers can be matched back."""
+    lines = [
+        f"Classify each of the following {len(items)} emails independently, using your rules.",
+        'Respond with ONLY this JSON: {"results": [{"seq_id": <seq_id>, "is_promotional": true/false, '
+        '"reason": "short explanation"}]} with exactly one entry per email.',
+    ]
+    for seq_id, sender, subject, snippet in items:
+        lines.append(f"\n### EMAIL seq_id={seq_id}\nFrom: {sender}\nSubject: {subject}\nBody Snippet: {snippet}")
+    return "\n".join(lines)
+
+def _parse_batch_response(text, wanted):
+    """Returns {seq_id: (is_promo, reason)} for the well-formed entries in a batch answer."""
+    data = json.loads(text)
+    entries = data.get('results', []) if isinstance(data, dict) else data
+    out = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict) or not isinstance(entry.get('is_promotional'), bool):
+            continue
+        try:
+            seq_id = int(entry.get('seq_id'))
+        except (TypeError, ValueError):
+            continue
+        if seq_id in wanted:
+            out[seq_id] = (entry['is_promotional'], entry.get('reason', 'N/A'))
+    return out
+
+def _classify_batch_llm(items, metrics=None):
+    """Classifies `items` in one request, splitting in half and retrying whatever comes back malformed.
+
+    If `metrics` is a dict, each email's share of the call's timing metrics is added to it by seq_id.
+    """
+    if metrics is None:
+        metrics = {}
+    if len(items) == 1:
+        seq_id, sender, subject, snippet = items[0]
+        # classify_batch already counted this email's cache miss
+        is_promo, reason, m = _classify_with_metrics(sender, subject, snippet, lookup=False)
+        if m:
+            _add_metrics(metrics, seq_id, m)
+        return {seq_id: (is_promo, reason)}
+
+    options = dict(OLLAMA_OPTIONS)
+    options["num_predict"] = 48 * len(items) + 32
+    options["num_ctx"] = min(8192, OLLAMA_OPTIONS["num_ctx"] + 256 * len(items))
+    # The modelfile stops on "}]", which would cut a JSON array short; stop on end-of-turn instead
+    options["stop"] = ["<end_of_turn>"]
+
+    wanted = {item[0] for item in items}
+    try:
+        response_data = ollama_client.generate(OLLAMA_MODEL, _batch_prompt(items), options=options)
+        share = _metrics(response_data, 1.0 / len(items))
+        for seq_id in wanted:
+            _add_metrics(metrics, seq_id, share)
+        results = _parse_batch_response(response_data.get('response', '{}'), wanted)
+    except ollama_client.OllamaUnavailable as e:
+        return {item[0]: (None, f"LLM Unavailable: {e}") for item in items}
+    except Exception:
+        results = {}
+
+    for seq_id, sender, subject, snippet in items:
+        if seq_id in results:
+            prompt = f"From: {sender}\nSubject: {subject}\nBody Snippet: {snippet}"
+            try:
+                classification_cache.put(OLLAMA_MODEL, prompt, *results[seq_id])
+            except Exception:
+                # The answer stands; it just won't be cached this time
+                pass
+
+    missing = [item for item in items if item[0] not in results]
+    if missing:
+        mid = max(1, len(missing) // 2)
+        results.update(_classify_batch_llm(missing[:mid], metrics))
+        if missing[mid:]:
+            results.update(_classify_batch_llm(missing[mid:], metrics))
+    return results
+
+def classify_batch(items, metrics=None):
+    """Classifies a list of (seq_id, sender, subject, snippet) with as few LLM calls as possible.
+
+    Cached emails are answered locally; the rest go to Ollama in one packed prompt.
+    Returns {seq_id: (is_promo, reason)}; per-email timing metrics go into `metrics` if given.
+    """
+    results = {}
+    todo = []
+    for seq_id, sender, subject, snippet in items:
+        prompt = f"From: {sender}\nSubject: {subject}\nBody Snippet: {snippet}"
+        try:
+            cached = classification_cache.get(OLLAMA_MODEL, prompt)
+        except Exception as e:
+            results[seq_id] = (None, f"Cache Error: {e}")
+            continue
+        if cached is not None:
+            results[seq_id] = cached
+        else:
+            todo.append((seq_id, sender, subject, snippet))
+    if todo:
+        results.update(_classify_batch_llm(todo, metrics))
+    return results
+
+def _status_label(is_promo):
+    if is_promo is None:
+        return '[ERROR ]'
+    return '[DELETE]' if is_promo else '[ KEEP ]'
+
+def _seq_id_from_filename(filename):
+    # numeric sequence id from filename
+    try:
+        return int(os.path.splitext(filename)[0])
+    except Exception:
+        return -1
+
+def _parse(storage_dir, filename, prepared):
+    """Uses the pre-extracted index row when there is one, otherwise parses the file."""
+    row = prepared.get(_seq_id_from_filename(filename)) if prepared else None
+    if row is not None:
+        return row['sender'], row['subject'], row['snippet'], row['message_id'], row['headers']
+    return parse_eml(os.path.join(storage_dir, filename))
+
+def _review_email(storage_dir, filename, prepared=None):
+    """Parses and classifies a single email, returning one CSV row's worth of data."""
+    seq_id = _seq_id_from_filename(filename)
+
+    start_parse = time.time()
+    sender, subject, snippet, message_id, headers = _parse(storage_dir, filename, prepared)
+    parse_duration = time.time() - start_parse
+
+    start_ai = time.time()
+    metrics = None
+    decision = triage_rules.evaluate(sender, subject, snippet, headers)
+    if decision is None:
+        decision = knn_classifier.classify(sender, subject, snippet)
+    if decision is None:
+        is_promo, reason, metrics = _classify_with_metrics(sender, subject, snippet)
+    else:
+        is_promo, reason = decision
+    ai_duration = time.time() - start_ai
+
+    return {
+        'seq_id': seq_id,
+        'message_id': message_id,
+        'status': _status_label(is_promo),
+        'subject': subject,
+        'parse_sec': parse_duration,
+        'ai_sec': ai_duration,
+        'reason': reason,
+        'metrics': metrics,
+    }
+
+def _review_batch(storage_dir, filenames, prepared=None):
+    """Parses a chunk of emails and classifies them together; returns rows in input order.
+
+    With a single file this is exactly the one-at-a-time path. For real batches the
+    emails the rules don't settle are embedded together for the kNN stage, and the
+    shared kNN and LLM times are split evenly across the rows' ai_sec.
+    """
+    if len(filenames) == 1:
+        return [_review_email(storage_dir, filenames[0], prepared)]
+
+    rows = []
+    items = []
+    for filename in filenames:
+        start_parse = time.time()
+        sender, subject, snippet, message_id, headers = _parse(storage_dir, filename, prepared)
+        row = {
+            'seq_id': _seq_id_from_filename(filename),
+            'message_id': message_id,
+            'subject': subject,
+            'parse_sec': time.time() - start_parse,
+        }
+        rows.append(row)
+
+        start_rule = time.time()
+        decision = triage_rules.evaluate(sender, subject, snippet, headers)
+        if decision is not None:
+            row['status'] = _status_label(decision[0])
+            row['ai_sec'] = time.time() - start_rule
+            row['reason'] = decision[1]
+            row['metrics'] = None
+        else:
+            items.append((row['seq_id'], sender, subject, snippet))
+
+    if items and knn_classifier.available():
+        start_knn = time.time()
+        verdicts = knn_classifier.classify_many([item[1:] for item in items])
+        knn_share = (time.time() - start_knn) / len(items)
+        by_seq = {row['seq_id']: row for row in rows}
+        escalated = []
+        for item, verdict in zip(items, verdicts):
+            if verdict is None:
+                escalated.append(item)
+                continue
+            row = by_seq[item[0]]
+            row['status'] = _status_label(verdict[0])
+            row['ai_sec'] = knn_share
+            row['reason'] = verdict[1]
+            row['metrics'] = None
+        items = escalated
+
+    if not items:
+        return rows
+
+    start_ai = time.time()
+    metrics = {}
+    results = classify_batch(items, metrics)
+    ai_share = (time.time() - start_ai) / len(items)
+
+    for row in rows:
+        if 'status' in row:
+            continue
+        is_promo, reason = results.get(row['seq_id'], (None, 'LLM Error: no result'))
+        row['status'] = _status_label(is_promo)
+        row['ai_sec'] = ai_share
+        row['reason'] = reason
+        row['metrics'] = metrics.get(row['seq_id'])
+    return rows
+
+def _iter_reviews(storage_dir, files, workers, batch_size=1, prepared=None):
+    """Yields review rows in the same order as `files`.
+
+    `prepared` optionally maps seq_id to an index row so files needn't be reparsed.
+
+    Files are grouped into chunks of `batch_size` (one LLM prompt per chunk). With
+    workers > 1 the chunks are parsed and classified on a thread pool so up to `workers`
+    requests are in flight at once; results are still yielded in seq_id order.
+    """
+    chunks = [files[i:i + batch_size] for i in range(0, len(files), batch_size)]
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _review_batch(storage_dir, chunk, prepared)
+        return
 
-def run_tuning_session(storage_dir: str = None, count: int = 50):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Keep a bounded window of futures so a huge session doesn't queue everything up front
+        pending = deque()
+        it = iter(chunks)
+        for chunk in it:
+            pending.append(pool.submit(_review_batch, storage_dir, chunk, prepared))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            rows = pending.popleft().result()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append(pool.submit(_review_batch, storage_dir, nxt, prepared))
+            yield from rows
+
+def _settled_row(seq_id, row, decision, ai_sec, parse_sec=0.0):
+    """A review row for an email answered by the rules or kNN before clustering."""
+    return {
+        'seq_id': seq_id,
+        'message_id': row['message_id'],
+        'status': _status_label(decision[0]),
+        'subject': row['subject'],
+        'parse_sec': parse_sec,
+        'ai_sec': ai_sec,
+        'reason': decision[1],
+        'metrics': None,
+    }
+
+def _clustered_reviews(storage_dir, files, workers, batch_size=1, prepared=None):
+    """_iter_reviews with the clustering stage in front; yields rows in the order of `files`.
+
+    Every email is parsed and run through the rules and kNN first, exactly as it would be
+    on its own, so a cluster's label never overrides a rule or a neighbour vote. Only the
+    emails left for the LLM are grouped. Of each cluster only the representatives and
+    spot checks are classified; if they agree, the rest get their label with
+    `propagated_from` pointing at the first representative. Clusters whose samples
+    disagree are classified email by email instead.
+    """
+    prepared = dict(prepared or {})
+    by_seq = {}
+    parse_secs = {}
+    emails = []
+    for filename in files:
+        seq_id = _seq_id_from_filename(filename)
+        by_seq[seq_id] = filename
+        if seq_id not in prepared:
+            start_parse = time.time()
+            sender, subject, snippet, message_id, headers = parse_eml(os.path.join(storage_dir, filename))
+            parse_secs[seq_id] = time.time() - start_parse
+            prepared[seq_id] = {'sender': sender, 'subject': subject, 'snippet': snippet,
+                                'message_id': message_id, 'headers': headers}
+        row = prepared[seq_id]
+        # Failed parses all read sender/subject "Error"; grouping them would label unread emails
+        if row['message_id'] != '(Error)':
+            emails.append((seq_id, row['sender'], row['subject'], row['snippet']))
+
+    rows = {}
+    llm_bound = []
+    for email in emails:
+        seq_id = email[0]
+        start_rule = time.time()
+        decision = triage_rules.evaluate(*email[1:], prepared[seq_id]['headers'])
+        if decision is None:
+            llm_bound.append(email)
+        else:
+            rows[seq_id] = _settled_row(seq_id, prepared[seq_id], decision, time.time() - start_rule,
+                                        parse_secs.get(seq_id, 0.0))
+    if llm_bound and knn_classifier.available():
+        start_knn = time.time()
+        verdicts = knn_classifier.classify_many([email[1:] for email in llm_bound])
+        knn_share = (time.time() - start_knn) / len(llm_bound)
+        escalated = []
+        for email, verdict in zip(llm_bound, verdicts):
+            if verdict is None:
+                escalated.append(email)
+            else:
+                rows[email[0]] = _settled_row(email[0], prepared[email[0]], verdict, knn_share,
+                                              parse_secs.get(email[0], 0.0))
+        llm_bound = escalated
+
+    plans = clustering.plan(llm_bound)
+    deferred = {seq_id for p in plans for seq_id in p['propagate']}
+    # Emails the rules or kNN settled above already have their row
+    skip = deferred | set(rows)
+    direct = [f for f in files if _seq_id_from_filename(f) not in skip]
+    for row in _iter_reviews(storage_dir, direct, workers, batch_size, prepared):
+        rows[row['seq_id']] = row
+
+    retry = []
+    for p in plans:
+        status = clustering.agreed_status([rows[s]['status'] for s in p['sampled']])
+        if status is None:
+            retry.extend(p['propagate'])
+            continue
+        source = p['sampled'][0]
+        for seq_id in p['propagate']:
+            rows[seq_id] = {
+                'seq_id': seq_id,
+                'message_id': prepared[seq_id]['message_id'],
+                'status': status,
+                'subject': prepared[seq_id]['subject'],
+                'parse_sec': 0.0,
+                'ai_sec': 0.0,
+                'reason': f"Cluster: {len(p['sampled'])} sampled emails agree ({rows[source]['reason']})",
+                'metrics': None,
+                'propagated_from': source,
+            }
+    if retry:
+        retry_files = [f for f in files if _seq_id_from_filename(f) in set(retry)]
+        for row in _iter_reviews(storage_dir, retry_files, workers, batch_size, prepared):
+            rows[row['seq_id']] = row
+
+    for filename in files:
+        yield rows[_seq_id_from_filename(filename)]
+
+def _prepare(storage_dir, files):
+    """Pulls already-extracted sender/subject/snippet rows for `files` out of the index."""
+    # An mbox has its own offset index; its messages are parsed straight from the mapped file
+    if not email_index.INDEX_ENABLED or email_source.is_archive(storage_dir):
+        return {}
+    try:
+        return email_index.lookup(storage_dir, [_seq_id_from_filename(f) for f in files])
+    except Exception:
+        return {}
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+def _summarize_metrics(per_email):
+    """Session totals from the per-email metrics of the emails that went to the LLM."""
+    total = lambda key: sum(m[key] for m in per_email)  # noqa: E731
+    summary = {
+        'llm_emails': len(per_email),
+        'cold_loads': round(total('cold_load')),
+        'load_sec_total': total('load_sec'),
+        'prompt_tokens_per_sec': total('prompt_tokens') / total('prompt_sec') if total('prompt_sec') else None,
+        'eval_tokens_per_sec': total('eval_tokens') / total('eval_sec') if total('eval_sec') else None,
+        # prompt_eval_count per email: what the snippet builder's budget actually costs
+        'prompt_tokens_avg': total('prompt_tokens') / len(per_email) if per_email else None,
+    }
+    for key in ('llm_sec', 'load_sec', 'prompt_tokens', 'eval_tokens'):
+        values = [m[key] for m in per_email]
+        summary[f'{key}_p50'] = _percentile(values, 50)
+        summary[f'{key}_p95'] = _percentile(values, 95)
+    return summary
+
+def _source(status, reason, metrics):
+    # LLM Error:/LLM Unavailable: rows carry no metrics but weren't answered from the cache either
+    if status == '[ERROR ]':
+        return 'error'
+    if metrics:
+        return 'llm'
+    if reason.startswith('Rule: '):
+        return 'rule'
+    if reason.startswith('Cluster: '):
+        return 'cluster'
+    return 'knn' if reason.startswith('kNN: ') else 'cache'
+
+def _fmt(value, spec):
+    return '' if value is None else format(value, spec)
+
+def _csv_row(row):
+    """A review row as CSV_FIELDS values; the metric columns stay empty for rule, kNN, cluster and cache answers."""
+    metrics = row.get('metrics')
+    return [
+        row['seq_id'], row['message_id'], row['status'], row['subject'],
+        f"{row['parse_sec']:.3f}", f"{row['ai_sec']:.3f}", row['reason']
+    ] + [_fmt(metrics[k], '.3f') if metrics else '' for k in METRIC_FIELDS] + [row.get('propagated_from', '')]
+
+def run_tuning_session(storage_dir: str = None, count: int = 50, workers: int = None, batch_size: int = None,
+                       results_dir: str = None) -> dict:
+    """Classifies the newest `count` emails into a new tuning run; returns a summary of it."""
     storage_dir = storage_dir or STORAGE_DIR
+    results_dir = results_dir or RESULTS_DIR
+    workers = max(1, workers or TUNING_WORKERS)
+    batch_size = max(1, batch_size or TUNING_BATCH_SIZE)
 
     # Ensure results directory exists
-    os.makedirs(RESULTS_DIR, exist_ok=True)
+    os.makedirs(results_dir, exist_ok=True)
 
     # Hint: keep model resident for small batches
     if not os.environ.get('OLLAMA_KEEP_ALIVE') and count <= 100:
@@ -96,43 +544,54 @@ def run_tuning_session(storage_dir: str = None, count: int = 50):
 
     # Timestamped, human-sortable filename
     ts = time.strftime('%Y%m%d-%H%M%S')
-    results_path = os.path.join(RESULTS_DIR, f'tuning_{ts}.csv')
+    results_path = os.path.join(results_dir, f'tuning_{ts}.csv')
+    metrics_path = os.path.join(results_dir, f'tuning_{ts}.metrics.json')
 
     # Select the newest N emails based on sequence ID
     files = get_latest_emails(storage_dir, count=count)
-    print(f"\n--- Tuning Session: Reviewing {len(files)} Newest Emails ---")
+    prepared = _prepare(storage_dir, files)
+    print(f"\n--- Tuning Session: Reviewing {len(files)} Newest Emails ({workers} in flight, batch {batch_size}) ---")
+
+    # Make sure the model is resident before the clock starts so the first emails don't eat the cold load
+    ollama_client.warm_up(OLLAMA_MODEL)
+    ollama_client.reset_endpoint_stats()
+    if len(ollama_client.endpoints()) > workers:
+        print(f"[Tip] {len(ollama_client.endpoints())} Ollama endpoints but {workers} worker(s); "
+              f"raise TUNING_WORKERS to keep them all busy.")
 
     total_start_time = time.time()
+    classification_cache.reset_stats()
 
     # Track running AI decision time for console, and final average for file
     ai_total = 0.0
     ai_count = 0
+    error_count = 0
+    rule_count = 0
+    knn_count = 0
+    propagated_count = 0
+    per_email = []
+    reviewed = []
+    llm_metrics = []
 
     # Write header and rows to a CSV file while printing to console
     with open(results_path, 'w', newline='', encoding='utf-8') as csvfile:
         writer = csv.writer(csvfile)
-        writer.writerow([
-            'seq_id', 'message_id', 'status', 'subject', 'parse_sec', 'ai_sec', 'reason'
-        ])
-
-        for filename in files:
-            path = os.path.join(storage_dir, filename)
+        writer.writerow(CSV_FIELDS)
 
-            # numeric sequence id from filename
-            try:
-                seq_id = int(os.path.splitext(filename)[0])
-            except Exception:
-                seq_id = -1
-
-            start_parse = time.time()
-            sender, subject, snippet, message_id = parse_eml(path)
-            parse_duration = time.time() - start_parse
-
-            start_ai = time.time()
-            is_promo, reason = classify_email(sender, subject, snippet)
-            ai_duration = time.time() - start_ai
-
-            status = '[DELETE]' if is_promo else '[ KEEP ]'
+        reviews = _clustered_reviews if clustering.CLUSTER_ENABLED else _iter_reviews
+        for row in reviews(storage_dir, files, workers, batch_size, prepared):
+            status = row['status']
+            subject = row['subject']
+            ai_duration = row['ai_sec']
+            reason = row['reason']
+            if status == '[ERROR ]':
+                error_count += 1
+            if reason.startswith('Rule: '):
+                rule_count += 1
+            elif reason.startswith('kNN: '):
+                knn_count += 1
+            if row.get('propagated_from') is not None:
+                propagated_count += 1
 
             # Update running average for console output
             ai_total += ai_duration
@@ -143,20 +602,116 @@ def run_tuning_session(storage_dir: str = None, count: int = 50):
             print(f"{status} | {subject[:40]:<40} | {ai_duration:4.1f}s (avg {ai_avg:4.1f}s) | {reason}")
 
             # File output
-            writer.writerow([
-                seq_id, message_id, status, subject, f"{parse_duration:.3f}", f"{ai_duration:.3f}", reason
-            ])
+            metrics = row.get('metrics')
+            if metrics:
+                llm_metrics.append(metrics)
+            writer.writerow(_csv_row(row))
+            reviewed.append(row)
+            per_email.append({
+                'seq_id': row['seq_id'], 'status': status, 'parse_sec': row['parse_sec'],
+                'ai_sec': ai_duration, 'source': _source(status, reason, metrics),
+                **(metrics or {}),
+            })
 
         # Append a single summary row with final average AI decision time
         if ai_count:
             ai_final_avg = ai_total / ai_count
             writer.writerow(['', '', 'SUMMARY', '', '', f"{ai_final_avg:.3f}", 'average AI decision time'])
 
-    total_duration = time.time() - total_start_time
+        writer.writerow(['', '', 'SUMMARY', '', '', '', f"rules decided {rule_count} of {len(files)}"])
+        writer.writerow(['', '', 'SUMMARY', '', '', '', f"kNN decided {knn_count} of {len(files)}"])
+        writer.writerow(['', '', 'SUMMARY', '', '', '', f"cluster labels propagated to {propagated_count} of {len(files)}"])
+
+        cache_stats = classification_cache.stats()
+        writer.writerow([
+            '', '', 'SUMMARY', '', '', '',
+            f"cache hits {cache_stats['hits']} / misses {cache_stats['misses']}"
+        ])
+
+        llm_summary = _summarize_metrics(llm_metrics)
+        if llm_metrics:
+            writer.writerow([
+                '', '', 'SUMMARY', '', '', '',
+                f"prompt {_fmt(llm_summary['prompt_tokens_per_sec'], '.0f')} tok/s, "
+                f"generation {_fmt(llm_summary['eval_tokens_per_sec'], '.1f')} tok/s, "
+                f"cold loads {llm_summary['cold_loads']}"
+            ])
+            writer.writerow([
+                '', '', 'SUMMARY', '', '', '',
+                f"avg prompt tokens {llm_summary['prompt_tokens_avg']:.1f}; "
+                f"llm_sec p50 {llm_summary['llm_sec_p50']:.3f} / p95 {llm_summary['llm_sec_p95']:.3f}; "
+                f"prompt tokens p50 {llm_summary['prompt_tokens_p50']:.0f} / p95 {llm_summary['prompt_tokens_p95']:.0f}; "
+                f"eval tokens p50 {llm_summary['eval_tokens_p50']:.0f} / p95 {llm_summary['eval_tokens_p95']:.0f}"
+            ])
+
+        total_duration = time.time() - total_start_time
+        emails_per_sec = len(files) / total_duration if total_duration > 0 else 0.0
+        writer.writerow([
+            '', '', 'SUMMARY', '', '', '',
+            f"{emails_per_sec:.2f} emails/sec (workers {workers}, batch {batch_size})"
+        ])
+
+    # The CSV is the human-readable copy; processor and the runs manager query the store
+    results_store.record_run(results_store.run_id_for(results_path), reviewed, csv_path=results_path,
+                             path=results_store.store_path(results_dir), storage=storage_dir)
+
+    with open(metrics_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'results_csv': os.path.basename(results_path),
+            # Lets a re-import of the CSV (e.g. into a fresh store) tell which emails it is about
+            'storage': os.path.abspath(storage_dir),
+            'numbering': email_source.numbering(storage_dir),
+            'model': OLLAMA_MODEL,
+            'emails': len(files),
+            'workers': workers,
+            'batch_size': batch_size,
+            'total_sec': total_duration,
+            'emails_per_sec': emails_per_sec,
+            'rules_decided': rule_count,
+            'knn_decided': knn_count,
+            'propagated': propagated_count,
+            'errors': error_count,
+            'cache': cache_stats,
+            'llm': llm_summary,
+            'endpoints': ollama_client.endpoint_stats(),
+            'per_email': per_email,
+        }, f, indent=2)
+
     print("\n" + "=" * 80)
     print(
         f"Session Complete: {len(files)} emails in {total_duration:.1f}s "
-        f"(Avg: {total_duration/len(files):.1f}s per email)"
+        f"(Avg: {total_duration/max(len(files), 1):.1f}s per email, {emails_per_sec:.2f} emails/sec)"
     )
+    if error_count:
+        print(f"LLM errors: {error_count} email(s) marked [ERROR ] and left unclassified")
+    print(f"Rules: {rule_count} decided without the LLM")
+    if clustering.CLUSTER_ENABLED:
+        print(f"Clusters: label propagated to {propagated_count} email(s) without classifying them")
+    if knn_classifier.available():
+        print(f"kNN: {knn_count} decided from labelled neighbours ({knn_classifier.EMBED_MODEL})")
+    print(f"Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if llm_metrics:
+        print(
+            f"LLM: {llm_summary['llm_emails']} email(s), avg {llm_summary['prompt_tokens_avg']:.0f} prompt tokens, "
+            f"prompt {_fmt(llm_summary['prompt_tokens_per_sec'], '.0f')} tok/s, "
+            f"generation {_fmt(llm_summary['eval_tokens_per_sec'], '.1f')} tok/s, {llm_summary['cold_loads']} cold load(s), "
+            f"p50/p95 {llm_summary['llm_sec_p50']:.2f}s/{llm_summary['llm_sec_p95']:.2f}s"
+        )
+    ollama_client.print_endpoint_stats()
     print(f"Saved results to: {results_path}")
-    print("=" * 80)
\ No newline at end of file
+    print(f"Metrics: {metrics_path}")
+    print("=" * 80)
+    return {
+        'run_id': results_store.run_id_for(results_path),
+        'results_csv': results_path,
+        'metrics_json': metrics_path,
+        'emails': len(files),
+        'delete': sum(1 for row in reviewed if row['status'] == '[DELETE]'),
+        'keep': sum(1 for row in reviewed if row['status'] == '[ KEEP ]'),
+        'errors': error_count,
+        'rules_decided': rule_count,
+        'knn_decided': knn_count,
+        'propagated': propagated_count,
+        'total_sec': round(total_duration, 3),
+        'emails_per_sec': round(emails_per_sec, 3),
+    }
@@ -1,20 +1,73 @@
 import os
 from typing import List
+import results_store
 
 # Defaults align with tuner.py
 RESULTS_DIR = os.environ.get('TUNING_RESULTS_DIR', './tuning_results')
 
 
-def _list_tuning_csvs(results_dir: str) -> List[str]:
-    if not os.path.isdir(results_dir):
-        return []
-    files = [
-        os.path.join(results_dir, f)
-        for f in os.listdir(results_dir)
-        if f.startswith('tuning_') and f.endswith('.csv')
-    ]
-    files.sort(reverse=True)
-    return files
+def _csv_path(results_dir: str, run: dict) -> str:
+    return run.get('csv_path') or os.path.join(results_dir, f"{run['run_id']}.csv")
+
+
+def _remove_run(results_dir: str, run: dict, store: str = None):
+    """Deletes a run from the store, plus its tuning CSV and .metrics.json sidecar if they exist."""
+    results_store.delete_run(run['run_id'], path=store)
+    csv_path = _csv_path(results_dir, run)
+    for path in (csv_path, csv_path[:-len('.csv')] + '.metrics.json'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def list_runs(results_dir: str = None) -> List[dict]:
+    """Every run in the results store (after importing new or edited CSVs), newest first."""
+    res_dir = results_dir or RESULTS_DIR
+    store = results_store.store_path(res_dir)
+    results_store.sync(res_dir, path=store)
+    return results_store.list_runs(store)
+
+
+def delete_runs(run_ids: List[str], results_dir: str = None) -> List[str]:
+    """Deletes the given runs (see _remove_run); returns the ids actually deleted."""
+    res_dir = results_dir or RESULTS_DIR
+    store = results_store.store_path(res_dir)
+    known = {run['run_id']: run for run in list_runs(res_dir)}
+    deleted = []
+    for run_id in run_ids:
+        if run_id not in known:
+            print(f"No such run: {run_id}")
+            continue
+        try:
+            _remove_run(res_dir, known[run_id], store)
+            deleted.append(run_id)
+        except Exception as e:
+            print(f"Failed to delete {run_id}: {e}")
+    return deleted
+
+
+def export_run(run_id: str, results_dir: str = None, csv_path: str = None) -> dict:
+    """Writes a run out as CSV (export_<run>.csv in the results dir by default). Raises ValueError for an unknown run."""
+    res_dir = results_dir or RESULTS_DIR
+    if run_id not in {run['run_id'] for run in list_runs(res_dir)}:
+        raise ValueError(f"no tuning run {run_id!r} in {res_dir}")
+    # Not named tuning_*.csv, so it isn't imported back as a run of its own
+    p = csv_path or os.path.join(res_dir, f"export_{run_id}.csv")
+    n = results_store.export_csv(run_id, p, path=results_store.store_path(res_dir))
+    return {"run_id": run_id, "csv_path": p, "rows": n}
+
+
+def _print_conflicts(store: str, limit: int = 20):
+    conflicts = results_store.conflicts(path=store)
+    if not conflicts:
+        print("No email has been labelled differently by two runs.")
+        return
+    print(f"\n--- {len(conflicts)} email(s) labelled differently across runs (newest first) ---")
+    for seq_id in list(conflicts)[:limit]:
+        print(f"id={seq_id}")
+        for run_id, status, reason in conflicts[seq_id]:
+            print(f"   {run_id}  {status}  {(reason or '')[:70]}")
+    if len(conflicts) > limit:
+        print(f"… and {len(conflicts) - limit} more")
 
 
 def _human_size(num: int) -> str:
@@ -53,85 +106,93 @@ def _parse_indices(s: str, max_n: int) -> List[int]:
 
 
 def manage_tuning_runs(results_dir: str = None):
-    """Interactive manager for previous tuning runs: list, delete, open in nano."""
+    """Interactive manager for previous tuning runs: list, delete, open in nano, conflicts, import/export."""
     res_dir = results_dir or RESULTS_DIR
+    store = results_store.store_path(res_dir)
 
-    def list_and_print() -> List[str]:
-        csvs = _list_tuning_csvs(res_dir)
-        if not csvs:
-            print(f"No tuning CSVs found in: {res_dir}")
+    def list_and_print() -> List[dict]:
+        runs = list_runs(res_dir)
+        if not runs:
+            print(f"No tuning runs found in: {res_dir}")
             return []
         print("\n--- Tuning Runs ---")
-        for i, p in enumerate(csvs, start=1):
-            try:
-                st = os.stat(p)
-                size = _human_size(st.st_size)
-                mtime = st.st_mtime
-                from time import strftime, localtime
-                when = strftime('%Y-%m-%d %H:%M:%S', localtime(mtime))
-            except Exception:
-                size = '?'
-                when = '?'
-            print(f"{i:2d}. {os.path.basename(p)}  [{size}, {when}]")
-        return csvs
+        for i, run in enumerate(runs, start=1):
+            p = _csv_path(res_dir, run)
+            size = _human_size(os.path.getsize(p)) if os.path.exists(p) else 'no CSV'
+            extra = f", {run['propagated']} propagated" if run['propagated'] else ''
+            print(f"{i:2d}. {run['run_id']}  [{run['emails']} emails: delete {run['deletes']}, keep {run['keeps']}, "
+                  f"errors {run['errors']}{extra} | {size}, {run['source']} {run['created']}]"
+                  + (f" on {run['storage']}" if run['storage'] else ''))
+        return runs
 
     while True:
-        csvs = list_and_print()
-        if not csvs:
+        runs = list_and_print()
+        if not runs:
             return
 
-        print("\nOptions: [O]pen  [D]elete  [DA] Delete All  [R]efresh  [E]xit")
+        print("\nOptions: [O]pen  [D]elete  [DA] Delete All  [C]onflicts  [X] Export CSV  [I]mport CSV  "
+              "[R]efresh  [E]xit")
         choice = input("Select: ").strip().upper()
 
         if choice == 'E':
             return
         elif choice == 'R':
             continue
+        elif choice == 'C':
+            _print_conflicts(store)
+        elif choice == 'I':
+            p = input("Path of the tuning CSV to import: ").strip()
+            if not os.path.isfile(p):
+                print("File not found.")
+                continue
+            storage = input("Raw emails directory, .mbox or pack it classified (blank if unknown): ").strip()
+            run_id = results_store.import_csv(p, force=True, path=store, storage=storage or None)
+            print(f"Imported {p} as run {run_id}.")
+        elif choice == 'X':
+            sel = input("Enter number to export: ").strip()
+            if not sel.isdigit() or not (1 <= int(sel) <= len(runs)):
+                print("Invalid selection.")
+                continue
+            res = export_run(runs[int(sel) - 1]['run_id'], res_dir)
+            print(f"Exported {res['rows']} row(s) to {res['csv_path']}")
         elif choice == 'DA':
-            confirm = input("Delete ALL tuning CSVs? Type 'DELETE' to confirm: ").strip()
+            confirm = input("Delete ALL tuning runs? Type 'DELETE' to confirm: ").strip()
             if confirm == 'DELETE':
-                deleted = 0
-                for p in csvs:
-                    try:
-                        os.remove(p)
-                        deleted += 1
-                    except Exception as e:
-                        print(f"Failed to delete {os.path.basename(p)}: {e}")
-                print(f"Deleted {deleted} file(s).")
+                deleted = delete_runs([run['run_id'] for run in runs], res_dir)
+                print(f"Deleted {len(deleted)} run(s).")
             else:
                 print("Cancelled.")
         elif choice == 'D':
             sel = input("Enter number(s) or ranges (e.g. 1,3-5): ").strip()
-            idxs = _parse_indices(sel, len(csvs))
+            idxs = _parse_indices(sel, len(runs))
             if not idxs:
                 print("No valid selection.")
                 continue
             print("You selected:")
             for i in idxs:
-                print(f" - {os.path.basename(csvs[i-1])}")
+                print(f" - {runs[i-1]['run_id']}")
             confirm = input("Type 'DELETE' to confirm: ").strip()
             if confirm != 'DELETE':
                 print("Cancelled.")
                 continue
-            deleted = 0
-            for i in idxs:
-                p = csvs[i-1]
-                try:
-                    os.remove(p)
-                    deleted += 1
-                except Exception as e:
-                    print(f"Failed to delete {os.path.basename(p)}: {e}")
-            print(f"Deleted {deleted} file(s).")
+            deleted = delete_runs([runs[i-1]['run_id'] for i in idxs], res_dir)
+            print(f"Deleted {len(deleted)} run(s).")
         elif choice == 'O':
             sel = input("Enter number to open: ").strip()
             if not sel.isdigit():
                 print("Invalid selection.")
                 continue
             i = int(sel)
-            if not (1 <= i <= len(csvs)):
+            if not (1 <= i <= len(runs)):
                 print("Out of range.")
                 continue
-            p = csvs[i-1]
+            run = runs[i-1]
+            p = _csv_path(res_dir, run)
+            if not os.path.exists(p):
+                # Recreate the human-readable copy; edits to it are imported on the next refresh
+                p = os.path.join(res_dir, f"{run['run_id']}.csv")
+                results_store.export_csv(run['run_id'], p, path=store)
+                results_store.import_csv(p, force=True, source=run['source'], path=store)
             editor = os.environ.get('EDITOR', 'nano')
             os.system(f"{editor} '{p}'")
         else:
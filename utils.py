@@ -28,7 +28,8 @@ def get_target_filename(directory, default_name):
         full_path = os.path.join(directory, filename)
         
         if os.path.exists(full_path):
-            overwrite = input(f"!!! File '{filename}' already exists. Overwrite? (y/n): ").lower()
+            # The downloader appends only missing emails to an existing archive
+            overwrite = input(f"!!! File '{filename}' already exists. Resume into it? (y/n): ").lower()
             if overwrite == 'y':
                 return full_path
             else: